@@ -0,0 +1,90 @@
+"""
+Benchmark: throughput of carbon credit mints on a local chain.
+
+- "before": the previous write_data, two RPC calls for nonce and gas price, then a blocking wait for the receipt.
+- "write_data": the current write_data, nonce and gas price local, still one receipt wait per transaction.
+- "submit + gather": every transaction sent first, then the receipts collected together.
+
+No figures are recorded for this benchmark: run it on the node you care about. What
+submit + gather can save depends on how that node mines. With instant mining (the Ganache
+default) every transaction is mined while it is sent, so only the receipt round trips are
+saved. With a block time, write_data waits for a block per transaction while gather waits for
+the blocks of the whole batch.
+
+Needs a running node with unlocked accounts (Ganache), the CarbonCreditToken contract is
+deployed first if on_chain has no address file for it.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_chain [--provider http://127.0.0.1:8545] [--transactions 200]
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.common import print_table
+from controllers.action_controller import ActionController
+
+CONTRACT = "CarbonCreditToken"
+CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../on_chain")
+
+
+def mint_before(act, editor, recipients, n):
+    contract = act.contracts[CONTRACT]
+    for i in range(n):
+        tx_hash = contract.functions.mint(recipients[i % len(recipients)], 1).transact({
+            'from': editor,
+            'gas': 2000000,
+            'gasPrice': act.w3.eth.gas_price,
+            'nonce': act.w3.eth.get_transaction_count(editor)
+        })
+        act.w3.eth.wait_for_transaction_receipt(tx_hash)
+    return 0
+
+
+def mint_write_data(act, editor, recipients, n):
+    for i in range(n):
+        act.write_data('mint', CONTRACT, editor, recipients[i % len(recipients)], 1)
+    return 0
+
+
+def mint_pipelined(act, editor, recipients, n):
+    pending = [act.submit('mint', CONTRACT, editor, recipients[i % len(recipients)], 1) for i in range(n)]
+    return sum(isinstance(result, Exception) for result in act.gather(pending, timeout=max(120, n)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", default="http://127.0.0.1:8545")
+    parser.add_argument("--transactions", type=int, default=200)
+    args = parser.parse_args()
+
+    act = ActionController(args.provider)
+    act.load_contracts(CONTRACTS_DIR)
+    if CONTRACT not in act.contracts:
+        act.deploy_and_initialize([f"{CONTRACT}.sol"])
+        act.load_contracts(CONTRACTS_DIR)
+
+    accounts = act.w3.eth.accounts
+    editor, recipients = accounts[1], accounts[2:] or accounts[:1]
+    owner = act.contracts[CONTRACT].functions.getOwner().call()
+    act.write_data('authorizeEditor', CONTRACT, owner, editor)
+
+    rows = []
+    baseline = None
+    for name, run in (("before", mint_before), ("write_data", mint_write_data), ("submit + gather", mint_pipelined)):
+        # the previous mode sent transactions behind the allocator's back
+        act.nonces.resync(editor)
+        start = time.perf_counter()
+        failed = run(act, editor, recipients, args.transactions)
+        seconds = time.perf_counter() - start
+        rate = args.transactions / seconds
+        baseline = baseline or rate
+        rows.append([name, args.transactions, f"{seconds:.2f}", f"{rate:.1f}", f"{rate / baseline:.1f}x", failed])
+
+    print(f"\n{args.transactions} mints from one account on {args.provider}\n")
+    print_table(["mode", "transactions", "seconds", "tx/s", "speedup", "failed"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: cold start of the persistence layer on a database holding 1M Transactions rows.
+
+A CLI startup builds three DatabaseOperations instances (CommandLineInterface, its Controller
+and the Controller inside Utils).
+"before" replays what the old constructor did each time: DROP/CREATE of Activities,
+Accounts_Activities, Cron_Activities, Products and Transactions plus the test records.
+"after" is the migration engine: one schema version check for the whole process.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_cold_start [--rows 1000000]
+"""
+
+import argparse
+import shutil
+import sqlite3
+import time
+
+from benchmarks.common import temp_database, print_table
+from db import connection_manager, db_migrations
+from db.db_operations import DatabaseOperations
+
+INSTANCES_PER_STARTUP = 3
+
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    db_migrations.migrate(conn)
+    conn.executemany("""INSERT INTO Transactions (username_from, username_to, amount, type, tx_hash)
+                        VALUES (?, ?, ?, 'MINT', ?)""",
+                     ((f"certifier_{i % 10}", f"user_{i % 5000}", i % 100, f"0x{i:064x}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def legacy_startup(path):
+    for _ in range(INSTANCES_PER_STARTUP):
+        conn = sqlite3.connect(path)
+        for table in ("Activities", "Accounts_Activities", "Cron_Activities", "Licences", "Products", "Transactions"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        db_migrations._initial_schema(conn)
+        conn.commit()
+        db_migrations.load_test_fixtures(conn)
+        conn.close()
+
+
+def migrated_startup(path):
+    connection_manager.init_manager(path)
+    instances = [DatabaseOperations() for _ in range(INSTANCES_PER_STARTUP)]
+    for ops in instances:
+        ops.close()
+    connection_manager.close_manager()
+
+
+def time_on_copy(source, target, fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        shutil.copyfile(source, target)
+        start = time.perf_counter()
+        fn(target)
+        runs.append(time.perf_counter() - start)
+    return sorted(runs)[len(runs) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with temp_database("source.sqlite") as source:
+        build_database(source, args.rows)
+        target = source.replace("source.sqlite", "run.sqlite")
+
+        legacy = time_on_copy(source, target, legacy_startup, args.repeat)
+        migrated = time_on_copy(source, target, migrated_startup, args.repeat)
+
+        conn = sqlite3.connect(target)
+        kept = conn.execute("SELECT COUNT(*) FROM Transactions").fetchone()[0]
+        conn.close()
+
+    print(f"Cold start with {args.rows} Transactions rows, {INSTANCES_PER_STARTUP} DatabaseOperations "
+          f"per startup (median of {args.repeat} runs)\n")
+    print_table(["variant", "startup (ms)", "Transactions rows after startup"], [
+        ["before: DROP/CREATE on every instance", f"{legacy * 1000:.1f}", 0],
+        ["after: versioned migrations", f"{migrated * 1000:.1f}", kept],
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: open connections and latency when listing 10k Accounts rows.
+
+"before" reproduces the old Model base class, which opened one sqlite3 connection per instance,
+"after" is DatabaseOperations.get_users() with connections borrowed from the connection manager.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_connections [--rows 10000]
+"""
+
+import argparse
+import resource
+import sqlite3
+
+from benchmarks.common import temp_database, timed, open_file_handles, print_table
+from db import connection_manager
+from db.db_operations import DatabaseOperations
+
+
+class LegacyModel:
+    """Copy of the old models.model_base.Model: one connection per instance."""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.cur = self.conn.cursor()
+
+    def __del__(self):
+        self.conn.close()
+
+
+class LegacyAccounts(LegacyModel):
+    def __init__(self, db_path, *fields):
+        super().__init__(db_path)
+        (self.id, self.username, self.type, self.name, self.lastname, self.birthday,
+         self.birth_place, self.residence, self.phone, self.mail) = fields
+
+
+def seed_accounts(conn, rows):
+    conn.executemany("""
+        INSERT INTO Accounts (username, type, name, lastname, birthday, birth_place, residence, phone, mail)
+        VALUES (?, 'FARMER', 'Name', 'Lastname', '1990-01-01', 'Place', 'Residence', ?, ?)""",
+        ((f"user_{i}", f"{3000000000 + i}", f"user_{i}@example.com") for i in range(rows)))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # the legacy path needs one file descriptor per row
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with temp_database() as db_path:
+        manager = connection_manager.init_manager(db_path)
+        ops = DatabaseOperations()
+        seed_accounts(ops.conn, args.rows)
+
+        def legacy_listing():
+            rows = sqlite3.connect(db_path).execute("SELECT * FROM Accounts").fetchall()
+            return [LegacyAccounts(db_path, *row) for row in rows]
+
+        legacy_users = legacy_listing()
+        legacy_handles = open_file_handles(db_path)
+        del legacy_users
+        legacy_time, _ = timed(legacy_listing, args.repeat)
+
+        users = ops.get_users()
+        pooled_handles = open_file_handles(db_path)
+        pooled_open = manager.open_connections()
+        del users
+        pooled_time, _ = timed(ops.get_users, args.repeat)
+
+        print(f"Listing {args.rows} Accounts rows (median of {args.repeat} runs)\n")
+        print_table(["variant", "open handles", "pool connections", "latency (ms)"], [
+            ["before: connection per model", legacy_handles, "-", f"{legacy_time * 1000:.1f}"],
+            ["after: shared connection manager", pooled_handles, pooled_open, f"{pooled_time * 1000:.1f}"],
+        ])
+
+        ops.close()
+        connection_manager.close_manager()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: streaming export of the Transactions table (db/export.py).
+
+Every format is exported in a fresh child process, which reports its elapsed time and its
+peak resident memory (ru_maxrss), so one run does not inflate the peak of the next. With the
+streaming writers the peak stays flat when --rows grows, only the output size does not.
+The npy and npz formats are skipped when NumPy is not installed.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_export [--rows 10000000] [--chunk-size 10000] [--formats csv jsonl npy npz]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sqlite3
+import time
+
+from benchmarks.common import temp_database, print_table
+from db import db_migrations, export
+
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    db_migrations.migrate(conn)
+    conn.executemany("""INSERT INTO Transactions (username_from, username_to, amount, type, tx_hash)
+                        VALUES (?, ?, ?, 'MINT', ?)""",
+                     ((f"certifier_{i % 10}", f"user_{i % 5000}", i % 100, f"0x{i:064x}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def run_export(queue, path, fmt, out, chunk_size):
+    start = time.perf_counter()
+    count = export.export("transactions", fmt, out, path, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    queue.put((count, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+
+
+def output_size(out):
+    if os.path.isdir(out):
+        return sum(os.path.getsize(os.path.join(out, name)) for name in os.listdir(out))
+    return os.path.getsize(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--formats", nargs="+", default=list(export.FORMATS), choices=export.FORMATS)
+    args = parser.parse_args()
+
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        skipped = [fmt for fmt in args.formats if fmt in ("npy", "npz")]
+        if skipped:
+            print(f"NumPy is not installed, skipping {', '.join(skipped)}.\n")
+        args.formats = [fmt for fmt in args.formats if fmt not in skipped]
+
+    results = []
+    with temp_database() as path:
+        start = time.perf_counter()
+        build_database(path, args.rows)
+        print(f"{args.rows:,} transactions inserted in {time.perf_counter() - start:.1f} s\n")
+
+        queue = multiprocessing.Queue()
+        for fmt in args.formats:
+            out = os.path.join(os.path.dirname(path), f"export.{fmt}")
+            child = multiprocessing.Process(target=run_export, args=(queue, path, fmt, out, args.chunk_size))
+            child.start()
+            count, elapsed, peak = queue.get()
+            child.join()
+            size = output_size(out)
+            results.append([fmt, f"{count:,}", f"{elapsed:.1f}", f"{count / elapsed:,.0f}",
+                            f"{size / 2**20:,.0f}", f"{size / 2**20 / elapsed:.0f}", f"{peak / 2**20:.0f}"])
+
+    print(f"Export of the Transactions table, chunks of {args.chunk_size:,} rows\n")
+    print_table(["format", "rows", "time (s)", "rows/s", "output (MB)", "MB/s", "peak RSS (MB)"], results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: hot DatabaseOperations lookups with and without the managed index set,
+on a database with 100k accounts, 1M transactions and 1M cron activities.
+
+The database is built at schema version 1 (no indexes), every lookup is timed, then the
+database is migrated to the latest version and the same lookups are timed again.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_indexes [--accounts 100000] [--transactions 1000000]
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+
+from benchmarks.common import temp_database, print_table
+from db import connection_manager, db_migrations
+from db.db_operations import DatabaseOperations
+
+
+def build_database(path, accounts, transactions):
+    conn = sqlite3.connect(path)
+    db_migrations.migrate(conn, target=1)
+    conn.executemany("""INSERT INTO Credentials (username, password, public_key, private_key) VALUES (?, 'x$00', ?, ?)""",
+                     ((f"user_{i}", f"0xpub{i:040d}", f"0xpriv{i:060d}") for i in range(accounts)))
+    conn.executemany("""INSERT INTO Accounts (username, type, name, lastname, birthday, phone, mail)
+                        VALUES (?, 'FARMER', 'Name', 'Lastname', '1990-01-01', ?, ?)""",
+                     ((f"user_{i}", f"{3000000000 + i}", f"user_{i}@example.com") for i in range(accounts)))
+    conn.executemany("""INSERT INTO Cron_Activities (description, username, state, activity_id, co2_reduction)
+                        VALUES ('activity', ?, ?, ?, 10.0)""",
+                     ((f"user_{i % accounts}", i % 3, i) for i in range(transactions)))
+    conn.executemany("""INSERT INTO Transactions (username_from, username_to, amount, type, tx_hash)
+                        VALUES (?, ?, 10, 'MINT', ?)""",
+                     ((f"user_{i % accounts}", f"user_{(i * 7) % accounts}", f"0x{i:064x}") for i in range(transactions)))
+    conn.commit()
+    conn.close()
+
+
+def lookups(accounts, transactions):
+    rng = random.Random(42)
+    users = [rng.randrange(accounts) for _ in range(20)]
+    activities = [rng.randrange(transactions) for _ in range(20)]
+    return {
+        "get_public_key_by_username": [(f"user_{u}",) for u in users],
+        "get_username_by_public_key": [(f"0xpub{u:040d}",) for u in users],
+        "key_exists": [(f"0xpub{u:040d}", f"0xpriv{u:060d}") for u in users],
+        "check_unique_email": [(f"user_{u}@example.com",) for u in users],
+        "check_unique_phone_number": [(f"{3000000000 + u}",) for u in users],
+        "get_activities_to_be_processed_by_username": [(f"user_{u}",) for u in users],
+        "get_co2Amount_by_activity": [(a,) for a in activities],
+        "get_state_by_activity": [(a,) for a in activities],
+        "get_user_transactions": [(f"user_{u}",) for u in users],
+    }
+
+
+def time_lookups(ops, calls):
+    results = {}
+    for name, arguments in calls.items():
+        method = getattr(ops, name)
+        start = time.perf_counter()
+        for args in arguments:
+            method(*args)
+        results[name] = (time.perf_counter() - start) / len(arguments)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    calls = lookups(args.accounts, args.transactions)
+    with temp_database() as path:
+        build_database(path, args.accounts, args.transactions)
+
+        manager = connection_manager.init_manager(path)
+        manager.schema_ready = True  # keep the database at version 1
+        ops = DatabaseOperations()
+        before = time_lookups(ops, calls)
+
+        start = time.perf_counter()
+        db_migrations.migrate(ops.conn)
+        migration_time = time.perf_counter() - start
+        after = time_lookups(ops, calls)
+
+        ops.close()
+        connection_manager.close_manager()
+
+    print(f"{args.accounts} accounts, {args.transactions} transactions and cron activities "
+          f"(mean per call, 20 calls each)\n")
+    print_table(["method", "no index (ms)", "indexed (ms)", "speed-up"], [
+        [name, f"{before[name] * 1000:.2f}", f"{after[name] * 1000:.3f}", f"{before[name] / after[name]:.0f}x"]
+        for name in calls
+    ])
+    print(f"\nBuilding the index set took {migration_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
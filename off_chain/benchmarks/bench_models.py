@@ -0,0 +1,125 @@
+"""
+Benchmark: materializing Transactions rows as model objects.
+
+Three representations of the same rows are compared:
+- "connection per object": the original Model, whose constructor opened a sqlite3 connection
+  that lived as long as the object. Holding 1M of them would need 1M open file descriptors,
+  so it is measured on --legacy-rows rows only.
+- "__dict__ object": the same class without the connection, an instance dict per row.
+- "__slots__ + row factory": the current models, built by the cursor through Model.from_row.
+
+Time covers query + build and is measured without tracing, memory is the tracemalloc peak
+of a second run while the rows are held in a list.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_models [--rows 1000000] [--legacy-rows 10000]
+"""
+
+import argparse
+import gc
+import sqlite3
+import time
+import tracemalloc
+
+from benchmarks.common import temp_database, print_table
+from db import db_migrations
+from models.transaction import Transaction
+
+
+class LegacyTransaction:
+    """Transaction as it was before the slotted models, optionally with its own connection."""
+
+    db_path = None
+
+    def __init__(self, id, username_from, username_to, amount, type, tx_hash, timestamp):
+        if self.db_path is not None:
+            self.conn = sqlite3.connect(self.db_path)
+            self.cur = self.conn.cursor()
+        self.id = id
+        self.username_from = username_from
+        self.username_to = username_to
+        self.amount = amount
+        self.type = type
+        self.tx_hash = tx_hash
+        self.timestamp = timestamp
+
+    def __del__(self):
+        if self.db_path is not None:
+            self.conn.close()
+
+
+class ConnectedTransaction(LegacyTransaction):
+    pass
+
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    db_migrations.migrate(conn)
+    conn.executemany("""INSERT INTO Transactions (username_from, username_to, amount, type, tx_hash)
+                        VALUES (?, ?, ?, 'MINT', ?)""",
+                     ((f"certifier_{i % 10}", f"user_{i % 5000}", i % 100, f"0x{i:064x}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def load_legacy(conn, model, rows):
+    cur = conn.execute("SELECT * FROM Transactions LIMIT ?", (rows,))
+    return [model(id, username_from, username_to, amount, type, tx_hash, timestamp)
+            for id, username_from, username_to, amount, type, tx_hash, timestamp in cur.fetchall()]
+
+
+def load_slotted(conn, rows):
+    cur = conn.cursor()
+    cur.row_factory = Transaction.from_row
+    return cur.execute("SELECT * FROM Transactions LIMIT ?", (rows,)).fetchall()
+
+
+def measure(load):
+    """
+    Returns:
+        tuple: (seconds, peak bytes allocated while building and holding the objects, object count)
+    """
+    gc.collect()
+    start = time.perf_counter()
+    objects = load()
+    elapsed = time.perf_counter() - start
+    count = len(objects)
+    del objects
+    gc.collect()
+
+    tracemalloc.start()
+    objects = load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    gc.collect()
+    return elapsed, peak, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        build_database(path, args.rows)
+        ConnectedTransaction.db_path = path
+        conn = sqlite3.connect(path)
+
+        results = [
+            ("connection per object", measure(lambda: load_legacy(conn, ConnectedTransaction, args.legacy_rows))),
+            ("__dict__ object", measure(lambda: load_legacy(conn, LegacyTransaction, args.rows))),
+            ("__slots__ + row factory", measure(lambda: load_slotted(conn, args.rows))),
+        ]
+        conn.close()
+
+    print("Materializing Transactions rows as model objects\n")
+    print_table(["representation", "rows", "time (s)", "rows/s", "peak memory (MB)", "bytes/row"], [
+        [name, count, f"{elapsed:.2f}", f"{count / elapsed:,.0f}", f"{peak / 2**20:.1f}", f"{peak / count:.0f}"]
+        for name, (elapsed, peak, count) in results
+    ])
+
+
+if __name__ == "__main__":
+    main()
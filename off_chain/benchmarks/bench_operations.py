@@ -0,0 +1,356 @@
+"""
+Benchmark: every public DatabaseOperations method, on generated databases of several sizes.
+
+For each size a database is generated with db.workload (kept in --cache-dir between runs if
+given) and copied, then every method of CALLS runs in a fresh child process for --seconds:
+one untimed call, then at least --min-calls and at most --max-calls timed ones. Reads pick
+their usernames, activities and NFTs from samples weighted like the data (the owners of
+random transactions), writes use fresh values on every call; the *_many methods write
+BATCH rows per call.
+
+Reported per method:
+    ops/s           calls / time spent in the calls
+    p50, p95, p99   latency of one call (ms)
+    peak RSS        ru_maxrss of the child process (MB), a fresh interpreter
+
+--save writes the results as JSON. --baseline compares them with a saved file: a method is
+a regression when its p95 grows, or its ops/s drops, by more than --tolerance (and by more
+than NOISE_MS for the p95), and the exit status is then 1.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_operations [--sizes 10000 100000] [--seconds 1] [--methods get_helpers ...]
+        [--save results.json] [--baseline baseline.json] [--tolerance 0.25] [--cache-dir DIR]
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+import types
+
+from benchmarks.common import temp_database, print_table
+from db import connection_manager, password_kdf, query_plan, sqlite_profile, workload
+from db.db_operations import DatabaseOperations
+
+BATCH = 100
+SAMPLE = 64
+NOISE_MS = 0.05
+BENCH_USER = "bench_user"
+BENCH_PASSWORD = "Bench-Password-1!"
+SEARCH_WORDS = ("wetland", "solar", "compost", "tractor", "greenhouse", "milk")
+PRODUCT_WORDS = ("apples", "beef", "mozzarella", "organic", "cherries")
+
+
+def _user(ctx, i):
+    return ctx["users"][i % len(ctx["users"])]
+
+
+def _activity(ctx, i):
+    return ctx["activity_ids"][i % len(ctx["activity_ids"])]
+
+
+def _nft(ctx, i):
+    return ctx["nft_ids"][i % len(ctx["nft_ids"])]
+
+
+# Arguments of the i-th call of every benchmarked method, from the context built by prepare().
+CALLS = {
+    "archive_history": lambda ctx, i: (36500,),
+    "change_password": lambda ctx, i: (BENCH_USER, BENCH_PASSWORD),
+    "check_credentials": lambda ctx, i: (BENCH_USER, BENCH_PASSWORD),
+    "check_unique_email": lambda ctx, i: (f"{_user(ctx, i)}@mail.com",),
+    "check_unique_phone_number": lambda ctx, i: (f"39{i:08d}",),
+    "check_username": lambda ctx, i: (_user(ctx, i),),
+    "decrypt_private_k": lambda ctx, i: (ctx["encrypted_private_key"], BENCH_PASSWORD),
+    "delete_creds": lambda ctx, i: (ctx["spare_credentials"][i],),
+    "encrypt_private_k": lambda ctx, i: (ctx["private_key"], BENCH_PASSWORD),
+    "get_activities_by_username": lambda ctx, i: (_user(ctx, i),),
+    "get_activities_processed_by_username": lambda ctx, i: (_user(ctx, i),),
+    "get_activities_to_be_processed": lambda ctx, i: (),
+    "get_activities_to_be_processed_by_username": lambda ctx, i: (_user(ctx, i),),
+    "get_co2Amount_by_activity": lambda ctx, i: (_activity(ctx, i),),
+    "get_credentials_id_by_username": lambda ctx, i: (_user(ctx, i),),
+    "get_creds_by_username": lambda ctx, i: (_user(ctx, i),),
+    "get_helpers": lambda ctx, i: (),
+    "get_identity": lambda ctx, i: (_user(ctx, i),),
+    "get_public_key_by_username": lambda ctx, i: (_user(ctx, i),),
+    "get_state_by_activity": lambda ctx, i: (_activity(ctx, i),),
+    "get_user_by_username": lambda ctx, i: (_user(ctx, i),),
+    "get_user_stats": lambda ctx, i: (_user(ctx, i),),
+    "get_user_transactions": lambda ctx, i: (_user(ctx, i),),
+    "get_username_by_public_key": lambda ctx, i: (ctx["public_keys"][i % len(ctx["public_keys"])],),
+    "get_users": lambda ctx, i: (),
+    "hash_function": lambda ctx, i: (BENCH_PASSWORD,),
+    "identity_cache_stats": lambda ctx, i: (),
+    "insert_actor": lambda ctx, i: ("FARMER", f"bench_actor_{i}", "Name", "Lastname", "Residence", "Place",
+                                    "1990-01-01", f"bench_actor_{i}@mail.com", f"38{i:08d}"),
+    "insert_actors_many": lambda ctx, i: ([("SELLER", f"bench_actors_{i}_{j}", "Name", "Lastname", "Residence", "Place",
+                                            "1990-01-01", f"bench_actors_{i}_{j}@mail.com", f"37{i:05d}{j:03d}")
+                                           for j in range(BATCH)],),
+    "insert_product": lambda ctx, i: ("Bench apples", "FRUIT", 3, ctx["next_nft"] + i),
+    "insert_products_many": lambda ctx, i: ([("Bench cheese", "DAIRY", 12, ctx["next_nft"] + 10 ** 7 + i * BATCH + j)
+                                             for j in range(BATCH)],),
+    "insert_transaction": lambda ctx, i: (ctx["certifier"], _user(ctx, i), 10, "MINT", f"0xbench{i:059x}"),
+    "insert_transactions_many": lambda ctx, i: ([(ctx["certifier"], _user(ctx, j), 10, "MINT", f"0xbench{i:029x}{j:030x}")
+                                                 for j in range(BATCH)],),
+    "iter_activities_by_username": lambda ctx, i: (_user(ctx, i), None, 100),
+    "iter_activities_to_be_processed": lambda ctx, i: (None, 100),
+    "iter_user_transactions": lambda ctx, i: (_user(ctx, i), None, 100),
+    "iter_users": lambda ctx, i: (None, 100),
+    "key_exists": lambda ctx, i: (ctx["public_key"], ctx["private_key"]),
+    "query_activities": lambda ctx, i: (_user(ctx, i), (0,), None, None, None, "creation_datetime", "id", True, 20),
+    "register_account_activities": lambda ctx, i: (BENCH_USER, 10 ** 9 + i),
+    "register_account_activities_many": lambda ctx, i: ([(BENCH_USER, 2 * 10 ** 9 + i * BATCH + j) for j in range(BATCH)],),
+    "register_activities": lambda ctx, i: ("performing an action", f"Benchmark activity {i}"),
+    "register_activities_many": lambda ctx, i: ([("performing an action", f"Benchmark activity {i}.{j}")
+                                                 for j in range(BATCH)],),
+    "register_creds": lambda ctx, i: (f"bench_creds_{i}", BENCH_PASSWORD, f"0xbench_public_{i}", "0xbench_private"),
+    "register_creds_many": lambda ctx, i: ([(f"bench_many_{i}_{j}", BENCH_PASSWORD, f"0xbench_many_{i}_{j}", "0xbench_private")
+                                            for j in range(BATCH)], None, workload.KDF_PARAMS),
+    "register_cron_activities_many": lambda ctx, i: ([(f"Benchmark activity {i}.{j}", _user(ctx, j), 0, _activity(ctx, j), 12.5)
+                                                      for j in range(BATCH)],),
+    "register_cron_activity": lambda ctx, i: (f"Benchmark activity {i}", _user(ctx, i), 0, _activity(ctx, i), 12.5),
+    "search_activities": lambda ctx, i: (SEARCH_WORDS[i % len(SEARCH_WORDS)], None, 20),
+    "search_products": lambda ctx, i: (PRODUCT_WORDS[i % len(PRODUCT_WORDS)], None, 20),
+    "update_account": lambda ctx, i: (BENCH_USER, "Bench", "User", "1990-01-01", "Place", "Residence", "3999999999",
+                                      "bench@mail.com", ctx["account_id"]),
+    "update_activity_state": lambda ctx, i: (_activity(ctx, i), 1),
+    "update_product": lambda ctx, i: (_nft(ctx, i), 10 + i % 5),
+    "upsert_product": lambda ctx, i: ("Bench pears", "FRUIT", 4, _nft(ctx, i)),
+    "upsert_products_many": lambda ctx, i: ([("Bench pears", "FRUIT", 4, _nft(ctx, j)) for j in range(BATCH)],),
+}
+
+# Public methods that are not operations: connection handling, unit of work, one-shot fixtures.
+SKIPPED = {"close", "transaction", "insert_test_records"}
+
+
+def unregistered_methods():
+    """
+    Returns:
+        list of str: Public DatabaseOperations methods neither in CALLS nor in SKIPPED.
+    """
+    return sorted(query_plan.public_methods(DatabaseOperations) - set(CALLS) - SKIPPED)
+
+
+def generate(path, rows, seed):
+    """Generates the database of one size with the bulk-load profile."""
+    connection_manager.init_manager(path, profile=sqlite_profile.resolve_profile({"profile": "bulk-load"}))
+    ops = DatabaseOperations()
+    try:
+        workload.generate(ops, rows, seed)
+    finally:
+        ops.close()
+        connection_manager.close_manager()
+
+
+def _sample(ops, rng, table, column, k=SAMPLE):
+    top = ops.conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+    ids = [rng.randint(1, top) for _ in range(k)] if top else []
+    return [row[0] for row in ops.conn.execute(
+        f"SELECT {column} FROM {table} WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id", ids)]
+
+
+def prepare(path, seed):
+    """
+    Builds the context of the calls: samples of the generated data and a benchmark account
+    with a known password.
+
+    Returns:
+        dict: The context passed to the CALLS functions.
+    """
+    connection_manager.init_manager(path)
+    ops = DatabaseOperations()
+    rng = random.Random(seed)
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            ops.register_creds(BENCH_USER, BENCH_PASSWORD, "0xbench_public", "0xbench_private")
+            ops.insert_actor("FARMER", BENCH_USER, "Bench", "User", "Residence", "Place", "1990-01-01",
+                             "bench@mail.com", "3999999999")
+        users = _sample(ops, rng, "Transactions", "username_to")
+        ctx = {
+            "users": users,
+            "public_keys": [ops.get_public_key_by_username(user) for user in users],
+            "activity_ids": _sample(ops, rng, "Cron_Activities", "activity_id"),
+            "nft_ids": _sample(ops, rng, "Products", "nftID"),
+            "next_nft": (ops.conn.execute("SELECT MAX(nftID) FROM Products").fetchone()[0] or 0) + 1,
+            "certifier": ops.conn.execute("SELECT username FROM Accounts WHERE type = 'CERTIFIER' LIMIT 1").fetchone()[0],
+            "account_id": ops.get_user_by_username(BENCH_USER).get_id(),
+            "public_key": "0xbench_public",
+            "private_key": "0xbench_private",
+            "encrypted_private_key": ops.encrypt_private_k("0xbench_private", BENCH_PASSWORD),
+        }
+    finally:
+        ops.close()
+        connection_manager.close_manager()
+    return ctx
+
+
+def _spare_credentials(ops, count):
+    """Credentials for delete_creds to remove, hashed at the lowest cost."""
+    ops.register_creds_many(((f"bench_spare_{i}", BENCH_PASSWORD, f"0xbench_spare_{i}", "0xbench_private")
+                             for i in range(count)), kdf_params=password_kdf.LEGACY_PARAMS)
+    return {"spare_credentials": [row[0] for row in ops.conn.execute(
+        "SELECT id FROM Credentials WHERE username LIKE 'bench_spare_%' ORDER BY id")]}
+
+
+# Extra context built in the child before the timed calls: (ops, max calls) -> dict.
+SETUP = {"delete_creds": _spare_credentials}
+
+
+def run_method(queue, path, name, ctx, seconds, min_calls, max_calls):
+    """Child process: times the calls of one method and reports (latencies, peak RSS in bytes), or the error."""
+    try:
+        connection_manager.init_manager(path)
+        ops = DatabaseOperations()
+        method = getattr(ops, name)
+        latencies = []
+
+        def call(i):
+            args = CALLS[name](ctx, i)
+            start = time.perf_counter()
+            result = method(*args)
+            if isinstance(result, types.GeneratorType):
+                for _ in result:
+                    pass
+            return time.perf_counter() - start
+
+        # several write methods print their outcome
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            if name in SETUP:
+                ctx = {**ctx, **SETUP[name](ops, max_calls + 1)}
+                max_calls = min(max_calls, len(ctx["spare_credentials"]) - 1)
+            # not timed: the first call starts the KDF pool and fills the caches
+            call(0)
+            deadline = time.perf_counter() + seconds
+            while len(latencies) < min_calls or (len(latencies) < max_calls and time.perf_counter() < deadline):
+                latencies.append(call(len(latencies) + 1))
+        ops.close()
+        connection_manager.close_manager()
+        password_kdf.shutdown_pool()
+        queue.put((latencies, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+    except Exception as e:
+        queue.put(f"{type(e).__name__}: {e}")
+
+
+def summarize(latencies, peak):
+    """
+    Returns:
+        dict: calls, ops_per_sec, p50_ms, p95_ms, p99_ms and peak_rss_mb of one method.
+    """
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {"calls": len(latencies), "ops_per_sec": round(len(latencies) / sum(latencies), 2),
+            "p50_ms": round(p50 * 1000, 4), "p95_ms": round(p95 * 1000, 4), "p99_ms": round(p99 * 1000, 4),
+            "peak_rss_mb": round(peak / 2 ** 20, 1)}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with a baseline, both as saved by --save.
+
+    Returns:
+        list of list: [size, method, baseline p95, p95, baseline ops/s, ops/s] for every regression.
+    """
+    regressions = []
+    for size, methods in results["results"].items():
+        for name, new in methods.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if old is None:
+                continue
+            slower = new["p95_ms"] > old["p95_ms"] * (1 + tolerance) and new["p95_ms"] - old["p95_ms"] > NOISE_MS
+            fewer = new["ops_per_sec"] < old["ops_per_sec"] / (1 + tolerance)
+            if slower or fewer:
+                regressions.append([size, name, old["p95_ms"], new["p95_ms"], old["ops_per_sec"], new["ops_per_sec"]])
+    return regressions
+
+
+def database_for(rows, seed, cache_dir, path):
+    """Copies the generated database of the given size to path, generating it if it is not cached."""
+    if cache_dir is None:
+        generate(path, rows, seed)
+        return
+    cached = os.path.join(cache_dir, f"workload-{rows}-seed{seed}.sqlite")
+    if not os.path.exists(cached):
+        os.makedirs(cache_dir, exist_ok=True)
+        generate(cached + ".tmp", rows, seed)
+        os.replace(cached + ".tmp", cached)
+    shutil.copyfile(cached, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="Transactions per database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--seconds", type=float, default=1.0, help="time budget of every method")
+    parser.add_argument("--min-calls", type=int, default=3)
+    parser.add_argument("--max-calls", type=int, default=2000)
+    parser.add_argument("--methods", nargs="+", choices=sorted(CALLS), help="only these methods")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this JSON file, exit with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--cache-dir", help="keep the generated databases here between runs")
+    args = parser.parse_args()
+
+    missing = unregistered_methods()
+    if missing:
+        sys.exit(f"Methods without benchmark arguments in CALLS: {', '.join(missing)}")
+
+    results = {"created": datetime.datetime.now().isoformat(timespec="seconds"), "seed": args.seed,
+               "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "machine": platform.machine(),
+               "seconds": args.seconds, "results": {}}
+    # spawned, not forked: the children do not inherit the memory of the generation
+    spawn = multiprocessing.get_context("spawn")
+    queue = spawn.Queue()
+    for rows in args.sizes:
+        with temp_database() as path:
+            start = time.perf_counter()
+            database_for(rows, args.seed, args.cache_dir, path)
+            ctx = prepare(path, args.seed)
+            print(f"{rows:,} transactions ready in {time.perf_counter() - start:.1f} s\n")
+
+            table = []
+            measured = results["results"][str(rows)] = {}
+            for name in args.methods or sorted(CALLS):
+                child = spawn.Process(target=run_method, args=(queue, path, name, ctx, args.seconds,
+                                                                          args.min_calls, args.max_calls))
+                child.start()
+                outcome = queue.get()
+                child.join()
+                if isinstance(outcome, str):
+                    table.append([name, "failed", outcome, "", "", "", ""])
+                    continue
+                measured[name] = summary = summarize(*outcome)
+                table.append([name, summary["calls"], f"{summary['ops_per_sec']:,.1f}", f"{summary['p50_ms']:.3f}",
+                              f"{summary['p95_ms']:.3f}", f"{summary['p99_ms']:.3f}", f"{summary['peak_rss_mb']:.0f}"])
+            print_table(["method", "calls", "ops/s", "p50 (ms)", "p95 (ms)", "p99 (ms)", "peak RSS (MB)"], table)
+            print()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline} (tolerance {args.tolerance:.0%}):\n")
+            print_table(["size", "method", "baseline p95 (ms)", "p95 (ms)", "baseline ops/s", "ops/s"], regressions)
+            sys.exit(1)
+        print(f"No regression against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: insert throughput of DatabaseOperations under each SQLite profile preset.
+
+Two workloads per preset, on a fresh database each time:
+  - single: insert_transaction() in a loop, one commit (and possibly one fsync) per row;
+  - batch: the same rows in a single transaction.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_profiles [--rows 5000]
+"""
+
+import argparse
+import time
+
+from benchmarks.common import temp_database, print_table
+from db import connection_manager, sqlite_profile
+from db.db_operations import DatabaseOperations
+
+
+def rows(count):
+    return [(f"certifier_{i % 10}", f"user_{i % 500}", i % 100, "MINT", f"0x{i:064x}") for i in range(count)]
+
+
+def single_inserts(ops, data):
+    for row in data:
+        ops.insert_transaction(*row)
+
+
+def batch_insert(ops, data):
+    ops.conn.executemany("""INSERT INTO Transactions (username_from, username_to, amount, type, tx_hash)
+                            VALUES (?, ?, ?, ?, ?)""", data)
+    ops.conn.commit()
+
+
+def run(preset, workload, data):
+    with temp_database() as path:
+        connection_manager.init_manager(path, profile=sqlite_profile.resolve_profile({"profile": preset}))
+        ops = DatabaseOperations()
+        start = time.perf_counter()
+        workload(ops, data)
+        elapsed = time.perf_counter() - start
+        ops.close()
+        connection_manager.close_manager()
+    return len(data) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    data = rows(args.rows)
+    table = []
+    for preset in sqlite_profile.PRESETS:
+        table.append([preset,
+                      f"{run(preset, single_inserts, data):,.0f}",
+                      f"{run(preset, batch_insert, data):,.0f}"])
+
+    print(f"Insert throughput, {args.rows} Transactions rows (rows/s)\n")
+    print_table(["preset", "single commit per row", "one transaction"], table)
+
+
+if __name__ == "__main__":
+    main()
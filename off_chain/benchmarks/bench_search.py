@@ -0,0 +1,68 @@
+"""
+Benchmark: looking up activity records by words of their description.
+
+Compares a LIKE '%word%' filter, which reads every row of Cron_Activities, with the FTS5
+index of DatabaseOperations.search_activities, on the same synthetic descriptions.
+
+Usage (from off_chain/):
+    python -m benchmarks.bench_search [--rows 1000000] [--repeat 5]
+"""
+
+import argparse
+import random
+import sqlite3
+
+from benchmarks.common import temp_database, timed, print_table
+from db import connection_manager, db_migrations
+from db.db_operations import DatabaseOperations
+
+WORDS = ("solar", "panel", "wind", "turbine", "compost", "irrigation", "drip", "biogas", "cover", "crop",
+         "hedgerow", "electric", "tractor", "rainwater", "storage", "insulation", "heat", "pump", "organic",
+         "fertilizer", "rotation", "grazing", "pasture", "reforestation", "wetland", "restoration")
+
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    db_migrations.migrate(conn)
+    rng = random.Random(42)
+    # the FTS5 index is filled by the insert trigger, as for the application's own writes;
+    # a rare word every 10,000 rows, so that lookups also return a realistic handful of records
+    conn.executemany("""INSERT INTO Cron_Activities (description, username, state, activity_id, co2_reduction)
+                        VALUES (?, ?, 0, 1, 1.0)""",
+                     ((" ".join(rng.choices(WORDS, k=6)) + (" geothermal" if i % 10_000 == 0 else ""),
+                       f"user_{i % 5000}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with temp_database() as path:
+        build_database(path, args.rows)
+        connection_manager.init_manager(path)
+        ops = DatabaseOperations()
+        conn = sqlite3.connect(path)
+
+        results = []
+        for word in ("geothermal", "wetland"):
+            like, _ = timed(lambda: conn.execute("""SELECT * FROM Cron_Activities WHERE description LIKE ?
+                                                    LIMIT 20""", (f"%{word}%",)).fetchall(), args.repeat)
+            like_all, _ = timed(lambda: conn.execute("SELECT COUNT(*) FROM Cron_Activities WHERE description LIKE ?",
+                                                     (f"%{word}%",)).fetchall(), args.repeat)
+            fts, _ = timed(lambda: ops.search_activities(word, limit=20), args.repeat)
+            results.append([word, f"{like * 1000:.1f}", f"{like_all * 1000:.1f}", f"{fts * 1000:.1f}"])
+
+        conn.close()
+        ops.close()
+        connection_manager.close_manager()
+
+    print(f"Activity lookups by word, {args.rows:,} records, median of {args.repeat} runs\n")
+    print_table(["word", "LIKE, first 20 (ms)", "LIKE, all matches (ms)", "search_activities, top 20 (ms)"], results)
+
+
+if __name__ == "__main__":
+    main()
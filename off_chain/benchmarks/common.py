@@ -0,0 +1,84 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks are run from the off_chain directory, e.g. `python -m benchmarks.bench_connections`,
+and always work on a temporary database so that the real SupplyChain file is never touched.
+"""
+
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def temp_database(name="bench.sqlite"):
+    """
+    Yields the path of a database file inside a temporary directory removed on exit.
+
+    Args:
+        name (str): File name of the database inside the temporary directory.
+    """
+    directory = tempfile.mkdtemp(prefix="supplychain_bench_")
+    try:
+        yield os.path.join(directory, name)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def timed(fn, repeat=5):
+    """
+    Runs fn several times and returns the timings.
+
+    Args:
+        fn (callable): Function without arguments to time.
+        repeat (int): Number of runs.
+
+    Returns:
+        tuple: (median seconds, list of the seconds of every run)
+    """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs), runs
+
+
+def open_file_handles(path):
+    """
+    Counts the file descriptors of this process pointing to the given file.
+    Only available where /proc exists, returns None elsewhere.
+
+    Args:
+        path (str): Path of the file.
+    """
+    fd_dir = "/proc/self/fd"
+    if not os.path.isdir(fd_dir):
+        return None
+    target = os.path.realpath(path)
+    count = 0
+    for fd in os.listdir(fd_dir):
+        try:
+            if os.path.realpath(os.path.join(fd_dir, fd)) == target:
+                count += 1
+        except OSError:
+            continue
+    return count
+
+
+def print_table(headers, rows):
+    """
+    Prints a simple fixed-width table.
+
+    Args:
+        headers (list): Column titles.
+        rows (list): List of rows, each one a list of values.
+    """
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(v).ljust(w) for v, w in zip(row, widths)))
@@ -1,5 +1,6 @@
 ﻿import maskpass
 import re
+import sqlite3
 from eth_utils import *
 from eth_keys import *
 from controllers.controller import Controller
@@ -8,6 +9,8 @@ from session.session import Session
 from db.db_operations import DatabaseOperations
 from cli.utils import Utils
 from colorama import Fore, Style, init
+from config import config
+from session.logging import log_error
 
 
 class CommandLineInterface:
@@ -24,9 +27,8 @@ class CommandLineInterface:
         self.act_controller = ActionController()
         self.session = session
 
-        # test login -> everytime reset
-        self.ops = DatabaseOperations()
-        # test login -> everytime reset
+        # test records are loaded only when enabled in configuration.yml
+        self.ops = DatabaseOperations(load_test_records=config.config.get("load_test_records", False))
 
         self.util = Utils(session, self.act_controller)
 
@@ -336,6 +338,29 @@ class CommandLineInterface:
                 print(Fore.RED + 'Internal error!' + Style.RESET_ALL)
           
 
+    def record_burn(self, activity_id, certifier, username, amount, receipt):
+        """
+        Records a burn already executed on chain: the activity state and the BURN transaction
+        are written together, or neither of them if one fails.
+
+        Args:
+            activity_id (int): The activity whose credits were removed.
+            certifier (str): The username of the certifier.
+            username (str): The username of the user.
+            amount (str): The amount of carbon credits removed.
+            receipt: The receipt of the burn transaction.
+        """
+        tx_hash = receipt.transactionHash.hex()
+        try:
+            with self.controller.transaction():
+                self.controller.update_activity_state(activity_id)
+                self.controller.insert_transaction(certifier, username, amount, 'BURN', tx_hash)
+        except sqlite3.Error as e:
+            log_error(f"Burn {tx_hash} of activity {activity_id} not recorded: {e}")
+            print(Fore.RED + "Carbon credits removed on chain, but recording the operation failed." + Style.RESET_ALL)
+            return
+        print(Fore.GREEN + "Carbon credits removed" + Style.RESET_ALL)
+
     def certifier_menu(self, username):
         """
         This method presents certifier with a menu of options tailored to their role. 
@@ -361,7 +386,8 @@ class CommandLineInterface:
             10: "View my transactions",
             11: "Update profile",
             12: "Change password",
-            13: "Log out"
+            13: "Log out",
+            14: "Diagnostics"
         }
 
         while True:
@@ -377,7 +403,7 @@ class CommandLineInterface:
 
                     elif choice == 2:
                         username_input = input("Enter the username of the user whose activities you want to view: ")
-                        activities = self.controller.get_activities_by_username(username_input)
+                        activities = self.controller.iter_activities_by_username(username_input)
                         self.util.view_userActivities(username_input, activities)
 
                     elif choice == 3:
@@ -393,11 +419,11 @@ class CommandLineInterface:
 
                     elif choice == 6:
                         username_input = input("Enter the username of the user you want to assign carbon credits : ")
-                        activities = self.controller.get_activities_to_be_processed_by_username(username_input)
+                        activities = self.controller.query_activities(username=username_input, states=(0,), key_by_id=True)
                         if not activities:
                             print(Fore.RED + "No activities found for this user." + Style.RESET_ALL)
                             continue
-                        self.util.view_userActivities(username_input, activities)
+                        self.util.view_userActivities(username_input, activities.values())
                         activity_id = input("Enter the activity ID you want to assign carbon credits to: ")
                         if not self.util.is_valid_activity_id(int(activity_id), activities):
                             print(Fore.RED + "Activity not found for this user." + Style.RESET_ALL)
@@ -422,11 +448,11 @@ class CommandLineInterface:
 
                     elif choice == 7:
                         username_input = input("Enter the username of the user you want to remove carbon credits : ")
-                        activities = self.controller.get_activities_processed_by_username(username_input)
+                        activities = self.controller.query_activities(username=username_input, states=(1,), key_by_id=True)
                         if not activities:
                             print(Fore.RED + "No activities found for this user." + Style.RESET_ALL)
                             continue
-                        self.util.view_userActivities(username_input, activities)
+                        self.util.view_userActivities(username_input, activities.values())
                         activity_id = input("Enter the activity ID you want to remove carbon credits to: ")
                         if not self.util.is_valid_activity_id(int(activity_id), activities):
                             print(Fore.RED + "Activity not found for this user." + Style.RESET_ALL)
@@ -458,14 +484,10 @@ class CommandLineInterface:
                                     self.controller.insert_transaction(helper_username, username_input, amount_to_burn, 'TRANSFER', transaction_receipt_transfer.transactionHash.hex())
                                 # dopo aver compensato
                                 transaction_receipt_burn = self.act_controller.remove_carbon_credits(address_to, int(amount_to_burn), from_address=from_address_actor)
-                                self.controller.update_activity_state(activity_id)
-                                self.controller.insert_transaction(username, username_input, amount_to_burn, 'BURN', transaction_receipt_burn.transactionHash.hex())
-                                print(Fore.GREEN + "Carbon credits removed" + Style.RESET_ALL)
+                                self.record_burn(activity_id, username, username_input, amount_to_burn, transaction_receipt_burn)
                             else:
                                 transaction_receipt_burn = self.act_controller.remove_carbon_credits(address_to, int(amount_to_burn), from_address=from_address_actor)
-                                self.controller.update_activity_state(activity_id)
-                                self.controller.insert_transaction(username, username_input, amount_to_burn, 'BURN', transaction_receipt_burn.transactionHash.hex())
-                                print(Fore.GREEN + "Carbon credits removed" + Style.RESET_ALL)
+                                self.record_burn(activity_id, username, username_input, amount_to_burn, transaction_receipt_burn)
                         else:
                             print(Fore.RED + "Operation cancelled!" + Style.RESET_ALL)
                     elif choice == 8:
@@ -476,7 +498,7 @@ class CommandLineInterface:
                         self.util.view_userView(username, "\nCERTIFIER INFO\n")
 
                     elif choice == 10:
-                        transactions = self.controller.get_user_transactions(username)
+                        transactions = self.controller.iter_user_transactions(username)
                         self.util.view_user_transactions(username, transactions)
 
                     elif choice == 11:
@@ -494,6 +516,9 @@ class CommandLineInterface:
                         else:
                             print(Fore.RED + "Invalid choice! Please try again." + Style.RESET_ALL)
 
+                    elif choice == 14:
+                        self.util.view_diagnostics()
+
             except ValueError:
                 print(Fore.RED + "Invalid Input! Please enter a valid number." + Style.RESET_ALL)
 
@@ -542,10 +567,10 @@ class CommandLineInterface:
                 elif choice == 7:
                     self.util.add_user_activity(username, role)
                 elif choice == 8:
-                    activities = self.controller.get_activities_by_username(username)
+                    activities = self.controller.iter_activities_by_username(username)
                     self.util.view_userActivities(username, activities)
                 elif choice == 9:
-                    transactions = self.controller.get_user_transactions(username)
+                    transactions = self.controller.iter_user_transactions(username)
                     self.util.view_user_transactions(username, transactions)
                 elif choice == 10:
                     self.util.view_user_balance(username)
@@ -189,17 +189,28 @@ class Utils:
         print("Residence: ", userView.get_residence())
         print("E-mail: ", userView.get_mail())
         print("Phone: ",userView.get_phone())
+        stats = self.controller.get_user_stats(username)
+        print(Fore.CYAN + "\nCARBON CREDITS" + Style.RESET_ALL)
+        print("Minted: ", stats.get_minted())
+        print("Burned: ", stats.get_burned())
+        print("Transferred in: ", stats.get_transferred_in())
+        print("Transferred out: ", stats.get_transferred_out())
+        print("Activities to be processed: ", stats.get_pending_activities())
+        print("Activities processed: ", stats.get_processed_activities())
+        print("CO2 reduction to be processed: ", stats.get_pending_co2())
         input("\nPress Enter to exit\n")
 
     def view_usersView(self):
         """
         This method retrieves and displays the profile information of all users.
         """
-        users = self.controller.get_users()
         print(Fore.CYAN + "USERS:" + Style.RESET_ALL)
         print("\n")
-        if users:
-            for user in users:
+        found = False
+        # rows are fetched page by page while printing, all pages from the same snapshot
+        with self.controller.report() as reports:
+            for user in reports.iter_users():
+                found = True
                 print("Username: ", user.get_username())
                 print("Name: ", user.get_name())
                 print("Lastname: ", user.get_lastname())
@@ -209,30 +220,33 @@ class Utils:
                 print("E-mail: ", user.get_mail())
                 print("Phone: ",user.get_phone())
                 print("\n")
-        else:
+        if not found:
             print("No users found.\n")
 
     def view_activitiesToBeProcessed(self):
         """
         This method retrieves and displays the activities that are pending processing.
         """
-        activities = self.controller.get_activities_to_be_processed()
         print(Fore.CYAN + "Activities to be processed:" + Style.RESET_ALL)
         print("\n")
-        if activities:
-            for act in activities:
-                print("Activity ID: ", act.get_id())
-                print("Actor username: ", act.get_username())
-                print("Activity description: ", act.get_description())
-                print("Activity update date: ", act.get_update_datetime())
-                print("Activity creation date: ", act.get_creation_datetime())
-                print("Activity CO2 reduction: ", act.get_co2_reduction())
-                print("Activity state: ", act.get_state())
-                print("\n")
-        else:
+        found = False
+        for act in self.controller.iter_activities_to_be_processed():
+            found = True
+            print("Activity ID: ", act.get_id())
+            print("Actor username: ", act.get_username())
+            print("Activity description: ", act.get_description())
+            print("Activity update date: ", act.get_update_datetime())
+            print("Activity creation date: ", act.get_creation_datetime())
+            print("Activity CO2 reduction: ", act.get_co2_reduction())
+            print("Activity state: ", act.get_state())
+            print("\n")
+        if not found:
             print("No activities to be processed.\n")
 
     def is_valid_activity_id(self, activity_id, activities):
+        # activities keyed by id (query_activities(key_by_id=True)) are checked in O(1)
+        if isinstance(activities, dict):
+            return activity_id in activities
         return any(act.get_id() == activity_id for act in activities)
 
     def view_userActivities(self, username, activities):
@@ -241,20 +255,21 @@ class Utils:
 
         Args:
             username (str): The username of the user whose activities are to be viewed.
-            activities (list): A list of activities associated with the user.
+            activities (iterable): The activities associated with the user, a list or a lazy iterator.
         """
         print(Fore.CYAN + username + " activities:" + Style.RESET_ALL)
         print("\n")
-        if activities:
-            for act in activities:
-                print("Activity ID: ", act.get_id())
-                print("Activity description: ", act.get_description())
-                print("Activity update date: ", act.get_update_datetime())
-                print("Activity creation date: ", act.get_creation_datetime())
-                print("Activity CO2 reduction: ", act.get_co2_reduction())
-                print("Activity state: ", act.get_state())
-                print("\n")
-        else:
+        found = False
+        for act in activities:
+            found = True
+            print("Activity ID: ", act.get_id())
+            print("Activity description: ", act.get_description())
+            print("Activity update date: ", act.get_update_datetime())
+            print("Activity creation date: ", act.get_creation_datetime())
+            print("Activity CO2 reduction: ", act.get_co2_reduction())
+            print("Activity state: ", act.get_state())
+            print("\n")
+        if not found:
             print("No activities found.\n")
 
     def create_nft(self, username):
@@ -510,23 +525,83 @@ class Utils:
 
         Args:
             username (str): The username of the user whose transactions are to be viewed.
-            tranasactions (list): A list of tranasactions associated with the user.
+            tranasactions (iterable): The tranasactions associated with the user, a list or a lazy iterator.
         """
         print(Fore.CYAN + username + " tranasactions:" + Style.RESET_ALL)
         print("\n")
-        if tranasactions:
-            for tran in tranasactions:
-                print("Transaction ID: ", tran.get_id())
-                print("Transaction sender: ", tran.get_username_from())
-                print("Transaction recipient: ", tran.get_username_to())
-                print("Transaction amount: ", tran.get_amount())
-                print("Transaction type: ", tran.get_type())
-                print("Transaction hash: ", tran.get_tx_hash())
-                print("Transaction creation date: ", tran.get_timestamp())
-                print("\n")
-        else:
+        found = False
+        for tran in tranasactions:
+            found = True
+            print("Transaction ID: ", tran.get_id())
+            print("Transaction sender: ", tran.get_username_from())
+            print("Transaction recipient: ", tran.get_username_to())
+            print("Transaction amount: ", tran.get_amount())
+            print("Transaction type: ", tran.get_type())
+            print("Transaction hash: ", tran.get_tx_hash())
+            print("Transaction creation date: ", tran.get_timestamp())
+            print("\n")
+        if not found:
             print("No transactions found.\n")
 
+    def view_diagnostics(self):
+        """
+        Shows the SQL statement statistics and the recent slow queries collected by the SQL tracing.
+        """
+        options = {
+            1: "Top statements by total time",
+            2: "Top statements by mean time",
+            3: "Search statements",
+            4: "Recent slow queries",
+            5: "Reset statistics",
+            6: "Back"
+        }
+        while True:
+            if self.controller.sql_statistics(limit=0) is None:
+                print(Fore.RED + "SQL tracing is disabled. Set tracing: enabled: true in the configuration "
+                      "and restart the application." + Style.RESET_ALL)
+                return
+            print(Fore.CYAN + "\nDIAGNOSTICS" + Style.RESET_ALL)
+            for key, value in options.items():
+                print(f"{key} -- {value}")
+            choice = input("Choose an option: ").strip()
+            if choice == "1":
+                self.print_sql_statistics(self.controller.sql_statistics("total_ms", limit=10))
+            elif choice == "2":
+                self.print_sql_statistics(self.controller.sql_statistics("mean_ms", limit=10))
+            elif choice == "3":
+                text = input("Enter the text the statements must contain: ").strip()
+                self.print_sql_statistics(self.controller.sql_statistics("total_ms", contains=text))
+            elif choice == "4":
+                slow = self.controller.slow_queries(limit=10)
+                for query in slow:
+                    print(f"{query.time} -- {query.elapsed_ms:.1f} ms, {query.rows} rows")
+                    print("  " + query.sql)
+                    for line in query.plan:
+                        print("    " + line)
+                if not slow:
+                    print("No slow queries.\n")
+            elif choice == "5":
+                self.controller.reset_sql_statistics()
+                print(Fore.GREEN + "Statistics cleared." + Style.RESET_ALL)
+            elif choice == "6":
+                return
+            else:
+                print(Fore.RED + "Invalid choice! Please try again." + Style.RESET_ALL)
+
+    def print_sql_statistics(self, statistics):
+        """
+        Prints statement statistics as returned by Controller.sql_statistics.
+
+        Args:
+            statistics (list of StatementStats): The statements to print.
+        """
+        for stats in statistics:
+            print(f"{stats.total_ms:10.1f} ms total {stats.mean_ms:8.2f} ms mean {stats.max_ms:8.1f} ms max "
+                  f"{stats.calls:7} calls {stats.rows:8} rows")
+            print("  " + stats.sql)
+        if not statistics:
+            print("No statements recorded.\n")
+
     def add_user_activity(self, username: str, role: str):
         """
         Allows a logged-in user to add a new activity to the system and link it to the user's account.
@@ -557,11 +632,13 @@ class Utils:
 
             description = input("Enter a brief description of the activity: ").strip()
 
-            activity_id = self.controller.register_activities(activity_type, description)
-            self.controller.register_account_activities(username, activity_id)
-
             co2_reduction = round(random.uniform(10.0, 100.0), 2)  # simulate environmental impact
-            self.controller.register_cron_activity(description, username, 0, activity_id, co2_reduction)
+
+            # the three records are committed together
+            with self.controller.transaction():
+                activity_id = self.controller.register_activities(activity_type, description)
+                self.controller.register_account_activities(username, activity_id)
+                self.controller.register_cron_activity(description, username, 0, activity_id, co2_reduction)
 
             print(Fore.CYAN + "Activity successfully added and logged!" + Style.RESET_ALL)
 
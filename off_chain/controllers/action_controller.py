@@ -3,7 +3,10 @@ import os
 import time
 import json
 from colorama import Fore, Style, init
+from config import config
 from controllers.deploy_controller import DeployController
+from controllers.nonce_manager import NonceManager
+from controllers.pending_transaction import PendingTransaction, gather
 from session.logging import log_msg, log_error
 from web3 import Web3
 
@@ -28,6 +31,8 @@ class ActionController:
         self.w3 = Web3(Web3.HTTPProvider(self.http_provider))
         assert self.w3.is_connected(), Fore.RED + "Failed to connect to Ethereum node." + Style.RESET_ALL
         self.contracts = {}  # Dictionary to store uploaded contracts
+        # nonces and gas price handed out locally instead of two RPC calls per transaction
+        self.nonces = NonceManager(self.w3, (config.config.get("chain") or {}).get("gas_price_ttl", 30))
 
     def load_contracts(self, contracts_directory="on_chain/"):
         """
@@ -157,8 +162,8 @@ class ActionController:
             from_address (str): The Ethereum address to send the transaction from.
             *args: Arguments required by the function.
             gas (int): The gas limit for the transaction.
-            gas_price (int): The gas price for the transaction.
-            nonce (int): The nonce for the transaction.
+            gas_price (int): The gas price for the transaction, the cached gas price of the node if None.
+            nonce (int): The nonce for the transaction, allocated by the nonce manager if None.
 
         Returns:
             The transaction receipt object.
@@ -168,13 +173,12 @@ class ActionController:
         tx_parameters = {
             'from': from_address,
             'gas': gas,
-            'gasPrice': gas_price or self.w3.eth.gas_price,
-            'nonce': nonce or self.w3.eth.get_transaction_count(from_address)
+            'gasPrice': gas_price or self.nonces.gas_price()
         }
 
         try:
             function = getattr(self.contracts[contract_name].functions, function_name)(*args)
-            tx_hash = function.transact(tx_parameters)
+            tx_hash = self.transact(function, tx_parameters, nonce)
             receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
 
             log_msg(f"Transaction {function_name} executed. From: {from_address}, Tx Hash: {tx_hash.hex()}, Gas: {gas}, Gas Price: {tx_parameters['gasPrice']}")
@@ -184,6 +188,84 @@ class ActionController:
             log_error(f"Error executing {function_name} from {from_address}. Error: {str(e)}")
             raise e
 
+    def submit(self, function_name, contract_name, from_address, *args, gas=2000000, gas_price=None, nonce=None):
+        """
+        Sends a transaction to a contract's function without waiting for it to be mined.
+        Many transactions, also from the same address, can be submitted before collecting
+        their receipts with gather().
+
+        Args:
+            function_name (str): The function name to call on the contract.
+            contract_name (str): The name of the contract to use.
+            from_address (str): The Ethereum address to send the transaction from.
+            *args: Arguments required by the function.
+            gas (int): The gas limit for the transaction.
+            gas_price (int): The gas price for the transaction, the cached gas price of the node if None.
+            nonce (int): The nonce for the transaction, allocated by the nonce manager if None.
+
+        Returns:
+            PendingTransaction: The handle of the transaction. If it could not be sent, its error
+            is set instead of raised, so that the other submissions of a batch go on.
+        """
+        if not from_address:
+            raise ValueError("Invalid 'from_address' provided. It must be a non-empty string representing an Ethereum address.")
+        tx_parameters = {
+            'from': from_address,
+            'gas': gas,
+            'gasPrice': gas_price or self.nonces.gas_price()
+        }
+        try:
+            function = getattr(self.contracts[contract_name].functions, function_name)(*args)
+            tx_hash = self.transact(function, tx_parameters, nonce)
+        except Exception as e:
+            log_error(f"Error submitting {function_name} from {from_address}. Error: {str(e)}")
+            return PendingTransaction(self.w3, function_name, contract_name, from_address, args, error=e)
+        log_msg(f"Transaction {function_name} submitted. From: {from_address}, Tx Hash: {tx_hash.hex()}, Gas: {gas}, Gas Price: {tx_parameters['gasPrice']}")
+        return PendingTransaction(self.w3, function_name, contract_name, from_address, args, tx_hash)
+
+    def gather(self, pending, timeout=120):
+        """
+        Waits for transactions sent with submit().
+
+        Args:
+            pending (list of PendingTransaction): The transactions.
+            timeout (float): Seconds to wait for all the receipts.
+
+        Returns:
+            list: For each transaction, in order, its receipt or the TransactionError explaining why it failed.
+        """
+        results = gather(pending, timeout)
+        for result in results:
+            # the transactions that could not be sent were logged by submit()
+            if isinstance(result, Exception) and result.pending.tx_hash is not None:
+                log_error(str(result))
+        return results
+
+    def transact(self, function, tx_parameters, nonce=None):
+        """
+        Sends a contract function call as a transaction, with a nonce of the nonce manager.
+        If the node rejects the nonce, the account is read again from the node and the
+        transaction is sent once more.
+
+        Args:
+            function: The contract function call, e.g. contract.functions.mint(...).
+            tx_parameters (dict): Transaction parameters, 'from' is required. 'nonce' is set by this method.
+            nonce (int, optional): Nonce to use instead of the managed one, the transaction is not retried.
+
+        Returns:
+            HexBytes: The transaction hash.
+        """
+        from_address = tx_parameters['from']
+        if nonce is not None:
+            return function.transact({**tx_parameters, 'nonce': nonce})
+        for attempt in range(2):
+            tx_parameters['nonce'] = self.nonces.allocate(from_address)
+            try:
+                return function.transact(tx_parameters)
+            except Exception as e:
+                if not self.nonces.release(from_address, tx_parameters['nonce'], e) or attempt:
+                    raise
+
     def listen_to_event(self, contract_name):
         """
         Listens to a specific event from the smart contract indefinitely.
@@ -227,7 +309,8 @@ class ActionController:
             raise ValueError(Fore.RED + "A valid Ethereum address must be provided as 'from_address'." + Style.RESET_ALL)
 
         owner_address = self.contracts[contract_name].functions.getOwner().call()
-        tx_hash = self.contracts[contract_name].functions.authorizeEditor(from_address).transact({'from': owner_address})
+        tx_hash = self.transact(self.contracts[contract_name].functions.authorizeEditor(from_address),
+                                {'from': owner_address, 'gasPrice': self.nonces.gas_price()})
         self.w3.eth.wait_for_transaction_receipt(tx_hash)
 
 
@@ -294,7 +377,8 @@ class ActionController:
             raise ValueError(Fore.RED + "A valid recipient address ('to_address') must be provided." + Style.RESET_ALL)
         """
         owner_address = self.contracts[contract_name].functions.getOwner().call()
-        tx_hash = self.contracts[contract_name].functions.authorizeEditor(from_address).transact({'from': owner_address})
+        tx_hash = self.transact(self.contracts[contract_name].functions.authorizeEditor(from_address),
+                                {'from': owner_address, 'gasPrice': self.nonces.gas_price()})
         self.w3.eth.wait_for_transaction_receipt(tx_hash)
 
         return self.write_data("mint", contract_name, from_address, *args)
@@ -395,7 +479,8 @@ class ActionController:
             The transaction receipt object.
         """
         owner_address = self.contracts[contract_name].functions.getOwner().call()
-        tx_hash = self.contracts[contract_name].functions.authorizeEditor(from_address).transact({'from': owner_address})
+        tx_hash = self.transact(self.contracts[contract_name].functions.authorizeEditor(from_address),
+                                {'from': owner_address, 'gasPrice': self.nonces.gas_price()})
         self.w3.eth.wait_for_transaction_receipt(tx_hash)
         return self.write_data('mint', contract_name, from_address, *args)
 
@@ -425,7 +510,8 @@ class ActionController:
             The transaction receipt object.
         """
         owner_address = self.contracts[contract_name].functions.getOwner().call()
-        tx_hash = self.contracts[contract_name].functions.authorizeEditor(from_address).transact({'from': owner_address})
+        tx_hash = self.transact(self.contracts[contract_name].functions.authorizeEditor(from_address),
+                                {'from': owner_address, 'gasPrice': self.nonces.gas_price()})
         self.w3.eth.wait_for_transaction_receipt(tx_hash)
         return self.write_data("transferCredits", contract_name, from_address, *args)
 
@@ -440,7 +526,8 @@ class ActionController:
             The transaction receipt object.
         """
         owner_address = self.contracts[contract_name].functions.getOwner().call()
-        tx_hash = self.contracts[contract_name].functions.authorizeEditor(from_address).transact({'from': owner_address})
+        tx_hash = self.transact(self.contracts[contract_name].functions.authorizeEditor(from_address),
+                                {'from': owner_address, 'gasPrice': self.nonces.gas_price()})
         self.w3.eth.wait_for_transaction_receipt(tx_hash)
 
         return self.write_data('burn', contract_name, from_address, *args)
\ No newline at end of file
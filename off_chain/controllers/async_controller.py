@@ -0,0 +1,185 @@
+"""
+Asyncio facade over the Controller database methods.
+
+Every call runs on a dedicated thread pool instead of the event loop: reads go to a pool of
+reader threads, writes to a single writer thread. Each thread owns its own Controller, and so
+its own pooled connection, which means many reads can be in flight at the same time (WAL
+readers do not block each other nor the writer) while writes are applied one at a time.
+The connections of the reader threads are query_only: a write method listed as a read fails
+instead of writing outside the writer thread.
+
+    controller = AsyncController(session)
+    user, transactions = await asyncio.gather(controller.get_user_by_username("farmer"),
+                                              controller.get_user_transactions("farmer"))
+    await controller.insert_transaction("certifier", "farmer", 10, "MINT", tx_hash)
+    await controller.aclose()
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import config
+from controllers.controller import Controller
+from db.connection_manager import get_manager
+from session.session import Session
+
+# Controller methods that only read the database, served by the reader threads.
+READ_METHODS = (
+    "get_users", "get_user_by_username", "check_unique_email", "check_unique_phone_number",
+    "get_credentials_id_by_username", "get_public_key_by_username", "get_helpers",
+    "get_username_by_public_key", "get_identity", "identity_cache_stats", "check_username",
+    "check_keys", "query_activities", "get_activities_to_be_processed",
+    "get_activities_by_username", "get_activities_to_be_processed_by_username",
+    "get_activities_processed_by_username", "get_co2Amount_by_activity", "get_user_transactions",
+    "get_user_stats", "search_activities", "search_products",
+)
+
+# Controller methods that write to the database, serialized on the writer thread.
+WRITE_METHODS = (
+    # check_credentials stores the password hash again when its KDF parameters are outdated
+    "check_credentials", "insert_actor_info", "insert_actors_info_many", "update_actor_info",
+    "register_account_activities", "register_account_activities_many", "register_activities",
+    "register_activities_many", "registration", "registration_many", "update_password", "delete_creds",
+    "register_cron_activity", "register_cron_activities_many", "update_activity_state",
+    "create_product", "upsert_product", "insert_products_many", "upsert_products_many", "update_product",
+    "insert_transaction", "insert_transactions_many", "archive_history",
+)
+
+# Keyset iterators of the Controller, exposed as async iterators reading one page per call.
+ITER_METHODS = ("iter_users", "iter_activities_to_be_processed", "iter_activities_by_username",
+                "iter_user_transactions")
+
+
+class AsyncController:
+    """
+    Async version of the Controller database methods, same names and arguments, awaitable results.
+
+    Attributes:
+        readers (int): Number of reader threads, and so of connections used for reads.
+    """
+
+    def __init__(self, session=None, readers=None):
+        """
+        Starts the reader and writer thread pools. The threads open their Controller on first use.
+
+        Args:
+            session (Session, optional): Session shared by the per-thread Controllers, a new one if None.
+            readers (int, optional): Number of reader threads, async_readers from the configuration if None.
+
+        Raises:
+            ValueError: If the connection pool cannot give a connection to every reader and the writer.
+        """
+        self.readers = readers or config.config.get("async_readers", 4)
+        max_connections = get_manager().max_connections
+        if self.readers + 1 > max_connections:
+            raise ValueError(f"{self.readers} readers and 1 writer need {self.readers + 1} connections, "
+                             f"the pool allows {max_connections} (db_max_connections).")
+        self._session = session if session is not None else Session()
+        self._local = threading.local()
+        self._reader = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+    def _controller(self, read_only=False):
+        """
+        Returns the Controller of the calling worker thread, creating it on first use.
+        read_only is set by the reader threads: their connection is made query_only.
+        """
+        controller = getattr(self._local, "controller", None)
+        if controller is None:
+            controller = self._local.controller = Controller(self._session)
+            if read_only:
+                controller.db_ops.conn.set_query_only(True)
+        return controller
+
+    def _write(self, name, *args, **kwargs):
+        return getattr(self._controller(), name)(*args, **kwargs)
+
+    def _read(self, name, *args, **kwargs):
+        return getattr(self._controller(read_only=True), name)(*args, **kwargs)
+
+    async def _submit(self, executor, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    async def run_in_transaction(self, work):
+        """
+        Runs several writes as one unit of work on the writer thread.
+
+        Args:
+            work (callable): Function receiving the writer's Controller, called inside controller.transaction().
+
+        Returns:
+            The return value of work.
+        """
+        def run():
+            controller = self._controller()
+            with controller.transaction():
+                return work(controller)
+        return await self._submit(self._writer, run)
+
+    async def _iterate(self, name, *args, after_id=None, limit=None, page_size=None):
+        """
+        Async iterator over a Controller keyset iterator: every page is read by a separate
+        executor call, with the id of the last row as cursor, so no cursor is shared between threads.
+        """
+        page_size = page_size or config.config.get("page_size", 500)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            count = page_size if remaining is None else min(page_size, remaining)
+            page = await self._submit(self._reader, lambda: list(
+                self._read(name, *args, after_id=after_id, limit=count, page_size=count)))
+            for row in page:
+                yield row
+            if len(page) < count:
+                return
+            after_id = page[-1].get_id()
+            if remaining is not None:
+                remaining -= len(page)
+
+    async def aclose(self):
+        """
+        Closes the Controllers of the worker threads, giving their connections back to the pool,
+        and stops the thread pools. The facade must not be used afterwards.
+        """
+        def close_local(barrier=None):
+            controller = getattr(self._local, "controller", None)
+            if controller is not None:
+                controller.db_ops.close()
+                self._local.controller = None
+            if barrier is not None:
+                # holds every reader thread until each one has run this function once
+                barrier.wait()
+
+        barrier = threading.Barrier(self.readers)
+        await asyncio.gather(*(self._submit(self._reader, close_local, barrier) for _ in range(self.readers)),
+                             self._submit(self._writer, close_local))
+        self._reader.shutdown()
+        self._writer.shutdown()
+
+
+def _reader_method(name):
+    async def method(self, *args, **kwargs):
+        return await self._submit(self._reader, self._read, name, *args, **kwargs)
+    return method
+
+
+def _writer_method(name):
+    async def method(self, *args, **kwargs):
+        return await self._submit(self._writer, self._write, name, *args, **kwargs)
+    return method
+
+
+def _iter_method(name):
+    def method(self, *args, **kwargs):
+        return self._iterate(name, *args, **kwargs)
+    return method
+
+
+for _methods, _factory in ((READ_METHODS, _reader_method), (WRITE_METHODS, _writer_method), (ITER_METHODS, _iter_method)):
+    for _name in _methods:
+        _method = _factory(_name)
+        _method.__name__ = _name
+        _method.__qualname__ = f"AsyncController.{_name}"
+        _method.__doc__ = getattr(Controller, _name).__doc__
+        setattr(AsyncController, _name, _method)
@@ -1,7 +1,9 @@
 import re
 from datetime import datetime
 from colorama import Fore, Style, init
+from db import tracing
 from db.db_operations import DatabaseOperations
+from db.reporting import ReportingOperations
 from session.session import Session
 
 #2FA debgu
@@ -26,10 +28,34 @@ class Controller:
         :param session: The session object to manage user sessions and login attempts.
         """
         self.db_ops = DatabaseOperations()
+        self._reports = None # read-only reporting connection, opened by the first report()
         self.session = session
         self.__n_attempts_limit = 5 # Maximum number of login attempts before lockout.
         self.__timeout_timer = 180 # Timeout duration in seconds.
 
+    def transaction(self):
+        """
+        Opens a unit of work: the database calls made inside the with block are committed
+        once at the end, or rolled back together if the block raises. Blocks can be nested.
+
+        :return: Context manager, see DatabaseOperations.transaction.
+        """
+        return self.db_ops.transaction()
+
+    def report(self):
+        """
+        Opens a read-only snapshot for a long listing, on a reporting connection separate from
+        the one used for writes, so that the listing neither sees nor holds back concurrent writes.
+
+            with controller.report() as reports:
+                for user in reports.iter_users(): ...
+
+        :return: Context manager yielding a ReportingOperations, see ReportingOperations.snapshot.
+        """
+        if self._reports is None:
+            self._reports = ReportingOperations()
+        return self._reports.snapshot()
+
 # ---------- ACCOUNTS ----------
 
     def insert_actor_info(self, role: str, username: str, name: str, lastname: str,  residence: str, birthdayPlace: str, birthday: str, mail: str, phone: str):
@@ -62,6 +88,20 @@ class Controller:
 
         return insertion_code
 
+    def insert_actors_info_many(self, actors, chunk_size=None):
+        """
+        Inserts many actor records into the Accounts table in a single transaction.
+        Unlike insert_actor_info, the session user is left unchanged.
+
+        Args:
+            actors (iterable): Tuples of (role, username, name, lastname, residence, birthdayPlace, birthday, mail, phone).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.insert_actors_many(actors, chunk_size)
+
     def update_actor_info(self, user):
         """
         Updates the information of an existing account in the database.
@@ -95,6 +135,21 @@ class Controller:
         """
         return self.db_ops.get_users()
 
+    def iter_users(self, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the user records of the Accounts table, in id order.
+
+        Args:
+            after_id (int, optional): Only accounts with a greater id are returned.
+            limit (int, optional): Maximum number of accounts to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Returns:
+            generator: Accounts instances.
+        """
+        return self.db_ops.iter_users(after_id, limit, page_size, stream)
+
     def get_user_by_username(self, username):
         """
         Retrieves a user's detailed information from table Account.
@@ -149,6 +204,19 @@ class Controller:
         """
         return self.db_ops.register_account_activities(username, activity_id)
 
+    def register_account_activities_many(self, links, chunk_size=None):
+        """
+        Inserts many associations between accounts and activities in a single transaction.
+
+        Args:
+            links (iterable): Tuples of (username, activity_id).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.register_account_activities_many(links, chunk_size)
+
 # ---------- END ACCOUNTS_ACTIVITIES ----------
 
 # ---------- ACTIVITIES ----------
@@ -167,6 +235,19 @@ class Controller:
         """
         return self.db_ops.register_activities(activity_type, description)
 
+    def register_activities_many(self, activities, chunk_size=None):
+        """
+        Inserts many activity records into the Activities table in a single transaction.
+
+        Args:
+            activities (iterable): Tuples of (type, description).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.register_activities_many(activities, chunk_size)
+
 # ---------- END ACTIVITIES ----------
 
 # ---------- CREDENTIALS ----------
@@ -193,6 +274,20 @@ class Controller:
 
         return registration_code
 
+    def registration_many(self, credentials, chunk_size=None, kdf_params=None):
+        """
+        Registers many credentials records in a single transaction, hashing the passwords in parallel.
+
+        Args:
+            credentials (iterable): Tuples of (username, password, public_key, private_key).
+            chunk_size (int, optional): Rows per executemany call.
+            kdf_params (password_kdf.KdfParams, optional): scrypt cost, the configured one if None.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.register_creds_many(credentials, chunk_size, kdf_params)
+
     def update_password(self, username, password):
         """
         Changes the password for a given username by hashing the new password
@@ -268,6 +363,27 @@ class Controller:
         """
         return self.db_ops.get_username_by_public_key(public_key)
 
+    def get_identity(self, username=None, public_key=None):
+        """
+        Retrieves the identity (username, public key, role, credentials id) of a user,
+        by username or by public key, through the identity cache.
+
+        Args:
+            username (str, optional): The username of the user.
+            public_key (str, optional): The public key of the user, used if username is None.
+
+        Returns:
+            Identity or None: The identity of the user if found, otherwise None.
+        """
+        return self.db_ops.get_identity(username, public_key)
+
+    def identity_cache_stats(self):
+        """
+        Returns:
+            dict: hits, misses, size and maxsize of the identity cache.
+        """
+        return self.db_ops.identity_cache_stats()
+
     def check_username(self, username):
         """
         Check if an username is unique within the Credentials table in the database.
@@ -327,6 +443,19 @@ class Controller:
         """
         return self.db_ops.register_cron_activity(description,  username, state, activity_id, co2_reduction)
 
+    def register_cron_activities_many(self, activities, chunk_size=None):
+        """
+        Inserts many records into the Cron_Activities table in a single transaction.
+
+        Args:
+            activities (iterable): Tuples of (description, username, state, activity_id, co2_reduction).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.register_cron_activities_many(activities, chunk_size)
+
     def update_activity_state(self, activitie_id):
         """
         Updates the state of a specific activity identified by its activity_id.
@@ -345,6 +474,18 @@ class Controller:
         elif state == 1:
             return self.db_ops.update_activity_state(activitie_id, 2)
 
+    def query_activities(self, username=None, states=None, activity_id=None, date_from=None, date_to=None,
+                         date_column="creation_datetime", order_by="id", descending=False, limit=None,
+                         columns=None, key_by_id=False):
+        """
+        Parametrized query over the activity records, see DatabaseOperations.query_activities.
+
+        Returns:
+            list or dict: The matching Cron_Activities (or projected rows), keyed by id if key_by_id is True.
+        """
+        return self.db_ops.query_activities(username, states, activity_id, date_from, date_to, date_column,
+                                            order_by, descending, limit, columns, key_by_id)
+
     def get_activities_to_be_processed(self):
         """
         Retrieves all activities that have not been processed yet.
@@ -354,6 +495,21 @@ class Controller:
         """
         return self.db_ops.get_activities_to_be_processed()
 
+    def iter_activities_to_be_processed(self, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the activities that have not been processed yet, in id order.
+
+        Args:
+            after_id (int, optional): Only activities with a greater id are returned.
+            limit (int, optional): Maximum number of activities to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Returns:
+            generator: Cron_Activities instances.
+        """
+        return self.db_ops.iter_activities_to_be_processed(after_id, limit, page_size, stream)
+
     def get_activities_by_username(self, username):
         """
         Retrieves all activities associated with a given username.
@@ -366,6 +522,22 @@ class Controller:
         """
         return self.db_ops.get_activities_by_username(username)
 
+    def iter_activities_by_username(self, username, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the activities of a given username, in id order.
+
+        Args:
+            username (str): The username for which to retrieve activities.
+            after_id (int, optional): Only activities with a greater id are returned.
+            limit (int, optional): Maximum number of activities to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Returns:
+            generator: Cron_Activities instances.
+        """
+        return self.db_ops.iter_activities_by_username(username, after_id, limit, page_size, stream)
+
     def get_activities_to_be_processed_by_username(self, username):
         """
         Retrieves all activities assigned to the given username that are pending processing.
@@ -424,12 +596,54 @@ class Controller:
         """
         return self.db_ops.insert_product(name, category, co2Emission, nft_token_id)
 
+    def upsert_product(self, name, category, co2Emission, nft_token_id):
+        """
+        Inserts the product of an NFT token, or updates it if the token already has one.
+        Unlike create_product, writing the same token twice keeps a single, updated product.
+
+        Parameters:
+            name (str): The name of the product.
+            category (str): The category to which the product belongs.
+            co2Emission (float): The CO2 emissions associated with the product.
+            nft_token_id (int): The ID of the associated NFT token.
+
+        Returns:
+            int: 0 if the product was written, -1 if a database integrity error occurs.
+        """
+        return self.db_ops.upsert_product(name, category, co2Emission, nft_token_id)
+
+    def insert_products_many(self, products, chunk_size=None):
+        """
+        Inserts many product records into the Products table in a single transaction.
+
+        Parameters:
+            products (iterable): Tuples of (name, category, co2Emission, nft_token_id).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.insert_products_many(products, chunk_size)
+
+    def upsert_products_many(self, products, chunk_size=None):
+        """
+        Inserts or updates many products keyed by NFT token id, in a single transaction.
+
+        Parameters:
+            products (iterable): Tuples of (name, category, co2Emission, nft_token_id).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of written rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.upsert_products_many(products, chunk_size)
+
     def update_product(self, product_id, co2Emission):
         """
         Updates the CO2 emission data of an existing product in the Products table.
 
         Parameters:
-            product_id (int): The ID (nftID) of the product to update.
+            product_id (int): The NFT token id (nftID) of the product to update.
             co2Emission (float, optional): The new CO2 emission value to set. If None, no update is performed.
 
         Returns:
@@ -459,20 +673,140 @@ class Controller:
         """
         return self.db_ops.insert_transaction(username_from, username_to, amount, type, tx_hash)
 
-    def get_user_transactions(self, user_username):
+    def insert_transactions_many(self, transactions, chunk_size=None):
+        """
+        Inserts many transaction records into the Transactions table in a single transaction.
+
+        Args:
+            transactions (iterable): Tuples of (username_from, username_to, amount, type, tx_hash).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self.db_ops.insert_transactions_many(transactions, chunk_size)
+
+    def get_user_transactions(self, user_username, date_from=None, date_to=None):
         """
         Retrieves all transactions involving a specific user, either as sender or receiver.
+        Archived transactions are only read when the date range reaches them.
 
         Args:
             user_username (str): The username of the user whose transactions are to be retrieved.
+            date_from (str, optional): Only transactions dated on or after this date.
+            date_to (str, optional): Only transactions dated before this date.
 
         Returns:
             list of Transaction: A list of Transaction objects ordered by timestamp descending.
         """
-        return self.db_ops.get_user_transactions(user_username)
+        return self.db_ops.get_user_transactions(user_username, date_from, date_to)
+
+    def iter_user_transactions(self, user_username, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the transactions involving a user, newest first.
+
+        Args:
+            user_username (str): The username of the user whose transactions are to be retrieved.
+            after_id (int, optional): Id of the last transaction seen, only the ones listed after it are returned.
+            limit (int, optional): Maximum number of transactions to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Returns:
+            generator: Transaction instances.
+        """
+        return self.db_ops.iter_user_transactions(user_username, after_id, limit, page_size, stream)
 
 # ---------- END TRANSACTIONS ---------- 
 
+    def get_user_stats(self, username):
+        """
+        Retrieves the credit and activity totals of a user.
+
+        Args:
+            username (str): The username of the user.
+
+        Returns:
+            UserStats: minted, burned, transferred in/out credits, pending/processed activities and pending CO2.
+        """
+        return self.db_ops.get_user_stats(username)
+
+    def archive_history(self, hot_days=None):
+        """
+        Moves the transactions and processed activities older than the hot window to the archive files.
+
+        Args:
+            hot_days (int, optional): Days of history kept in the main tables, the configured value if None.
+
+        Returns:
+            dict: Period -> (archived transactions, archived activities).
+        """
+        return self.db_ops.archive_history(hot_days)
+
+    def search_activities(self, query, state=None, limit=20):
+        """
+        Full-text search of the activity records by description, best matches first.
+
+        Args:
+            query (str): Words to look for, a trailing * makes a word match as a prefix.
+            state (int, optional): Only records in this state (0 pending, 1 processed, 2 removed).
+            limit (int): Maximum number of records.
+
+        Returns:
+            list of Cron_Activities: The matching records.
+        """
+        return self.db_ops.search_activities(query, state, limit)
+
+    def search_products(self, query, category=None, limit=20):
+        """
+        Full-text search of the products by name, best matches first.
+
+        Args:
+            query (str): Words to look for, a trailing * makes a word match as a prefix.
+            category (str, optional): Only products of this category.
+            limit (int): Maximum number of products.
+
+        Returns:
+            list of sqlite3.Row: The matching products.
+        """
+        return self.db_ops.search_products(query, category, limit)
+
+    def sql_statistics(self, order_by="total_ms", contains=None, limit=None):
+        """
+        Statement statistics collected by the SQL tracing, see db.tracing.
+
+        Args:
+            order_by (str): total_ms, mean_ms, max_ms, calls, rows or statements, largest first.
+            contains (str, optional): Only statements containing this text.
+            limit (int, optional): Maximum number of statements.
+
+        Returns:
+            list of StatementStats: One entry per statement, None if tracing is disabled.
+        """
+        tracer = tracing.get_tracer()
+        return None if tracer is None else tracer.statistics(order_by, contains, limit)
+
+    def slow_queries(self, limit=None):
+        """
+        Recent statements slower than the tracing threshold, with their query plan.
+
+        Args:
+            limit (int, optional): Maximum number of slow queries.
+
+        Returns:
+            list of SlowQuery: Newest first, None if tracing is disabled.
+        """
+        tracer = tracing.get_tracer()
+        return None if tracer is None else tracer.slow_queries(limit)
+
+    def reset_sql_statistics(self):
+        """
+        Clears the statement statistics and the slow queries kept in memory.
+        """
+        tracer = tracing.get_tracer()
+        if tracer is not None:
+            tracer.reset()
+
 
     def login(self, username: str, password: str):
         """
@@ -484,7 +818,7 @@ class Controller:
         """
         if(self.check_attempts() and self.db_ops.check_credentials(username, password)):
             creds: Credentials = self.db_ops.get_creds_by_username(username)
-            user_role = self.get_user_by_username(username).get_type()
+            user_role = self.db_ops.get_identity(username).role
             user = creds.get_username
             self.session.set_user(user)
             return 1, user_role
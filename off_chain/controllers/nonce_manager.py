@@ -0,0 +1,165 @@
+"""
+Local nonce allocation for the transactions sent by ActionController.
+
+Asking the node for the transaction count before every write costs a round trip, and two writes
+from the same account sent at the same time get the same nonce. NonceManager reads the pending
+transaction count of an account once, then hands out the following nonces itself, under a
+lock: any number of transactions from one account can be in flight.
+
+A nonce whose transaction the node did not accept leaves a gap that blocks the later ones, so
+it is handed out again before any new nonce. An error of the node about the nonce itself
+(too low, already known...) means the local count no longer matches the chain, e.g. because
+the account also sent transactions from elsewhere: the account is read again from the node.
+
+    nonces = NonceManager(w3)
+    tx = {'from': address, 'gasPrice': nonces.gas_price(), 'nonce': nonces.allocate(address)}
+    try:
+        function.transact(tx)
+    except Exception as e:
+        nonces.release(address, tx['nonce'], e)
+        raise
+"""
+
+import threading
+import time
+
+# node errors meaning the local nonce of the account no longer matches the chain
+NONCE_ERRORS = ("nonce too low", "nonce too high", "already known", "known transaction",
+                "replacement transaction underpriced", "incorrect nonce", "invalid nonce")
+
+
+def is_nonce_error(error):
+    """
+    Returns:
+        bool: True if the error of a transaction is about its nonce.
+    """
+    message = str(error).lower()
+    return any(text in message for text in NONCE_ERRORS)
+
+
+class _Account:
+    """Nonce state of one account."""
+
+    __slots__ = ("lock", "next", "gaps")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next = None  # next new nonce, None until read from the node
+        self.gaps = set()  # released nonces below next, handed out again first
+
+
+class NonceManager:
+    """
+    Thread-safe per-account nonce allocator, plus a short-lived cache of the gas price.
+
+    Attributes:
+        w3 (Web3): Connection to the node.
+        gas_price_ttl (float): Seconds a gas price read from the node is reused.
+    """
+
+    def __init__(self, w3, gas_price_ttl=30.0):
+        self.w3 = w3
+        self.gas_price_ttl = gas_price_ttl
+        self._lock = threading.Lock()
+        self._accounts = {}
+        self._gas_price = None
+        self._gas_price_read = 0.0
+        self._syncs = 0
+        self._allocated = 0
+
+    def _account(self, address):
+        with self._lock:
+            account = self._accounts.get(address)
+            if account is None:
+                account = self._accounts[address] = _Account()
+            return account
+
+    def allocate(self, address):
+        """
+        Hands out the nonce of the next transaction of an account.
+        The first call for an account (and the first after a resync) reads its pending transaction count.
+
+        Args:
+            address (str): Address sending the transaction.
+
+        Returns:
+            int: The nonce. Give it back with release() if the transaction cannot be sent.
+        """
+        account = self._account(address)
+        with account.lock:
+            if account.next is None:
+                account.next = self.w3.eth.get_transaction_count(address, "pending")
+                account.gaps.clear()
+                with self._lock:
+                    self._syncs += 1
+            with self._lock:
+                self._allocated += 1
+            if account.gaps:
+                nonce = min(account.gaps)
+                account.gaps.remove(nonce)
+                return nonce
+            nonce = account.next
+            account.next += 1
+            return nonce
+
+    def release(self, address, nonce, error=None):
+        """
+        Gives back a nonce whose transaction the node did not accept.
+
+        Args:
+            address (str): Address of the transaction.
+            nonce (int): Nonce returned by allocate().
+            error (Exception, optional): Error of the transaction. An error about the nonce itself
+                makes the next allocation read the account from the node again.
+
+        Returns:
+            bool: True if the account will be read again, so the transaction is worth retrying with a new nonce.
+        """
+        account = self._account(address)
+        with account.lock:
+            if account.next is None or nonce >= account.next:
+                # allocated before the last resync
+                return account.next is None
+            if error is not None and is_nonce_error(error):
+                account.next = None
+                return True
+            account.gaps.add(nonce)
+            # gaps at the top are not gaps: the next new nonce goes back down
+            while account.next - 1 in account.gaps:
+                account.next -= 1
+                account.gaps.remove(account.next)
+            return False
+
+    def resync(self, address=None):
+        """
+        Makes the next allocation of an account read its pending transaction count from the node.
+
+        Args:
+            address (str, optional): The account, every account if None.
+        """
+        with self._lock:
+            accounts = list(self._accounts.values()) if address is None else [self._accounts.get(address)]
+        for account in accounts:
+            if account is not None:
+                with account.lock:
+                    account.next = None
+                    account.gaps.clear()
+
+    def gas_price(self):
+        """
+        Returns:
+            int: The gas price of the node, read again once older than gas_price_ttl seconds.
+        """
+        with self._lock:
+            if self._gas_price is None or time.monotonic() - self._gas_price_read >= self.gas_price_ttl:
+                self._gas_price = self.w3.eth.gas_price
+                self._gas_price_read = time.monotonic()
+            return self._gas_price
+
+    def stats(self):
+        """
+        Returns:
+            dict: allocated nonces, syncs (transaction count reads) and accounts tracked.
+        """
+        with self._lock:
+            return {"allocated": self._allocated, "syncs": self._syncs, "accounts": len(self._accounts)}
@@ -0,0 +1,140 @@
+"""
+Transactions sent now and waited for later.
+
+ActionController.write_data sends a transaction and blocks until it is mined, so a sequence of
+writes pays one receipt wait per transaction. ActionController.submit sends the transaction and
+returns a PendingTransaction right away. gather() then waits for many of them at once: every
+pass asks the node for the receipts still missing, and transactions mined in the same block
+are collected together. The time saved depends on how the node mines, see
+benchmarks/bench_chain.py.
+
+    pending = [act.submit('mint', 'CarbonCreditToken', certifier, user, amount) for user, amount in credits]
+    for tx, result in zip(pending, gather(pending, timeout=60)):
+        if isinstance(result, TransactionError):
+            log_error(f"{tx} failed: {result}")
+
+Each result belongs to its own transaction: one that could not be sent, reverted or was not
+mined in time does not hide the outcome of the others.
+"""
+
+import time
+from web3.exceptions import TransactionNotFound
+
+
+class TransactionError(Exception):
+    """
+    Raised for a transaction that could not be sent, reverted or was not mined in time.
+
+    Attributes:
+        pending (PendingTransaction): The transaction.
+    """
+
+    def __init__(self, message, pending):
+        super().__init__(message)
+        self.pending = pending
+
+
+class PendingTransaction:
+    """
+    Handle of a transaction submitted with ActionController.submit.
+
+    Attributes:
+        function_name (str): Contract function called.
+        contract_name (str): Contract name.
+        from_address (str): Sender.
+        args (tuple): Arguments of the function.
+        tx_hash (HexBytes): Hash of the transaction, None if it could not be sent.
+        receipt (AttributeDict): Receipt once the transaction is mined, None before.
+        error (TransactionError): Why the transaction failed, None if it did not (yet).
+    """
+
+    def __init__(self, w3, function_name, contract_name, from_address, args, tx_hash=None, error=None):
+        self.w3 = w3
+        self.function_name = function_name
+        self.contract_name = contract_name
+        self.from_address = from_address
+        self.args = args
+        self.tx_hash = tx_hash
+        self.receipt = None
+        self.error = None if error is None else TransactionError(f"{self} was not sent: {error}", self)
+
+    def __repr__(self):
+        tx = self.tx_hash.hex() if self.tx_hash is not None else "not sent"
+        return f"{self.contract_name}.{self.function_name} from {self.from_address} ({tx})"
+
+    def done(self):
+        """
+        Returns:
+            bool: True once the transaction is mined or has failed.
+        """
+        return self.receipt is not None or self.error is not None
+
+    def poll(self):
+        """
+        Asks the node for the receipt once, without waiting.
+
+        Returns:
+            bool: True if the transaction is done, see done().
+        """
+        if self.done():
+            return True
+        try:
+            receipt = self.w3.eth.get_transaction_receipt(self.tx_hash)
+        except TransactionNotFound:
+            return False
+        self.receipt = receipt
+        if receipt.get("status") == 0:
+            self.error = TransactionError(f"{self} reverted in block {receipt.get('blockNumber')}", self)
+        return True
+
+    def result(self, timeout=120, poll_interval=0.1):
+        """
+        Waits for the transaction.
+
+        Args:
+            timeout (float): Seconds to wait for the receipt.
+            poll_interval (float): Seconds between two receipt requests.
+
+        Returns:
+            AttributeDict: The receipt.
+
+        Raises:
+            TransactionError: If the transaction was not sent, reverted or is not mined within the timeout.
+        """
+        result, = gather([self], timeout, poll_interval)
+        if isinstance(result, TransactionError):
+            raise result
+        return result
+
+
+def gather(pending, timeout=120, poll_interval=0.1):
+    """
+    Waits for many submitted transactions at once.
+
+    Args:
+        pending (list of PendingTransaction): The transactions.
+        timeout (float): Seconds to wait for all the receipts.
+        poll_interval (float): Seconds between two passes over the missing receipts.
+
+    Returns:
+        list: For each transaction, in order, its receipt or the TransactionError explaining why it failed.
+        A transaction still pending after the timeout gets a TransactionError but stays pending,
+        it can be gathered again later.
+    """
+    deadline = time.monotonic() + timeout
+    waiting = [tx for tx in pending if not tx.done()]
+    while waiting:
+        waiting = [tx for tx in waiting if not tx.poll()]
+        if not waiting or time.monotonic() >= deadline:
+            break
+        time.sleep(poll_interval)
+
+    results = []
+    for tx in pending:
+        if tx.error is not None:
+            results.append(tx.error)
+        elif tx.receipt is not None:
+            results.append(tx.receipt)
+        else:
+            results.append(TransactionError(f"{tx} was not mined within {timeout}s", tx))
+    return results
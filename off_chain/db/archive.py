@@ -0,0 +1,307 @@
+"""
+Hot/cold partitioning of the history tables.
+
+Transactions rows and processed Cron_Activities rows (state 1 or 2) older than the hot window
+are moved out of the main database into archive files, one per period (year or month):
+
+    archive/SupplyChain-2024.sqlite    Transactions and Cron_Activities of 2024
+
+The archived periods are listed in the archive_periods table of the main database (schema
+migration 5), with paths relative to the directory of the main database unless the archive
+directory was given as an absolute path. The main tables only keep the recent rows, and history queries given a date
+range read the archives whose period overlaps it, see DatabaseOperations.get_user_transactions
+and DatabaseOperations.query_activities. user_stats totals are not affected by archiving.
+
+Rows are copied to the archive and committed there before being deleted from the main
+database, so an interrupted run loses nothing and can simply be run again. The archived rows
+exist nowhere else: a registered archive file that is missing makes the history reads that
+need it fail with MissingArchiveError rather than return part of the history.
+
+Archive the rows older than the configured hot window:
+    python -m db.archive [--before YYYY-MM-DD] [--list]
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+from config import config
+
+DEFAULTS = {"directory": "archive", "period": "year", "hot_days": 365, "auto": False}
+
+# Column used to assign the rows of each table to a period, and extra condition on the rows to move.
+ARCHIVED_TABLES = {
+    "Transactions": ("timestamp", ""),
+    "Cron_Activities": ("creation_datetime", "AND state != 0"),
+}
+
+_ARCHIVE_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS {schema}.Transactions (
+            id INTEGER PRIMARY KEY,
+            username_from TEXT,
+            username_to TEXT,
+            amount INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            tx_hash TEXT,
+            timestamp DATETIME NOT NULL
+            )''',
+    '''CREATE TABLE IF NOT EXISTS {schema}.Cron_Activities (
+            id INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            username TEXT NOT NULL,
+            update_datetime DATETIME NOT NULL,
+            creation_datetime DATETIME NOT NULL,
+            state INTEGER NOT NULL,
+            activity_id INTEGER NOT NULL,
+            co2_reduction DECIMAL NOT NULL
+            )''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_Transactions_username_from ON Transactions (username_from)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_Transactions_username_to ON Transactions (username_to)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_Transactions_timestamp ON Transactions (timestamp)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_Cron_Activities_username_state ON Cron_Activities (username, state)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_Cron_Activities_creation_datetime ON Cron_Activities (creation_datetime)",
+)
+
+
+class MissingArchiveError(Exception):
+    """Raised when archive files listed in archive_periods do not exist."""
+
+
+def settings():
+    """
+    Returns:
+        dict: The `archive:` configuration section completed with the defaults.
+    """
+    values = dict(DEFAULTS)
+    values.update(config.config.get("archive") or {})
+    if values["period"] not in ("year", "month"):
+        raise ValueError(f"Unknown archive period '{values['period']}', expected 'year' or 'month'.")
+    return values
+
+
+def period_bounds(key):
+    """
+    Args:
+        key (str): A period, 'YYYY' or 'YYYY-MM'.
+
+    Returns:
+        tuple of str: (first day of the period, first day of the next one), both 'YYYY-MM-DD'.
+    """
+    if len(key) == 4:
+        return f"{key}-01-01", f"{int(key) + 1:04d}-01-01"
+    year, month = int(key[:4]), int(key[5:7])
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{key}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+
+def database_directory(conn):
+    """
+    Returns:
+        str: Directory of the main database of a connection, against which relative archive paths
+        are resolved. The working directory for an in-memory database.
+    """
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main" and path:
+            return os.path.dirname(path)
+    return os.getcwd()
+
+
+def archive_path(key, directory=None):
+    """
+    Returns:
+        str: Path of the archive file of a period, relative to the directory of the main database
+        if the archive directory is relative.
+    """
+    directory = directory or settings()["directory"]
+    name = os.path.splitext(os.path.basename(config.config["db_path"]))[0]
+    return os.path.join(directory, f"{name}-{key}.sqlite")
+
+
+def archive_rows(conn, cutoff, directory=None, period=None):
+    """
+    Moves the rows older than the cutoff to the archive file of their period.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the main database, with no open transaction.
+        cutoff (str): Rows dated before this moment ('YYYY-MM-DD[ HH:MM:SS]', UTC) are archived.
+        directory (str, optional): Directory of the archive files, the configured one if None. A relative
+            directory is relative to the directory of the main database.
+        period (str, optional): 'year' or 'month', the configured one if None.
+
+    Returns:
+        dict: Period -> (archived Transactions rows, archived Cron_Activities rows), for this run.
+
+    Raises:
+        ValueError: If the connection is inside a transaction (ATTACH is not possible there).
+    """
+    if conn.in_transaction:
+        raise ValueError("Archiving cannot run inside a transaction.")
+    config_values = settings()
+    directory = directory or config_values["directory"]
+    key_length = 4 if (period or config_values["period"]) == "year" else 7
+
+    keys = set()
+    for table, (column, condition) in ARCHIVED_TABLES.items():
+        keys.update(row[0] for row in conn.execute(
+            f"SELECT DISTINCT substr({column}, 1, {key_length}) FROM {table} WHERE {column} < ? {condition}",
+            (cutoff,)))
+
+    moved = {}
+    base = database_directory(conn)
+    if keys:
+        os.makedirs(os.path.join(base, directory), exist_ok=True)
+    for key in sorted(keys):
+        start, end = period_bounds(key)
+        end = min(end, cutoff)
+        path = archive_path(key, directory)
+        conn.execute("ATTACH DATABASE ? AS cold", (os.path.join(base, path),))
+        try:
+            for statement in _ARCHIVE_SCHEMA:
+                conn.execute(statement.format(schema="cold"))
+            counts = []
+            for table, (column, condition) in ARCHIVED_TABLES.items():
+                where = f"{column} >= ? AND {column} < ? {condition}"
+                # copy and commit first: a crash before the delete leaves duplicates, ignored by the next run
+                with conn:
+                    conn.execute(f"INSERT OR IGNORE INTO cold.{table} SELECT * FROM main.{table} WHERE {where}",
+                                 (start, end))
+                with conn:
+                    count = conn.execute(f"""DELETE FROM main.{table} WHERE {where}
+                                             AND id IN (SELECT id FROM cold.{table})""", (start, end)).rowcount
+                counts.append(count)
+            with conn:
+                conn.execute("""INSERT INTO archive_periods (period, path, start_datetime, end_datetime,
+                                                             transactions, activities)
+                                VALUES (?, ?, ?, ?,
+                                        (SELECT COUNT(*) FROM cold.Transactions),
+                                        (SELECT COUNT(*) FROM cold.Cron_Activities))
+                                ON CONFLICT (period) DO UPDATE SET
+                                    path = excluded.path,
+                                    transactions = excluded.transactions,
+                                    activities = excluded.activities,
+                                    archived_datetime = CURRENT_TIMESTAMP""",
+                             (key, path, *period_bounds(key)))
+            moved[key] = tuple(counts)
+        finally:
+            conn.execute("DETACH DATABASE cold")
+    return moved
+
+
+def archive_old_rows(conn, hot_days=None):
+    """
+    Archives the rows older than the hot window.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the main database, with no open transaction.
+        hot_days (int, optional): Days of history kept in the main tables, the configured value if None.
+
+    Returns:
+        dict: See archive_rows.
+    """
+    hot_days = settings()["hot_days"] if hot_days is None else hot_days
+    # CURRENT_TIMESTAMP, used for the row dates, is UTC
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=hot_days)
+    return archive_rows(conn, cutoff.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def archives_for_range(conn, date_from=None, date_to=None):
+    """
+    Lists the archive files whose period overlaps a date range.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the main database.
+        date_from (str, optional): Start of the range (inclusive), unbounded if None.
+        date_to (str, optional): End of the range (exclusive), unbounded if None.
+
+    Returns:
+        list of str: Paths of the archive files, most recent period first.
+
+    Raises:
+        MissingArchiveError: If one of these files does not exist.
+    """
+    try:
+        rows = conn.execute("""SELECT period, path FROM archive_periods
+                               WHERE (? IS NULL OR end_datetime > ?) AND (? IS NULL OR start_datetime < ?)
+                               ORDER BY start_datetime DESC""", (date_from, date_from, date_to, date_to)).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    base = database_directory(conn)
+    paths = [(period, os.path.join(base, path)) for period, path in rows]
+    missing = [f"{period} ({path})" for period, path in paths if not os.path.exists(path)]
+    if missing:
+        raise MissingArchiveError(f"Archive file(s) not found: {', '.join(missing)}.")
+    return [path for _, path in paths]
+
+
+def query_archives(paths, query, params, row_factory=None):
+    """
+    Runs the same read query on several archive files, each opened read-only.
+
+    Args:
+        paths (list of str): Archive files, see archives_for_range.
+        query (str): The query, written against the Transactions / Cron_Activities tables.
+        params (sequence): Query parameters.
+        row_factory (callable, optional): Row factory of the cursors.
+
+    Returns:
+        list: The rows of every archive, archive after archive.
+    """
+    rows = []
+    for path in paths:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cur = conn.cursor()
+            cur.row_factory = row_factory
+            rows.extend(cur.execute(query, params).fetchall())
+        finally:
+            conn.close()
+    return rows
+
+
+def attach_archives(conn, date_from=None, date_to=None):
+    """
+    Attaches the archive files listed in archive_periods, for maintenance queries and exports
+    over the full history.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the main database, with no open transaction.
+        date_from (str, optional): Only the archives of periods ending after this date.
+        date_to (str, optional): Only the archives of periods starting before this date.
+
+    Returns:
+        list of str: Schema names of the attached archives, detach them with detach_archives.
+
+    Raises:
+        MissingArchiveError: If one of the archive files does not exist.
+    """
+    schemas = []
+    for index, path in enumerate(archives_for_range(conn, date_from, date_to)):
+        schema = f"archive_{index}"
+        conn.execute("ATTACH DATABASE ? AS " + schema, (f"file:{path}?mode=ro",))
+        schemas.append(schema)
+    return schemas
+
+
+def detach_archives(conn, schemas):
+    """Detaches the archives attached by attach_archives."""
+    for schema in schemas:
+        conn.execute(f"DETACH DATABASE {schema}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old Transactions and processed Cron_Activities to archive files.")
+    parser.add_argument("--db", default=config.config["db_path"], help="database file (default: configured db_path)")
+    parser.add_argument("--before", help="archive the rows dated before this date (default: older than hot_days)")
+    parser.add_argument("--list", action="store_true", help="only list the archived periods")
+    args = parser.parse_args()
+
+    con = sqlite3.connect(args.db, isolation_level=None)
+    if not args.list:
+        result = archive_rows(con, args.before) if args.before else archive_old_rows(con)
+        for key, (transactions, activities) in result.items():
+            print(f"{key}: {transactions} transaction(s), {activities} activity(ies) archived")
+        if not result:
+            print("Nothing to archive.")
+    for row in con.execute("SELECT period, path, transactions, activities FROM archive_periods ORDER BY period"):
+        print("{}: {} ({} transactions, {} activities)".format(*row))
+    con.close()
@@ -0,0 +1,197 @@
+"""
+Online backup and restore of the off-chain database.
+
+Backups use SQLite's online backup API while the application keeps running. Pages are copied
+`pages` at a time with a pause between steps, so writers get the database in between. The
+source connection is a read-only reporting connection (db.reporting) that holds one read
+transaction for the whole copy. The backup is therefore the snapshot taken when it started.
+Without that transaction, every commit of another connection would restart the backup from
+the first page, and under steady writes it would never finish. The copy is written to a
+temporary file and then gzip-compressed.
+
+A restore validates the backup before touching the live database:
+- PRAGMA integrity_check must pass.
+- The schema version must not be newer than this code.
+The pages are then copied into the live database with the same API, and the restored
+database is checked again. Restart the application afterwards: its caches (identities,
+schema version check) still describe the previous content.
+
+Archive files of db.archive are separate databases and are not part of the backup.
+
+    python -m db.backup backup [OUT] [--pages 256] [--sleep 0.005] [--no-compress]
+    python -m db.backup restore BACKUP [--db PATH]
+"""
+
+import argparse
+import datetime
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from config import config
+from db import db_migrations, reporting
+
+DEFAULTS = {"directory": "backups", "pages": 256, "sleep": 0.005, "compress": True}
+
+
+class BackupError(Exception):
+    """Raised when a backup, or the database restored from it, fails validation."""
+
+
+def settings():
+    """
+    Returns:
+        dict: The `backup:` configuration section completed with the defaults.
+    """
+    values = dict(DEFAULTS)
+    values.update(config.config.get("backup") or {})
+    return values
+
+
+def default_path(db_path=None, compress=True):
+    """
+    Returns:
+        str: A timestamped backup path in the configured directory, e.g. backups/SupplyChain-20250101-120000.sqlite.gz
+    """
+    name = os.path.splitext(os.path.basename(db_path or config.config["db_path"]))[0]
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(settings()["directory"], f"{name}-{stamp}.sqlite" + (".gz" if compress else ""))
+
+
+def backup(out=None, db_path=None, pages=None, sleep=None, compress=None, progress=None):
+    """
+    Copies the live database to a backup file without stopping the application.
+
+    Args:
+        out (str, optional): Backup file, see default_path if None.
+        db_path (str, optional): Database to back up, the configured db_path if None.
+        pages (int, optional): Pages copied per step, backup: pages if None.
+        sleep (float, optional): Seconds between two steps, backup: sleep if None.
+        compress (bool, optional): gzip the backup, backup: compress if None.
+        progress (callable, optional): Called as progress(copied_pages, total_pages) after every step.
+
+    Returns:
+        str: Path of the backup file.
+    """
+    values = settings()
+    db_path = db_path or config.config["db_path"]
+    compress = values["compress"] if compress is None else compress
+    out = out or default_path(db_path, compress)
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+
+    source = reporting.connect(db_path)
+    handle, copy_path = tempfile.mkstemp(suffix=".sqlite", dir=os.path.dirname(os.path.abspath(out)))
+    os.close(handle)
+    try:
+        # one read transaction: the backup is a snapshot and commits of other connections do not restart it
+        source.execute("BEGIN")
+        source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        target = sqlite3.connect(copy_path)
+        try:
+            source.backup(target, pages=pages or values["pages"], sleep=values["sleep"] if sleep is None else sleep,
+                          progress=None if progress is None else
+                          lambda status, remaining, total: progress(total - remaining, total))
+            # the copy keeps the WAL mode of the source, a single file is easier to move around
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+        source.rollback()
+
+        if compress:
+            with open(copy_path, "rb") as src, gzip.open(out, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            shutil.move(copy_path, out)
+    finally:
+        source.close()
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+    return out
+
+
+def _validate(conn):
+    problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    if problems != ["ok"]:
+        raise BackupError("Integrity check failed: " + "; ".join(problems[:5]))
+    version = db_migrations.current_version(conn)
+    if version > db_migrations.latest_version():
+        raise BackupError(f"The backup is at schema version {version}, "
+                          f"newer than this application ({db_migrations.latest_version()}).")
+    return version
+
+
+def restore(backup_path, db_path=None, pages=None, progress=None):
+    """
+    Replaces the content of the live database with a validated backup.
+
+    Args:
+        backup_path (str): Backup file, compressed or not.
+        db_path (str, optional): Database to restore into, the configured db_path if None.
+        pages (int, optional): Pages copied per step, backup: pages if None.
+        progress (callable, optional): Called as progress(copied_pages, total_pages) after every step.
+
+    Returns:
+        int: Schema version of the restored database. Older versions are migrated by the next start.
+
+    Raises:
+        BackupError: If the backup or the restored database fails validation.
+    """
+    db_path = db_path or config.config["db_path"]
+    handle, copy_path = tempfile.mkstemp(suffix=".sqlite", dir=os.path.dirname(os.path.abspath(db_path)))
+    os.close(handle)
+    try:
+        with open(backup_path, "rb") as f:
+            compressed = f.read(2) == b"\x1f\x8b"
+        with (gzip.open if compressed else open)(backup_path, "rb") as src, open(copy_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        source = sqlite3.connect(copy_path)
+        try:
+            try:
+                version = _validate(source)
+            except sqlite3.DatabaseError as e:
+                raise BackupError(f"Not a valid database backup: {e}") from e
+            target = sqlite3.connect(db_path, timeout=30)
+            try:
+                source.backup(target, pages=pages or settings()["pages"],
+                              progress=None if progress is None else
+                              lambda status, remaining, total: progress(total - remaining, total))
+                _validate(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    finally:
+        os.remove(copy_path)
+    return version
+
+
+def _print_progress(copied, total):
+    print(f"\r{copied}/{total} pages ({100 * copied // max(total, 1)}%)", end="", file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online backup and validated restore of the off-chain database.")
+    parser.add_argument("--db", default=config.config["db_path"], help="database file (default: configured db_path)")
+    parser.add_argument("--pages", type=int, help="pages copied per step")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup_parser = commands.add_parser("backup", help="copy the live database to a backup file")
+    backup_parser.add_argument("out", nargs="?", help="backup file (default: timestamped file in backup: directory)")
+    backup_parser.add_argument("--sleep", type=float, help="seconds between two steps")
+    backup_parser.add_argument("--no-compress", action="store_true")
+    restore_parser = commands.add_parser("restore", help="replace the live database with a backup")
+    restore_parser.add_argument("backup")
+    args = parser.parse_args()
+
+    if args.command == "backup":
+        path = backup(args.out, args.db, args.pages, args.sleep, False if args.no_compress else None, _print_progress)
+        print(f"\nBackup written to {path} ({os.path.getsize(path) / 2 ** 20:.1f} MB)")
+    else:
+        try:
+            restored = restore(args.backup, args.db, args.pages, _print_progress)
+        except BackupError as e:
+            print(f"\nRestore aborted, the database was not modified: {e}")
+            raise SystemExit(1)
+        print(f"\n{args.db} restored from {args.backup} (schema version {restored}).")
@@ -0,0 +1,288 @@
+"""
+Process-wide SQLite connection manager.
+
+Every DatabaseOperations instance and every model used to open its own sqlite3 connection.
+This module keeps a bounded pool of connections instead: each thread checks out one connection,
+nested checkouts on the same thread share it, and the connection goes back to the pool once
+the last borrower of that thread releases it.
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import config
+from db import tracing
+from db.sqlite_profile import resolve_profile, apply_profile
+from db.identity_cache import IdentityCache
+
+
+class PoolExhaustedError(sqlite3.OperationalError):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3.Connection subclass used for every pooled connection.
+    It only adds bookkeeping attributes, the SQL behaviour is the standard one.
+
+    Attributes:
+        borrowers (int): Number of checkouts of the connection on its current thread.
+        owner (int): Identifier of the thread the connection is checked out to, None while in the pool.
+        tx_depth (int): Nesting level of the unit of work open on the connection, 0 if none.
+        after_transaction (list): Callbacks run once the outermost unit of work ends, committed or not.
+        query_only (bool): PRAGMA query_only is set for the current checkout, see set_query_only.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.borrowers = 0
+        self.owner = None
+        self.tx_depth = 0
+        self.after_transaction = []
+        self.query_only = False
+
+    def set_query_only(self, enabled):
+        """
+        Turns PRAGMA query_only on or off: while on, every write fails with "attempt to write a
+        readonly database". The connection manager turns it off when the connection returns to the pool.
+
+        Args:
+            enabled (bool): True to refuse writes.
+        """
+        self.execute(f"PRAGMA query_only = {'ON' if enabled else 'OFF'}")
+        self.query_only = enabled
+
+
+class TracedPooledConnection(tracing.TracedConnection, PooledConnection):
+    """
+    PooledConnection timing its statements, used while SQL tracing is enabled (see db.tracing).
+    """
+
+
+def connection_class():
+    """
+    Returns:
+        type: The sqlite3.Connection factory of new connections, TracedPooledConnection while
+        SQL tracing is enabled, PooledConnection otherwise.
+    """
+    return TracedPooledConnection if tracing.enabled() else PooledConnection
+
+
+class ConnectionManager:
+    """
+    Bounded pool of SQLite connections with thread-local checkout.
+
+    Attributes:
+        db_path (str): Path of the SQLite database file.
+        max_connections (int): Maximum number of connections open at the same time.
+        timeout (float): Seconds to wait for a free connection before giving up.
+        profile (dict): PRAGMAs applied to every connection as it opens, see db.sqlite_profile.
+        schema_ready (bool): Set once the schema version has been checked for this database.
+        identities (IdentityCache): Identity lookups cached for this database, see db.identity_cache.
+    """
+
+    def __init__(self, db_path, max_connections=8, timeout=5.0, profile=None):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.profile = profile if profile is not None else resolve_profile()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = set()
+        self._closed = False
+        self.schema_ready = False
+        self.identities = IdentityCache(config.config.get("identity_cache_size", 1024))
+
+    def _connect(self):
+        """
+        Opens a brand new connection to the database and applies the SQLite profile.
+
+        Returns:
+            PooledConnection: The new connection.
+        """
+        conn = sqlite3.connect(self.db_path, factory=connection_class(), check_same_thread=False)
+        try:
+            apply_profile(conn, self.profile)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def acquire(self):
+        """
+        Checks out the connection bound to the calling thread.
+
+        The first call on a thread takes a connection from the pool (opening one if the pool
+        is not full yet), the following calls on the same thread return that same connection.
+        Every call must be paired with a call to release().
+
+        Returns:
+            PooledConnection: The connection bound to the calling thread.
+
+        Raises:
+            PoolExhaustedError: If every connection is in use for longer than the timeout.
+        """
+        owner = threading.get_ident()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with self._lock:
+                # a release from another thread may have given the connection back in the meantime
+                if conn.owner == owner and conn.borrowers > 0:
+                    conn.borrowers += 1
+                    return conn
+            self._local.conn = None
+
+        if self._closed:
+            raise sqlite3.ProgrammingError("The connection manager has been closed.")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhaustedError(f"No database connection available after {self.timeout}s "
+                                     f"(pool size {self.max_connections}).")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._all.add(conn)
+
+        with self._lock:
+            conn.borrowers = 1
+            conn.owner = owner
+        self._local.conn = conn
+        return conn
+
+    def release(self, conn=None):
+        """
+        Gives back one checkout of a connection.
+        When its last borrower releases it, any open transaction is rolled back and the connection
+        returns to the pool. The release may come from another thread than the checkout, e.g. when
+        the garbage collector finalizes a DatabaseOperations instance there.
+
+        Args:
+            conn (PooledConnection, optional): The connection being released, the calling thread's one if None.
+        """
+        if conn is None:
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                return
+
+        with self._lock:
+            if conn.owner is None or conn.borrowers <= 0:
+                # not checked out: already released
+                return
+            conn.borrowers -= 1
+            if conn.borrowers > 0:
+                return
+            conn.owner = None
+
+        if getattr(self._local, "conn", None) is conn:
+            self._local.conn = None
+        conn.tx_depth = 0
+        conn.after_transaction.clear()
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            self._discard(conn)
+        else:
+            if conn.query_only:
+                conn.set_query_only(False)
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager version of acquire()/release().
+
+        Yields:
+            PooledConnection: The connection bound to the calling thread.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._all.discard(conn)
+        conn.close()
+
+    def open_connections(self):
+        """
+        Returns:
+            int: Number of connections currently open, idle or checked out.
+        """
+        with self._lock:
+            return len(self._all)
+
+    def close_all(self):
+        """
+        Closes every idle connection and marks the manager as closed.
+        Connections still checked out are closed as soon as they are released.
+        """
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """
+    Returns the process-wide connection manager, creating it from the configuration on first use.
+
+    Returns:
+        ConnectionManager: The shared connection manager.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager(config.config["db_path"],
+                                         max_connections=config.config.get("db_max_connections", 8))
+        return _manager
+
+
+def init_manager(db_path, max_connections=8, timeout=5.0, profile=None):
+    """
+    Replaces the process-wide connection manager, closing the previous one.
+    Used by tools and tests that work on a database other than the configured one.
+
+    Args:
+        db_path (str): Path of the SQLite database file.
+        max_connections (int): Maximum number of connections open at the same time.
+        timeout (float): Seconds to wait for a free connection.
+        profile (dict, optional): SQLite profile, the configured one if None.
+
+    Returns:
+        ConnectionManager: The new connection manager.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close_all()
+        _manager = ConnectionManager(db_path, max_connections=max_connections, timeout=timeout, profile=profile)
+        return _manager
+
+
+def close_manager():
+    """
+    Closes the process-wide connection manager, if any.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close_all()
+            _manager = None
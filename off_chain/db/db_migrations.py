@@ -1,124 +1,522 @@
-import random
+"""
+Versioned schema migrations for the off-chain database.
+
+Every schema change is an ordered migration step registered with the @migration decorator.
+Applied steps are recorded in the schema_version table, so bringing an up-to-date database
+to the latest version costs a single query. Databases created before this module existed
+already contain the tables of step 1, which only uses IF NOT EXISTS statements and simply
+adopts them.
+
+Run as a script to migrate the configured database:
+    python -m db.db_migrations [--fixtures] [--reset] [--dedupe-products]
+"""
+
+import argparse
 import sqlite3
-import string
 from config import config
+from db import user_stats
+
+MIGRATIONS = []
+
+# Managed index set: name -> (table, columns). Indexes are created by migration steps through
+# create_indexes(), missing_indexes() reports the ones a database lacks.
+INDEXES = {
+    "idx_Credentials_public_key": ("Credentials", ("public_key",)),
+    "idx_Credentials_private_key": ("Credentials", ("private_key",)),
+    "idx_Accounts_username": ("Accounts", ("username",)),
+    "idx_Accounts_mail": ("Accounts", ("mail",)),
+    "idx_Accounts_phone": ("Accounts", ("phone",)),
+    "idx_Cron_Activities_username_state": ("Cron_Activities", ("username", "state")),
+    "idx_Cron_Activities_state": ("Cron_Activities", ("state",)),
+    "idx_Cron_Activities_activity_id": ("Cron_Activities", ("activity_id",)),
+    "idx_Products_nftID_unique": ("Products", ("nftID",)),
+    "idx_Transactions_username_from_timestamp": ("Transactions", ("username_from", "timestamp")),
+    "idx_Transactions_username_to_timestamp": ("Transactions", ("username_to", "timestamp")),
+    "idx_Transactions_timestamp": ("Transactions", ("timestamp",)),
+    "idx_Cron_Activities_creation_datetime": ("Cron_Activities", ("creation_datetime",)),
+}
+
+# Indexes of INDEXES created as UNIQUE.
+UNIQUE_INDEXES = {"idx_Products_nftID_unique"}
+
+# Indexes created by a migration step and dropped by a later one. create_indexes() still builds
+# them for the step that introduced them, missing_indexes() does not expect them.
+RETIRED_INDEXES = {
+    "idx_Products_nftID": ("Products", ("nftID",)),  # replaced by idx_Products_nftID_unique in version 4
+    # replaced by the (username, timestamp) indexes in version 7
+    "idx_Transactions_username_from": ("Transactions", ("username_from",)),
+    "idx_Transactions_username_to": ("Transactions", ("username_to",)),
+}
+
+
+class MigrationError(Exception):
+    """Raised when the data of the database does not allow a migration step; the step is not applied."""
+
+
+def migration(version, description):
+    """
+    Registers a migration step.
+
+    Args:
+        version (int): Schema version reached once the step is applied, strictly increasing.
+        description (str): Short human readable description stored in schema_version.
+    """
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered out of order.")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    """
+    Returns:
+        int: Version reached once every registered migration is applied.
+    """
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    """
+    Reads the schema version of the database.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+
+    Returns:
+        int: The highest applied version, 0 for a database never migrated.
+    """
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def migrate(conn, target=None):
+    """
+    Applies every pending migration up to the target version.
+    Each step runs in its own transaction together with its schema_version record,
+    so a failing step leaves the database at the previous version.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        target (int, optional): Version to stop at, the latest one if None.
+
+    Returns:
+        list of int: The versions applied by this call, empty if the schema was already up to date.
+    """
+    target = latest_version() if target is None else target
+    if current_version(conn) >= target:
+        return []
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                            version INTEGER PRIMARY KEY,
+                            description TEXT NOT NULL,
+                            applied_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                            );''')
+            # another process may have migrated while we were waiting for the lock
+            if current_version(conn) >= version:
+                conn.execute("COMMIT")
+                continue
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                         (version, description))
+            conn.execute("COMMIT")
+            applied.append(version)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return applied
+
+
+def load_test_fixtures(conn):
+    """
+    Inserts the sample activities and products used for manual testing.
+    Nothing is inserted if the database already contains activities.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+
+    Returns:
+        bool: True if the fixtures were inserted, False if they were skipped.
+    """
+    if conn.execute("SELECT 1 FROM Activities LIMIT 1").fetchone():
+        return False
+
+    conn.execute('''INSERT INTO Activities (type, description) VALUES
+                    ('investment in a project for reduction', 'Investing in solar panels'),
+                    ('performing an action', 'Using electric vehicles for transport');''')
+
+    conn.execute('''INSERT INTO Accounts_Activities (username, activity_id) VALUES
+                    ('farmer_user', 1),
+                    ('carrier_user', 2);''')
+
+    conn.execute('''INSERT INTO Cron_Activities (description, username, state, activity_id, co2_reduction) VALUES
+                    ('Solar panel investment', 'farmer_user', 0, 1, 50.0),
+                    ('Electric vehicle implementation', 'carrier_user', 0, 2, 30.5);''')
+
+    conn.execute('''INSERT INTO Products (name, category, co2Emission, nftID) VALUES
+                    ('Apple', 'FRUIT', 10, 0),
+                    ('Beef', 'MEAT', 50, 1),
+                    ('Cheese', 'DAIRY', 20, 2);''')
+
+    conn.commit()
+    return True
+
+
+def create_indexes(conn, names):
+    """
+    Creates the given indexes of the managed index set, skipping the existing ones.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        names (iterable of str): Names of indexes declared in INDEXES.
+    """
+    for name in names:
+        table, columns = INDEXES[name] if name in INDEXES else RETIRED_INDEXES[name]
+        unique = "UNIQUE " if name in UNIQUE_INDEXES else ""
+        conn.execute(f'CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})')
+
+
+def missing_indexes(conn):
+    """
+    Lists the indexes of the managed index set that the database does not have.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+
+    Returns:
+        list of str: Names of the missing indexes.
+    """
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    return [name for name in INDEXES if name not in existing]
+
+
+def reset_database(conn):
+    """
+    Drops every table of the database, their triggers and indexes go with them.
+    Used by the --reset option.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+    """
+    tables = conn.execute("""SELECT name FROM sqlite_master
+                             WHERE type = 'table' AND name NOT LIKE 'sqlite_%'""").fetchall()
+    for (name,) in tables:
+        conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+    conn.commit()
+
 
-con = sqlite3.connect(config["db_path"])
-cur = con.cursor()
-
-
-cur.execute("DROP TABLE IF EXISTS Credentials")
-cur.execute("DROP TABLE IF EXISTS Accounts")
-cur.execute("DROP TABLE IF EXISTS Activities")
-cur.execute("DROP TABLE IF EXISTS Accounts_Activities")
-cur.execute("DROP TABLE IF EXISTS Cron_Activities")
-cur.execute("DROP TABLE IF EXISTS Products")
-
-# TODO do we want to leave the admin?
-# TODO public, private key, encrypt at rest.
-cur.execute('''CREATE TABLE IF NOT EXISTS Credentials (
-               id INTEGER PRIMARY KEY AUTOINCREMENT,
-               username TEXT NOT NULL UNIQUE,
-               password TEXT NOT NULL,
-               public_key TEXT NOT NULL,
-               private_key TEXT NOT NULL,
-               temp_code TEXT,
-               temp_code_validity DATETIME,
-               update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-               creation_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
-               );''')
-
-# trigger for automatic update of update_datetime
-cur.execute('''CREATE TRIGGER update_Credentials_timestamp
-            AFTER UPDATE ON Credentials
-            FOR EACH ROW
-            BEGIN
-            UPDATE Credentials SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
-            END;''')
-
-
-cur.execute('''CREATE TABLE Accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            type TEXT CHECK(type IN ('FARMER', 'CARRIER', 'SELLER', 'PRODUCER', 'CERTIFIER')) NOT NULL,
-            name TEXT NOT NULL,
-            lastname TEXT NOT NULL,
-            birthday TEXT NOT NULL,
-            birth_place TEXT,
-            residence TEXT,
-            phone TEXT,
-            mail TEXT,
-            FOREIGN KEY (username) REFERENCES Credentials(username)
-            );''')
-
-
-
-
-cur.execute('''CREATE TABLE Activities (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT CHECK(type IN ('investment in a project for reduction', 'performing an action')) NOT NULL,
-            description TEXT NOT NULL
-            );''')
-
-
-cur.execute('''CREATE TABLE IF NOT EXISTS Accounts_Activities (
-               username TEXT NOT NULL,
-               activity_id INTEGER NOT NULL,
-               PRIMARY KEY (username, activity_id),
-               FOREIGN KEY (username) REFERENCES Credentials(username),
-               FOREIGN KEY (activity_id) REFERENCES Activities(id)
-               );''')
-
-cur.execute('''CREATE TABLE Transactions (
-               id INTEGER PRIMARY KEY AUTOINCREMENT,
-               username_from TEXT,
-               username_to TEXT,
-               amount INTEGER NOT NULL,
-               type TEXT CHECK(type IN ('MINT', 'BURN', 'TRANSFER')) NOT NULL,
-               tx_hash TEXT,
-               timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
-               );
-               ''')
-
-cur.execute('''CREATE TABLE IF NOT EXISTS Cron_Activities (
-               id INTEGER PRIMARY KEY AUTOINCREMENT,
-               description TEXT NOT NULL,
-               username TEXT NOT NULL,
-               update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-               creation_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-               state INTEGER NOT NULL CHECK(state IN (0, 1, 2)),
-               activity_id INTEGER NOT NULL,
-               co2_reduction DECIMAL NOT NULL,
-               FOREIGN KEY (username) REFERENCES Credentials(username),
-               FOREIGN KEY (activity_id) REFERENCES Activities(id)
-               );''')
-
-cur.execute('''CREATE TRIGGER update_Cron_Activities_timestamp
-            AFTER UPDATE ON Cron_Activities
-            FOR EACH ROW
-            BEGIN
-            UPDATE Cron_Activities SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
-            END;''')
-
-cur.execute('''CREATE TABLE Products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            category TEXT CHECK(category IN ('FRUIT', 'MEAT', 'DAIRY')) NOT NULL,
-            co2Emission INTEGER NOT NULL,
-            nftID INTEGER NOT NULL,
-            harvestDate DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
-            );''')
-
-# trigger for automatic update of update_datetime
-cur.execute('''CREATE TRIGGER IF NOT EXISTS update_Products_timestamp
-                        AFTER UPDATE ON Products
-                        FOR EACH ROW
+def duplicate_products(conn):
+    """
+    Lists the NFT ids with more than one Products row, which block migration 4.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+
+    Returns:
+        list of tuple: (nftID, list of Products ids, oldest first) for every duplicated token.
+    """
+    rows = conn.execute("""SELECT nftID, GROUP_CONCAT(id) FROM
+                           (SELECT nftID, id FROM Products
+                            WHERE nftID IN (SELECT nftID FROM Products GROUP BY nftID HAVING COUNT(*) > 1)
+                            ORDER BY nftID, id)
+                           GROUP BY nftID ORDER BY nftID""").fetchall()
+    return [(nft_id, [int(i) for i in ids.split(",")]) for nft_id, ids in rows]
+
+
+def remove_duplicate_products(conn):
+    """
+    Keeps only the most recent Products row of every duplicated NFT id.
+    Run on request (--dedupe-products), never by a migration step.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+
+    Returns:
+        list of tuple: The removed rows as (id, name, category, co2Emission, nftID).
+    """
+    condition = "id NOT IN (SELECT MAX(id) FROM Products GROUP BY nftID)"
+    removed = conn.execute(f"SELECT id, name, category, co2Emission, nftID FROM Products WHERE {condition}").fetchall()
+    conn.execute(f"DELETE FROM Products WHERE {condition}")
+    conn.commit()
+    return removed
+
+
+# ---------- MIGRATIONS ----------
+
+@migration(1, "initial schema")
+def _initial_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS Credentials (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL UNIQUE,
+                    password TEXT NOT NULL,
+                    public_key TEXT NOT NULL,
+                    private_key TEXT NOT NULL,
+                    temp_code TEXT,
+                    temp_code_validity DATETIME,
+                    update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    creation_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );''')
+
+    # trigger for automatic update of update_datetime
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS update_Credentials_timestamp
+                    AFTER UPDATE ON Credentials
+                    FOR EACH ROW
+                    BEGIN
+                    UPDATE Credentials SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
+                    END;''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS Accounts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL,
+                    type TEXT CHECK(type IN ('FARMER', 'CARRIER', 'SELLER', 'PRODUCER', 'CERTIFIER')) NOT NULL,
+                    name TEXT NOT NULL,
+                    lastname TEXT NOT NULL,
+                    birthday TEXT NOT NULL,
+                    birth_place TEXT,
+                    residence TEXT,
+                    phone TEXT,
+                    mail TEXT,
+                    FOREIGN KEY (username) REFERENCES Credentials(username)
+                    );''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS Activities (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type TEXT CHECK(type IN ('investment in a project for reduction', 'performing an action')) NOT NULL,
+                    description TEXT NOT NULL
+                    );''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS Accounts_Activities (
+                    username TEXT NOT NULL,
+                    activity_id INTEGER NOT NULL,
+                    PRIMARY KEY (username, activity_id),
+                    FOREIGN KEY (username) REFERENCES Credentials(username),
+                    FOREIGN KEY (activity_id) REFERENCES Activities(id)
+                    );''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS Cron_Activities (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    description TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    creation_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    state INTEGER NOT NULL CHECK(state IN (0, 1, 2)),
+                    activity_id INTEGER NOT NULL,
+                    co2_reduction DECIMAL NOT NULL,
+                    FOREIGN KEY (username) REFERENCES Credentials(username),
+                    FOREIGN KEY (activity_id) REFERENCES Activities(id)
+                    );''')
+
+    # trigger for automatic update of update_datetime
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS update_Cron_Activities_timestamp
+                    AFTER UPDATE ON Cron_Activities
+                    FOR EACH ROW
+                    BEGIN
+                    UPDATE Cron_Activities SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
+                    END;''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS Products (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    category TEXT CHECK(category IN ('FRUIT', 'MEAT', 'DAIRY')) NOT NULL,
+                    co2Emission INTEGER NOT NULL,
+                    nftID INTEGER NOT NULL,
+                    harvestDate DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );''')
+
+    # trigger for automatic update of update_datetime
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS update_Products_timestamp
+                    AFTER UPDATE ON Products
+                    FOR EACH ROW
+                    BEGIN
+                    UPDATE Products SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
+                    END;''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS Transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username_from TEXT,
+                    username_to TEXT,
+                    amount INTEGER NOT NULL,
+                    type TEXT CHECK(type IN ('MINT', 'BURN', 'TRANSFER')) NOT NULL,
+                    tx_hash TEXT,
+                    timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );''')
+
+
+@migration(2, "indexes on hot lookup columns")
+def _hot_lookup_indexes(conn):
+    create_indexes(conn, ["idx_Credentials_public_key", "idx_Credentials_private_key",
+                          "idx_Accounts_username", "idx_Accounts_mail", "idx_Accounts_phone",
+                          "idx_Cron_Activities_username_state", "idx_Cron_Activities_state",
+                          "idx_Cron_Activities_activity_id", "idx_Products_nftID",
+                          "idx_Transactions_username_from", "idx_Transactions_username_to"])
+
+
+def _transaction_stats_delta(row, sign):
+    """SQL applying the contribution of a Transactions row (NEW or OLD) to user_stats, with the given sign."""
+    return f'''
+        INSERT OR IGNORE INTO user_stats (username) SELECT {row}.username_to WHERE {row}.username_to IS NOT NULL;
+        INSERT OR IGNORE INTO user_stats (username) SELECT {row}.username_from WHERE {row}.username_from IS NOT NULL;
+        UPDATE user_stats SET
+            minted = minted {sign} CASE WHEN {row}.type = 'MINT' THEN {row}.amount ELSE 0 END,
+            burned = burned {sign} CASE WHEN {row}.type = 'BURN' THEN {row}.amount ELSE 0 END,
+            transferred_in = transferred_in {sign} CASE WHEN {row}.type = 'TRANSFER' THEN {row}.amount ELSE 0 END
+        WHERE username = {row}.username_to;
+        UPDATE user_stats SET transferred_out = transferred_out {sign} {row}.amount
+        WHERE username = {row}.username_from AND {row}.type = 'TRANSFER';'''
+
+
+def _activity_stats_delta(row, sign):
+    """SQL applying the contribution of a Cron_Activities row (NEW or OLD) to user_stats, with the given sign."""
+    return f'''
+        INSERT OR IGNORE INTO user_stats (username) VALUES ({row}.username);
+        UPDATE user_stats SET
+            pending_activities = pending_activities {sign} ({row}.state = 0),
+            processed_activities = processed_activities {sign} ({row}.state = 1),
+            pending_co2 = pending_co2 {sign} CASE WHEN {row}.state = 0 THEN {row}.co2_reduction ELSE 0 END
+        WHERE username = {row}.username;'''
+
+
+@migration(3, "user_stats aggregates maintained by triggers")
+def _user_stats(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_stats (
+                    username TEXT PRIMARY KEY,
+                    minted INTEGER NOT NULL DEFAULT 0,
+                    burned INTEGER NOT NULL DEFAULT 0,
+                    transferred_in INTEGER NOT NULL DEFAULT 0,
+                    transferred_out INTEGER NOT NULL DEFAULT 0,
+                    pending_activities INTEGER NOT NULL DEFAULT 0,
+                    processed_activities INTEGER NOT NULL DEFAULT 0,
+                    pending_co2 REAL NOT NULL DEFAULT 0
+                    );''')
+
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS user_stats_Transactions_insert
+                    AFTER INSERT ON Transactions
+                    BEGIN {_transaction_stats_delta("NEW", "+")}
+                    END;''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS user_stats_Transactions_update
+                    AFTER UPDATE OF username_from, username_to, amount, type ON Transactions
+                    BEGIN {_transaction_stats_delta("OLD", "-")} {_transaction_stats_delta("NEW", "+")}
+                    END;''')
+    # only the columns the totals depend on, so the update_datetime trigger does not fire it again
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS user_stats_Cron_Activities_insert
+                    AFTER INSERT ON Cron_Activities
+                    BEGIN {_activity_stats_delta("NEW", "+")}
+                    END;''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS user_stats_Cron_Activities_update
+                    AFTER UPDATE OF username, state, co2_reduction ON Cron_Activities
+                    BEGIN {_activity_stats_delta("OLD", "-")} {_activity_stats_delta("NEW", "+")}
+                    END;''')
+
+    # totals of the rows written before this version
+    user_stats.rebuild(conn)
+
+
+@migration(4, "unique index on Products.nftID")
+def _unique_product_nft(conn):
+    # a token maps to one product. Duplicates are user data: they are listed, not deleted here
+    duplicates = duplicate_products(conn)
+    if duplicates:
+        listed = "; ".join(f"nftID {nft_id}: Products ids {', '.join(map(str, ids))}" for nft_id, ids in duplicates[:20])
+        raise MigrationError(f"{len(duplicates)} NFT ids have several Products rows ({listed}). Resolve them, "
+                             f"or keep the most recent row of each with: python -m db.db_migrations --dedupe-products")
+    conn.execute("DROP INDEX IF EXISTS idx_Products_nftID")
+    create_indexes(conn, ["idx_Products_nftID_unique"])
+
+
+@migration(5, "archive_periods catalog of the hot/cold archives")
+def _archive_periods(conn):
+    # one row per archive file written by db.archive
+    conn.execute('''CREATE TABLE IF NOT EXISTS archive_periods (
+                    period TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    start_datetime DATETIME NOT NULL,
+                    end_datetime DATETIME NOT NULL,
+                    transactions INTEGER NOT NULL DEFAULT 0,
+                    activities INTEGER NOT NULL DEFAULT 0,
+                    archived_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );''')
+    # date cutoffs of the archiving runs and the date ranges of the history queries
+    create_indexes(conn, ["idx_Transactions_timestamp", "idx_Cron_Activities_creation_datetime"])
+
+
+# Full-text indexes: name -> (content table, indexed column). Each one is an external content
+# FTS5 table, the text stays in the content table and the index follows it through triggers.
+FTS_TABLES = {
+    "Activities_fts": ("Activities", "description"),
+    "Cron_Activities_fts": ("Cron_Activities", "description"),
+    "Products_fts": ("Products", "name"),
+}
+
+
+@migration(6, "FTS5 indexes on activity descriptions and product names")
+def _full_text_search(conn):
+    for name, (table, column) in FTS_TABLES.items():
+        conn.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(
+                        {column}, content='{table}', content_rowid='id',
+                        tokenize='porter unicode61 remove_diacritics 2'
+                        );''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table}
+                        BEGIN
+                        INSERT INTO {name} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+                        END;''')
+        # archiving deletes rows too: archived activities leave the index
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table}
                         BEGIN
-                        UPDATE Products SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
+                        INSERT INTO {name} ({name}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
                         END;''')
+        # only the indexed column, so the update_datetime triggers do not reindex the row
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF {column} ON {table}
+                        BEGIN
+                        INSERT INTO {name} ({name}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+                        INSERT INTO {name} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+                        END;''')
+        # index the rows written before this version
+        conn.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+
+
+@migration(7, "(username, timestamp) indexes on Transactions")
+def _user_transactions_by_timestamp(conn):
+    # the user transaction listings are ordered by timestamp: each side of a listing is then one
+    # index range already in order, and the single-column indexes are prefixes of the new ones
+    conn.execute("DROP INDEX IF EXISTS idx_Transactions_username_from")
+    conn.execute("DROP INDEX IF EXISTS idx_Transactions_username_to")
+    create_indexes(conn, ["idx_Transactions_username_from_timestamp", "idx_Transactions_username_to_timestamp"])
+
+# ---------- END MIGRATIONS ----------
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the off-chain database schema up to date.")
+    parser.add_argument("--db", default=config.config["db_path"], help="database file (default: configured db_path)")
+    parser.add_argument("--reset", action="store_true", help="drop every table before migrating")
+    parser.add_argument("--fixtures", action="store_true", help="load the sample test records")
+    parser.add_argument("--dedupe-products", action="store_true",
+                        help="keep only the most recent Products row of every NFT id before migrating")
+    args = parser.parse_args()
 
-con.commit()
-con.close()
+    con = sqlite3.connect(args.db)
+    if args.reset:
+        reset_database(con)
+    if args.dedupe_products:
+        for row in remove_duplicate_products(con):
+            print(f"Removed duplicate product: {row}")
+    try:
+        versions = migrate(con)
+    except MigrationError as e:
+        print(f"Migration stopped: {e}")
+        raise SystemExit(1)
+    print(f"Applied migrations: {versions}" if versions else "Schema already up to date.")
+    print(f"Schema version: {current_version(con)}")
+    if args.fixtures:
+        print("Test records loaded." if load_test_fixtures(con) else "Test records already present.")
+    con.close()
@@ -1,16 +1,20 @@
 import datetime
 import sqlite3
-import os
 import hashlib
 import base64
+from contextlib import contextmanager
 from typing import Self
 from cryptography.fernet import Fernet
 from colorama import Fore, Style, init
 from config import config
+from db.connection_manager import get_manager
+from db import archive, db_migrations, password_kdf
+from db.identity_cache import Identity
 from models.accounts import Accounts
 from models.cron_activities import Cron_Activities
 from models.credentials import Credentials
 from models.transaction import Transaction
+from models.user_stats import UserStats
 
 class DatabaseOperations:
     """
@@ -18,153 +22,254 @@ class DatabaseOperations:
     """
     init(convert=True)
 
-    def __init__(self):
-        self.conn = sqlite3.connect(config.config["db_path"])
+    def __init__(self, load_test_records=False):
+        """
+        Borrows a connection from the connection manager and makes sure the schema is up to date.
+        The version check runs once per connection manager, later instances skip it.
+
+        Args:
+            load_test_records (bool): Load the sample test records if the database has none.
+        """
+        self._manager = get_manager()
+        self.conn = self._manager.acquire()
         self.cur = self.conn.cursor()
-        self._create_new_table()
-        self.insert_test_records()
+        self._identities = self._manager.identities
+        if not self._manager.schema_ready:
+            db_migrations.migrate(self.conn)
+            self._manager.schema_ready = True
+        if load_test_records:
+            self.insert_test_records()
         self.today_date = datetime.date.today().strftime('%Y-%m-%d')
 
-    def _create_new_table(self):
-        """
-        Creates necessary tables in the database if they are not already present.
-        This ensures that the database schema is prepared before any operations are performed.
-        """
-        #self.cur.execute("DROP TABLE IF EXISTS Credentials")
-        #self.cur.execute("DROP TABLE IF EXISTS Accounts")
-        self.cur.execute("DROP TABLE IF EXISTS Activities")
-        self.cur.execute("DROP TABLE IF EXISTS Accounts_Activities")
-        self.cur.execute("DROP TABLE IF EXISTS Cron_Activities")
-        self.cur.execute("DROP TABLE IF EXISTS Licences")
-        self.cur.execute("DROP TABLE IF EXISTS Products")
-        self.cur.execute("DROP TABLE IF EXISTS Transactions")
-
-        self.cur.execute('''CREATE TABLE IF NOT EXISTS Credentials (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT NOT NULL UNIQUE,
-                        password TEXT NOT NULL,
-                        public_key TEXT NOT NULL,
-                        private_key TEXT NOT NULL,
-                        temp_code TEXT,
-                        temp_code_validity DATETIME,
-                        update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                        creation_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
-                        );''')
-
-        # trigger for automatic update of update_datetime
-        self.cur.execute('''CREATE TRIGGER IF NOT EXISTS update_Credentials_timestamp
-                        AFTER UPDATE ON Credentials
-                        FOR EACH ROW
-                        BEGIN
-                        UPDATE Credentials SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
-                        END;''')
+    def close(self):
+        """
+        Gives the borrowed connection back to the connection manager.
+        The instance must not be used after calling this method.
+        """
+        if self.conn is not None:
+            self.cur.close()
+            self._manager.release(self.conn)
+            self.conn = None
 
-        
-        self.cur.execute('''CREATE TABLE IF NOT EXISTS Accounts (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT NOT NULL,
-                        type TEXT CHECK(type IN ('FARMER', 'CARRIER', 'SELLER', 'PRODUCER', 'CERTIFIER')) NOT NULL,
-                        name TEXT NOT NULL,
-                        lastname TEXT NOT NULL,
-                        birthday TEXT NOT NULL,
-                        birth_place TEXT,
-                        residence TEXT,
-                        phone TEXT,
-                        mail TEXT,
-                        FOREIGN KEY (username) REFERENCES Credentials(username)
-                        );''')
-
-       
-
-
-        self.cur.execute('''CREATE TABLE IF NOT EXISTS Activities (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        type TEXT CHECK(type IN ('investment in a project for reduction', 'performing an action')) NOT NULL,
-                        description TEXT NOT NULL
-                        );''')
-
-
-        self.cur.execute('''CREATE TABLE IF NOT EXISTS Accounts_Activities (
-                        username TEXT NOT NULL,
-                        activity_id INTEGER NOT NULL,
-                        PRIMARY KEY (username, activity_id),
-                        FOREIGN KEY (username) REFERENCES Credentials(username),
-                        FOREIGN KEY (activity_id) REFERENCES Activities(id)
-                        );''')
-
-
-        self.cur.execute('''CREATE TABLE IF NOT EXISTS Cron_Activities (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        description TEXT NOT NULL,
-                        username TEXT NOT NULL,
-                        update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                        creation_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                        state INTEGER NOT NULL CHECK(state IN (0, 1, 2)),
-                        activity_id INTEGER NOT NULL,
-                        co2_reduction DECIMAL NOT NULL,
-                        FOREIGN KEY (username) REFERENCES Credentials(username),
-                        FOREIGN KEY (activity_id) REFERENCES Activities(id)
-                        );''')
-
-        # trigger for automatic update of update_datetime
-        self.cur.execute('''CREATE TRIGGER IF NOT EXISTS update_Cron_Activities_timestamp
-                        AFTER UPDATE ON Cron_Activities
-                        FOR EACH ROW
-                        BEGIN
-                        UPDATE Cron_Activities SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
-                        END;''')
-
-        self.cur.execute('''CREATE TABLE IF NOT EXISTS Products (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        category TEXT CHECK(category IN ('FRUIT', 'MEAT', 'DAIRY')) NOT NULL,
-                        co2Emission INTEGER NOT NULL,
-                        nftID INTEGER NOT NULL,
-                        harvestDate DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                        update_datetime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
-                        );''')
-
-        # trigger for automatic update of update_datetime
-        self.cur.execute('''CREATE TRIGGER IF NOT EXISTS update_Products_timestamp
-                        AFTER UPDATE ON Products
-                        FOR EACH ROW
-                        BEGIN
-                        UPDATE Products SET update_datetime = CURRENT_TIMESTAMP WHERE id = OLD.id;
-                        END;''')
-
-        self.cur.execute('''CREATE TABLE Transactions (
-                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         username_from TEXT,
-                         username_to TEXT,
-                         amount INTEGER NOT NULL,
-                         type TEXT CHECK(type IN ('MINT', 'BURN', 'TRANSFER')) NOT NULL,
-                         tx_hash TEXT,
-                         timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
-                         );
-                         ''')
-
-        self.conn.commit()
+    def __del__(self):
+        """Releases the borrowed connection when the instance is garbage collected."""
+        if getattr(self, "conn", None) is not None:
+            self.close()
 
     def insert_test_records(self):
+        """
+        Loads the sample activities and products used for manual testing.
+        Nothing is inserted if the database already contains activities.
+
+        Returns:
+            bool: True if the records were inserted, False if they were already present.
+        """
+        return db_migrations.load_test_fixtures(self.conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Unit of work spanning several DatabaseOperations calls:
+
+            with db.transaction():
+                db.update_activity_state(activity_id, 2)
+                db.insert_transaction(certifier, username, amount, 'BURN', tx_hash)
+
+        Inside the block the methods do not commit, everything is committed once when the
+        outermost block exits and rolled back if it raises. A write failing inside the block raises
+        its sqlite3 error instead of returning -1, so the block never commits partial work.
+        Nested blocks run under a savepoint: an exception leaving a nested block only undoes
+        the work of that block.
+        The scope belongs to the connection, so it also covers other DatabaseOperations
+        instances (e.g. Controllers) used on the same thread.
+
+        Yields:
+            DatabaseOperations: This instance.
+        """
+        conn = self.conn
+        savepoint = f"unit_of_work_{conn.tx_depth}"
+        if conn.tx_depth == 0:
+            # a statement that failed outside a unit of work (e.g. an IntegrityError answered with -1)
+            # leaves open the implicit transaction sqlite3 began for it. Whatever it holds was never
+            # committed by its writer, so it is rolled back rather than made part of this unit of work
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("BEGIN")
+        else:
+            conn.execute(f"SAVEPOINT {savepoint}")
+        conn.tx_depth += 1
+        try:
+            yield self
+        except BaseException:
+            conn.tx_depth -= 1
+            if conn.tx_depth == 0:
+                conn.rollback()
+                self._run_after_transaction()
+            else:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            raise
+        conn.tx_depth -= 1
+        if conn.tx_depth == 0:
+            conn.commit()
+            self._run_after_transaction()
+        else:
+            conn.execute(f"RELEASE {savepoint}")
+
+    def _run_after_transaction(self):
+        callbacks = list(self.conn.after_transaction)
+        self.conn.after_transaction.clear()
+        for callback in callbacks:
+            callback()
+
+    def _commit(self):
+        """
+        Commits the pending changes, unless a unit of work opened with transaction() is active;
+        in that case the commit is left to the end of the unit of work.
+        """
+        if self.conn.tx_depth == 0:
+            self.conn.commit()
+
+    def _failed(self):
+        """
+        Result of a write whose statement raised, to be called from its except block: -1 outside
+        a unit of work. Inside one, the exception is raised again so that the with block rolls
+        back instead of committing the writes that succeeded around it.
+
+        Returns:
+            int: -1
+        """
+        if self.conn.tx_depth > 0:
+            raise
+        return -1
+
+    def _invalidate_identity(self, **keys):
+        """
+        Drops the cached identities matching the given keys after a write to Credentials or Accounts.
+        Inside a unit of work they are dropped again when it ends, so that an identity read by
+        another thread before the commit does not outlive it.
+
+        Args:
+            **keys: username, public_key and/or credentials_id, see IdentityCache.invalidate.
+        """
+        self._identities.invalidate(**keys)
+        if self.conn.tx_depth > 0:
+            self.conn.after_transaction.append(lambda: self._identities.invalidate(**keys))
+
+    def _insert_many(self, query, rows, chunk_size=None):
+        """
+        Inserts many rows with executemany, in chunks, inside a single transaction.
 
-        self.cur.execute('''INSERT INTO Activities (type, description) VALUES
-                            ('investment in a project for reduction', 'Investing in solar panels'),
-                            ('performing an action', 'Using electric vehicles for transport');''')
+        Each chunk runs under a savepoint. If a chunk hits an integrity error it is rolled back
+        and replayed row by row, so that only the offending rows are rejected and the rest of
+        the batch is still inserted.
 
-        self.cur.execute('''INSERT INTO Accounts_Activities (username, activity_id) VALUES
-                            ('farmer_user', 1),
-                            ('carrier_user', 2);''')
+        Args:
+            query (str): Parametrized INSERT statement.
+            rows (iterable): Iterable of parameter tuples, consumed lazily.
+            chunk_size (int, optional): Rows per executemany call, bulk_chunk_size from the configuration if None.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+
+        Raises:
+            sqlite3.Error: Any error other than an integrity error; the whole batch is rolled back
+                           (up to the enclosing savepoint when called inside a unit of work).
+        """
+        chunk_size = chunk_size or config.config.get("bulk_chunk_size", 500)
+        inserted = 0
+        failures = []
+
+        def flush(chunk, offset):
+            nonlocal inserted
+            self.cur.execute("SAVEPOINT bulk_chunk")
+            try:
+                self.cur.executemany(query, chunk)
+                inserted += len(chunk)
+            except sqlite3.IntegrityError:
+                self.cur.execute("ROLLBACK TO bulk_chunk")
+                for index, row in enumerate(chunk):
+                    try:
+                        self.cur.execute(query, row)
+                        inserted += 1
+                    except sqlite3.IntegrityError as e:
+                        failures.append((offset + index, str(e)))
+            self.cur.execute("RELEASE bulk_chunk")
+
+        with self.transaction():
+            chunk = []
+            offset = 0
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    flush(chunk, offset)
+                    offset += len(chunk)
+                    chunk = []
+            if chunk:
+                flush(chunk, offset)
+
+        return inserted, failures
+
+    def _model_cursor(self, model):
+        """
+        Returns a new cursor whose rows come back as instances of the given model.
+
+        Args:
+            model (type): Model class whose constructor follows the column order of the table.
+
+        Returns:
+            sqlite3.Cursor: The cursor, with model.from_row as row factory.
+        """
+        cur = self.conn.cursor()
+        cur.row_factory = model.from_row
+        return cur
 
-        self.cur.execute('''INSERT INTO Cron_Activities (description, username, state, activity_id, co2_reduction) VALUES
-                            ('Solar panel investment', 'farmer_user', 0, 1, 50.0),
-                            ('Electric vehicle implementation', 'carrier_user', 0, 2, 30.5);''')
+    def _iter_keyset(self, build_query, model, after_id=None, limit=None, page_size=None, stream=False, key=None):
+        """
+        Yields model instances page by page with keyset pagination, on the id column unless a key is given.
 
-        self.cur.execute('''INSERT INTO Products (name, category, co2Emission, nftID) VALUES
-                            ('Apple', 'FRUIT', 10, 0),
-                            ('Beef', 'MEAT', 50, 1),
-                            ('Cheese', 'DAIRY', 20, 2);''')
+        In page mode every page is a separate short query ("id after the last one seen"), so no
+        cursor or read transaction stays open while the caller consumes the rows. In stream mode
+        a single query is run on a dedicated cursor and read with fetchmany().
 
-        self.conn.commit()
+        Args:
+            build_query (callable): (after_id, count) -> (sql, params); count is None in stream mode.
+            model (type): Model class the rows are returned as.
+            after_id (optional): Keyset cursor, only rows after it are returned.
+            limit (int, optional): Maximum number of rows to yield, unlimited if None.
+            page_size (int, optional): Rows per page, page_size from the configuration if None.
+            stream (bool): Use one streaming cursor instead of one query per page.
+            key (callable, optional): row -> keyset cursor after that row, the row id if None.
+
+        Yields:
+            The objects built by model, in keyset order.
+        """
+        page_size = page_size or config.config.get("page_size", 500)
+        cur = self._model_cursor(model)
+        try:
+            if stream:
+                sql, params = build_query(after_id, None)
+                if limit is not None:
+                    sql += " LIMIT ?"
+                    params = (*params, limit)
+                cur.execute(sql, params)
+                while rows := cur.fetchmany(page_size):
+                    yield from rows
+                return
+
+            remaining = limit
+            while remaining is None or remaining > 0:
+                count = page_size if remaining is None else min(page_size, remaining)
+                sql, params = build_query(after_id, count)
+                rows = cur.execute(sql + " LIMIT ?", (*params, count)).fetchall()
+                yield from rows
+                if len(rows) < count:
+                    return
+                after_id = rows[-1].get_id() if key is None else key(rows[-1])
+                if remaining is not None:
+                    remaining -= len(rows)
+        finally:
+            cur.close()
 
 # ---------- ACCOUNTS ----------
 
@@ -207,10 +312,38 @@ class DatabaseOperations:
                                 phone,
                                 mail
                             ))
-            self.conn.commit()
+            self._commit()
+            self._invalidate_identity(username=username)
             return 0
         except sqlite3.IntegrityError as e:
-            return -1
+            return self._failed()
+
+    def insert_actors_many(self, actors, chunk_size=None):
+        """
+        Inserts many actor records into the Accounts table in a single transaction.
+
+        Args:
+            actors (iterable): Tuples of (role, username, name, lastname, residence, birthdayPlace, birthday, mail, phone),
+                               the arguments of insert_actor.
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        usernames = []
+
+        def rows():
+            for role, username, name, lastname, residence, birthdayPlace, birthday, mail, phone in actors:
+                usernames.append(username)
+                yield username, role, name, lastname, birthday, birthdayPlace, residence, phone, mail
+
+        result = self._insert_many("""
+                INSERT INTO Accounts
+                (username, type, name, lastname, birthday, birth_place, residence, phone, mail)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows(), chunk_size)
+        for username in usernames:
+            self._invalidate_identity(username=username)
+        return result
  
     def update_account(self, username, name, lastname, birthday, birth_place, residence, phone, mail, id):
         """
@@ -234,16 +367,21 @@ class DatabaseOperations:
             int: 0 if the update is successful, -1 if a database error occurs.
         """
         try:
+            previous = self.cur.execute("SELECT username FROM Accounts WHERE id = ?", (id,)).fetchone()
             self.cur.execute("""
             UPDATE Accounts 
             SET username = ?, name = ?, lastname = ?, birthday = ?, 
                 birth_place = ?, residence = ?, phone = ?, mail = ? 
             WHERE id = ?""",
             (username, name, lastname, birthday, birth_place, residence, phone, mail, id))
-            self.conn.commit()
+            self._commit()
+            # the role of an identity comes from Accounts: a renamed account changes two of them
+            self._invalidate_identity(username=username)
+            if previous is not None and previous[0] != username:
+                self._invalidate_identity(username=previous[0])
             return 0
         except sqlite3.Error:
-            return -1
+            return self._failed()
 
     def get_users(self):
         """
@@ -252,11 +390,27 @@ class DatabaseOperations:
         Returns:
             list: A list of Accounts instances representing all users in the system.
         """
-        self.cur.execute("SELECT * FROM Accounts")
+        return self._model_cursor(Accounts).execute("SELECT * FROM Accounts").fetchall()
+
+    def iter_users(self, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the Accounts table in id order, see _iter_keyset for the modes.
 
-        users = [Accounts(id, username, role, name,  lastname, birthday, birth_place, residence, phone, mail)
-                 for id, username, role, name,  lastname, birthday, birth_place, residence, phone, mail in self.cur.fetchall()]
-        return users
+        Args:
+            after_id (int, optional): Only accounts with a greater id are returned.
+            limit (int, optional): Maximum number of accounts to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Yields:
+            Accounts: One instance per account.
+        """
+        def build_query(after, count):
+            if after is None:
+                return "SELECT * FROM Accounts ORDER BY id", ()
+            return "SELECT * FROM Accounts WHERE id > ? ORDER BY id", (after,)
+
+        return self._iter_keyset(build_query, Accounts, after_id, limit, page_size, stream)
 
     def get_user_by_username(self, username):
         """
@@ -268,15 +422,11 @@ class DatabaseOperations:
         Returns:
             Accounts: An instance of the Accounts class if the user exists, otherwise, None.
         """
-        user = self.cur.execute("""
+        return self._model_cursor(Accounts).execute("""
                                     SELECT *
                                     FROM Accounts
                                     WHERE Accounts.username = ?""", (username,)).fetchone()
 
-        if user is not None:
-            return Accounts(*user)
-        return None
-
     def check_unique_email(self, mail):
         """
         Checks if an email address is unique within the Accounts table in the database.
@@ -334,10 +484,24 @@ class DatabaseOperations:
         try:
             self.cur.execute("INSERT INTO Accounts_Activities (username, activity_id) VALUES (?, ?)",
                            (username, activity_id))
-            self.conn.commit()
+            self._commit()
             return 0
         except sqlite3.IntegrityError:
-            return -1
+            return self._failed()
+
+    def register_account_activities_many(self, links, chunk_size=None):
+        """
+        Inserts many associations between accounts and activities in a single transaction.
+
+        Args:
+            links (iterable): Tuples of (username, activity_id).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self._insert_many("INSERT INTO Accounts_Activities (username, activity_id) VALUES (?, ?)",
+                                 links, chunk_size)
 
 # ---------- END ACCOUNTS_ACTVITIES ----------
 
@@ -361,10 +525,24 @@ class DatabaseOperations:
             VALUES (?, ?)""",
              (type, description))
             activity_id = self.cur.lastrowid 
-            self.conn.commit()
+            self._commit()
             return activity_id
         except sqlite3.IntegrityError:
-            return -1
+            return self._failed()
+
+    def register_activities_many(self, activities, chunk_size=None):
+        """
+        Inserts many activity records into the Activities table in a single transaction.
+        The ids are given in insertion order, from the next free one.
+
+        Args:
+            activities (iterable): Tuples of (type, description).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self._insert_many("INSERT INTO Activities (type, description) VALUES (?, ?)", activities, chunk_size)
 
 # ---------- END ACTIVITIES ----------
 
@@ -396,13 +574,39 @@ class DatabaseOperations:
                     INSERT INTO Credentials (username, password, public_key, private_key, temp_code, temp_code_validity)
                     VALUES (?, ?, ?, ?, ?, ?)""",
                     (username, hashed_passwd, public_key, obfuscated_private_k, temp_code, temp_code_validity))
-                self.conn.commit()
+                self._commit()
+                self._invalidate_identity(username=username, public_key=public_key)
                 return 0
             else:
                 return -1
         except sqlite3.IntegrityError as e:
             print(Fore.RED + f'Internal error: {e}' + Style.RESET_ALL)
-            return -1
+            return self._failed()
+
+    def register_creds_many(self, credentials, chunk_size=None, kdf_params=None):
+        """
+        Registers many credentials records in a single transaction, e.g. for bulk onboarding.
+        The passwords are hashed in parallel in the KDF pool, usernames already taken are rejected.
+
+        Args:
+            credentials (iterable): Tuples of (username, password, public_key, private_key).
+            chunk_size (int, optional): Rows per executemany call.
+            kdf_params (password_kdf.KdfParams, optional): scrypt cost, the configured one if None.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        credentials = list(credentials)
+        hashes = password_kdf.hash_many((password for _, password, _, _ in credentials), kdf_params)
+        result = self._insert_many("""
+                INSERT INTO Credentials (username, password, public_key, private_key)
+                VALUES (?, ?, ?, ?)""",
+                ((username, hashed_passwd, public_key, self.encrypt_private_k(private_key, password))
+                 for (username, password, public_key, private_key), hashed_passwd in zip(credentials, hashes)),
+                chunk_size)
+        for username, _, public_key, _ in credentials:
+            self._invalidate_identity(username=username, public_key=public_key)
+        return result
 
     def change_password(self, username, new_pass):
         """
@@ -419,10 +623,10 @@ class DatabaseOperations:
         new_hash = self.hash_function(new_pass)
         try:
             self.cur.execute("UPDATE Credentials SET password = ? WHERE username = ?", (new_hash, username))
-            self.conn.commit()
+            self._commit()
             return 0
         except Exception:
-            return -1
+            return self._failed()
 
     def delete_creds(self, id):
         """
@@ -437,7 +641,8 @@ class DatabaseOperations:
         """
         try:
             self.cur.execute("DELETE FROM Credentials WHERE id = ?", (id,))
-            self.conn.commit()
+            self._commit()
+            self._invalidate_identity(credentials_id=id)
 
             if self.cur.rowcount > 0:
                 print(Fore.GREEN + "Information deleted correctly!\n" + Style.RESET_ALL)
@@ -448,7 +653,44 @@ class DatabaseOperations:
 
         except sqlite3.Error as e:
             print(Fore.RED + f'Error deleting credentials: {e}' + Style.RESET_ALL)
-            return -1
+            return self._failed()
+
+    def get_identity(self, username=None, public_key=None):
+        """
+        Retrieves the identity of a user, by username or by public key, through the identity cache.
+
+        Args:
+            username (str, optional): The username of the user.
+            public_key (str, optional): The public key of the user, used if username is None.
+
+        Returns:
+            Identity or None: (username, public_key, role, credentials_id) if the user has credentials,
+                              otherwise None. role is None until the account is inserted.
+        """
+        identity = self._identities.get(username, public_key)
+        if identity is not None:
+            return identity
+
+        column, value = ("username", username) if username is not None else ("public_key", public_key)
+        row = self.cur.execute(f"""
+                SELECT c.username, c.public_key, a.type, c.id
+                FROM Credentials c
+                LEFT JOIN Accounts a ON a.username = c.username
+                WHERE c.{column} = ?""", (value,)).fetchone()
+        if row is None:
+            return None
+        identity = Identity(*row)
+        # rows read inside an open transaction may still be rolled back
+        if not self.conn.in_transaction:
+            self._identities.put(identity)
+        return identity
+
+    def identity_cache_stats(self):
+        """
+        Returns:
+            dict: hits, misses, size and maxsize of the identity cache.
+        """
+        return self._identities.stats()
 
     def get_credentials_id_by_username(self, username):
         """
@@ -461,12 +703,8 @@ class DatabaseOperations:
             int or None: The ID of the credentials record if found, otherwise None.
         """
         try:
-            self.cur.execute("SELECT id FROM Credentials WHERE username = ?", (username,))
-            result = self.cur.fetchone()
-            if result:
-                return result[0]
-            else:
-                return None
+            identity = self.get_identity(username)
+            return identity.credentials_id if identity else None
         except sqlite3.Error as e:
             print(Fore.RED + f"Error retrieving credentials ID: {e}" + Style.RESET_ALL)
             return None
@@ -482,13 +720,10 @@ class DatabaseOperations:
             Credentials: A Credentials object containing the user's credentials if found.
             None: If no credentials are found for the given username.
         """
-        creds = self.cur.execute("""
+        return self._model_cursor(Credentials).execute("""
                                 SELECT *
                                 FROM Credentials
                                 WHERE username=?""", (username,)).fetchone()
-        if creds is not None:
-            return Credentials(*creds)
-        return None
 
     def get_public_key_by_username(self, username):
         """
@@ -501,12 +736,8 @@ class DatabaseOperations:
             str: The public key of the user if found, None otherwise.
         """
         try:
-            self.cur.execute("SELECT public_key FROM Credentials WHERE username = ?", (username,))
-            result = self.cur.fetchone()
-            if result:
-                return result[0]  # Return the public key
-            else:
-                return None  # Public key not found
+            identity = self.get_identity(username)
+            return identity.public_key if identity else None
         except Exception as e:
             print(Fore.RED + f"An error occurred while retrieving public key: {e}" + Style.RESET_ALL)
             return None
@@ -541,10 +772,8 @@ class DatabaseOperations:
         Returns:
             str or None: The username linked to the public key if found, otherwise None.
         """
-        self.cur.execute(
-            "SELECT username FROM Credentials WHERE public_key = ?", (public_key,))
-        result = self.cur.fetchone()
-        return result[0] if result else None
+        identity = self.get_identity(public_key=public_key)
+        return identity.username if identity else None
 
     def check_username(self, username):
         """
@@ -573,9 +802,14 @@ class DatabaseOperations:
         result = self.cur.execute("SELECT password FROM Credentials WHERE username = ?", (username,)).fetchone()
         if result:
             saved_hash = result[0]
-            params = saved_hash.split('$')
-            hashed_passwd = hashlib.scrypt(password.encode(), salt=bytes.fromhex(params[1]), n=2, r=8, p=1, dklen=64)
-            return hashed_passwd.hex() == params[0]
+            if not password_kdf.verify_password(password, saved_hash):
+                return False
+            # the KDF cost changed since the hash was stored: store it again with the current one
+            if password_kdf.needs_rehash(saved_hash):
+                self.cur.execute("UPDATE Credentials SET password = ? WHERE username = ? AND password = ?",
+                                 (password_kdf.hash_password(password), username, saved_hash))
+                self._commit()
+            return True
         return False
 
     def key_exists(self, public_key, private_key):
@@ -626,33 +860,166 @@ class DatabaseOperations:
                 VALUES (?, ?, ?, ?, ?)""",
                 (description, username, state, activity_id, co2_reduction)
             )
-            self.conn.commit()
+            self._commit()
             return 0  # Success
         except sqlite3.IntegrityError as e:
             print(Fore.RED + f'Error inserting cron activity: {e}' + Style.RESET_ALL)
-            return -1  # Error
+            return self._failed()
+
+    def register_cron_activities_many(self, activities, chunk_size=None):
+        """
+        Inserts many records into the Cron_Activities table in a single transaction.
+
+        Args:
+            activities (iterable): Tuples of (description, username, state, activity_id, co2_reduction).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        inserted, failures = self._insert_many("""
+                INSERT INTO Cron_Activities (description, username, state, activity_id, co2_reduction)
+                VALUES (?, ?, ?, ?, ?)""", activities, chunk_size)
+        for index, error in failures:
+            print(Fore.RED + f'Error inserting cron activity #{index}: {error}' + Style.RESET_ALL)
+        return inserted, failures
 
     def update_activity_state(self, activitie_id, state):
         """
         Updates the state of a specific activity identified by its activity_id.
+        Archived activities (see db.archive) are processed ones and are not updated.
 
         Args:
             activitie_id (int): The unique identifier of the activity to update.
             state (int): The new state value to set for the activity.
 
         Returns:
-            int: 0 if the update is successful, -1 if a database error occurs.
+            int: 0 if the update is successful, -1 if a database error occurs or the activity is archived.
         """
         try:
-            self.cur.execute("""
+            updated = self.cur.execute("""
             UPDATE Cron_Activities 
             SET state = ? 
             WHERE activity_id = ?""",
-            (state, activitie_id))
-            self.conn.commit()
+            (state, activitie_id)).rowcount
+            self._commit()
+            if not updated and self._archived_activity("state", activitie_id) is not None:
+                return -1
             return 0
         except sqlite3.Error:
-            return -1
+            return self._failed()
+
+    def _archived_activity(self, column, activity_id):
+        """
+        Reads a column of an activity moved to the archive files, once the main table has none.
+
+        Returns:
+            The value, None if no archive holds the activity.
+        """
+        query = f"SELECT {column} FROM Cron_Activities WHERE activity_id = ? LIMIT 1"
+        rows = archive.query_archives(archive.archives_for_range(self.conn), query, (activity_id,))
+        return rows[0][0] if rows else None
+
+    _ACTIVITY_COLUMNS = ("id", "description", "username", "update_datetime", "creation_datetime",
+                         "state", "activity_id", "co2_reduction")
+
+    def query_activities(self, username=None, states=None, activity_id=None, date_from=None, date_to=None,
+                         date_column="creation_datetime", order_by="id", descending=False, limit=None,
+                         columns=None, key_by_id=False):
+        """
+        Single parametrized query over Cron_Activities, every filter is optional and they are combined with AND.
+
+        Args:
+            username (str, optional): Only activities of this user.
+            states (iterable of int, optional): Only activities whose state is in this set.
+            activity_id (int, optional): Only records of this activity (Activities id).
+            date_from (str, optional): Only records whose date_column is >= this date ('YYYY-MM-DD[ HH:MM:SS]').
+            date_to (str, optional): Only records whose date_column is < this date.
+            date_column (str): 'creation_datetime' or 'update_datetime', the column the date range applies to.
+            order_by (str): Column to sort by, id if not given.
+            descending (bool): Sort in descending order.
+            limit (int, optional): Maximum number of records.
+            columns (iterable of str, optional): Project only these columns; the rows are then
+                                                 sqlite3.Row objects instead of Cron_Activities.
+            key_by_id (bool): Return a dict id -> row (in sort order) instead of a list,
+                              so that membership checks on the ids are O(1).
+
+        When a date range is given and reaches archived periods (see db.archive), the processed
+        activities moved to the archive files are included; without a date range only the
+        activities of the main table are read.
+
+        Returns:
+            list or dict: The matching rows, see columns and key_by_id.
+
+        Raises:
+            ValueError: If a column name is not a Cron_Activities column.
+        """
+        for name in (date_column, order_by, *(columns or ())):
+            if name not in self._ACTIVITY_COLUMNS:
+                raise ValueError(f"Unknown Cron_Activities column '{name}'.")
+
+        conditions, params = [], []
+        if username is not None:
+            conditions.append("username = ?")
+            params.append(username)
+        if states is not None:
+            states = sorted(set(states))
+            conditions.append(f"state IN ({', '.join('?' * len(states))})")
+            params.extend(states)
+        if activity_id is not None:
+            conditions.append("activity_id = ?")
+            params.append(activity_id)
+        if date_from is not None:
+            conditions.append(f"{date_column} >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append(f"{date_column} < ?")
+            params.append(date_to)
+
+        archives = []
+        if (date_from is not None or date_to is not None) and (states is None or any(states)):
+            # archived activities are processed ones, grouped in periods by creation_datetime
+            archives = archive.archives_for_range(self.conn, date_from if date_column == "creation_datetime" else None,
+                                                  date_to)
+
+        if columns is None:
+            row_factory = Cron_Activities.from_row
+            projection = "*"
+        else:
+            columns = list(columns)
+            # the rows read from the archives are merged on the sort key
+            for name in ("id", order_by) if key_by_id or archives else ():
+                if name not in columns:
+                    columns.insert(0, name)
+            row_factory = sqlite3.Row
+            projection = ", ".join(columns)
+        cur = self.conn.cursor()
+        cur.row_factory = row_factory
+
+        query = f"SELECT {projection} FROM Cron_Activities"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}"
+        if order_by != "id":
+            query += f", id {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        rows = cur.execute(query, params).fetchall()
+        if archives:
+            rows += archive.query_archives(archives, query, params, row_factory)
+            if columns is None:
+                sort_key = lambda row: (getattr(row, order_by), row.id)
+            else:
+                sort_key = lambda row: (row[order_by], row["id"])
+            rows.sort(key=sort_key, reverse=descending)
+            rows = rows[:limit] if limit is not None else rows
+        if not key_by_id:
+            return rows
+        if columns is None:
+            return {row.get_id(): row for row in rows}
+        return {row["id"]: row for row in rows}
 
     def get_activities_to_be_processed(self):
         """
@@ -661,11 +1028,25 @@ class DatabaseOperations:
         Returns:
             list: A list of Cron_Activities objects representing unprocessed activities.
         """
-        self.cur.execute("SELECT * FROM Cron_Activities WHERE state = 0")
+        return self.query_activities(states=(0,))
+
+    def iter_activities_to_be_processed(self, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the activities that have not been processed yet, in id order.
+
+        Args:
+            after_id (int, optional): Only activities with a greater id are returned.
+            limit (int, optional): Maximum number of activities to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Yields:
+            Cron_Activities: One instance per pending activity.
+        """
+        def build_query(after, count):
+            return "SELECT * FROM Cron_Activities WHERE state = 0 AND id > ? ORDER BY id", (after or 0,)
 
-        activities = [Cron_Activities(id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction)
-                      for id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction in self.cur.fetchall()]
-        return activities
+        return self._iter_keyset(build_query, Cron_Activities, after_id, limit, page_size, stream)
 
     def get_activities_by_username(self, username):
         """
@@ -677,11 +1058,26 @@ class DatabaseOperations:
         Returns:
             list: A list of Cron_Activities objects related to the given user.
         """
-        self.cur.execute("SELECT * FROM Cron_Activities WHERE username = ?", (username,))
+        return self.query_activities(username=username)
 
-        activities = [Cron_Activities(id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction)
-                      for id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction in self.cur.fetchall()]
-        return activities
+    def iter_activities_by_username(self, username, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the activities of a given username, in id order.
+
+        Args:
+            username (str): The username for which to retrieve activities.
+            after_id (int, optional): Only activities with a greater id are returned.
+            limit (int, optional): Maximum number of activities to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Yields:
+            Cron_Activities: One instance per activity of the user.
+        """
+        def build_query(after, count):
+            return "SELECT * FROM Cron_Activities WHERE username = ? AND id > ? ORDER BY id", (username, after or 0)
+
+        return self._iter_keyset(build_query, Cron_Activities, after_id, limit, page_size, stream)
 
     def get_activities_to_be_processed_by_username(self, username):
         """
@@ -694,12 +1090,7 @@ class DatabaseOperations:
             list of Cron_Activities: A list of Cron_Activities objects representing activities
                                         with state = 0 (to be processed) for the specified user.
         """
-        self.cur.execute("SELECT * FROM Cron_Activities WHERE username = ? AND state = 0", (username,))
-
-        activities = [Cron_Activities(id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction)
-                      for id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction in self.cur.fetchall()]
-
-        return activities
+        return self.query_activities(username=username, states=(0,))
 
     def get_activities_processed_by_username(self, username):
         """
@@ -712,16 +1103,12 @@ class DatabaseOperations:
             list of Cron_Activities: A list of Cron_Activities objects representing activities
                                      with state = 1 (processed) for the specified user.
         """
-        self.cur.execute("SELECT * FROM Cron_Activities WHERE username = ? AND state = 1", (username,))
-
-        activities = [Cron_Activities(id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction)
-                      for id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction in self.cur.fetchall()]
-
-        return activities
+        return self.query_activities(username=username, states=(1,))
 
     def get_co2Amount_by_activity(self, activity_id):
         """
         Retrieves the total amount of CO2 reduction associated with a specific activity.
+        An activity moved to the archive files (see db.archive) is read there.
 
         Args:
             activity_id (int): The unique identifier of the activity.
@@ -732,11 +1119,12 @@ class DatabaseOperations:
         """
         co2Amount = self.cur.execute(
             "SELECT co2_reduction FROM Cron_Activities WHERE activity_id = ?", (activity_id,)).fetchone()
-        return co2Amount[0] if co2Amount else None
+        return co2Amount[0] if co2Amount else self._archived_activity("co2_reduction", activity_id)
 
     def get_state_by_activity(self, activity_id):
         """
         Retrieves the current state of a specific activity by its activity_id.
+        An activity moved to the archive files (see db.archive) is read there.
 
         Args:
             activity_id (int): The unique identifier of the activity.
@@ -746,7 +1134,7 @@ class DatabaseOperations:
         """
         state = self.cur.execute(
             "SELECT state FROM Cron_Activities WHERE activity_id = ?", (activity_id,)).fetchone()
-        return state[0] if state else None
+        return state[0] if state else self._archived_activity("state", activity_id)
 
 # ---------- END CRON_ACTIVITIES ----------
 
@@ -772,17 +1160,73 @@ class DatabaseOperations:
                 INSERT INTO Products (name, category, co2Emission, nftID)
                 VALUES (?, ?, ?, ?)""",
                 (name, category, co2Emission, nft_token_id))
-            self.conn.commit()
+            self._commit()
             return 0
         except sqlite3.IntegrityError:
-            return -1
+            return self._failed()
+
+    def insert_products_many(self, products, chunk_size=None):
+        """
+        Inserts many product records into the Products table in a single transaction.
+
+        Parameters:
+            products (iterable): Tuples of (name, category, co2Emission, nft_token_id).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self._insert_many("""
+                INSERT INTO Products (name, category, co2Emission, nftID)
+                VALUES (?, ?, ?, ?)""", products, chunk_size)
+
+    _UPSERT_PRODUCT = """
+                INSERT INTO Products (name, category, co2Emission, nftID)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (nftID) DO UPDATE SET
+                    name = excluded.name,
+                    category = excluded.category,
+                    co2Emission = excluded.co2Emission"""
+
+    def upsert_product(self, name, category, co2Emission, nft_token_id):
+        """
+        Inserts the product of an NFT token, or updates it if the token already has one.
+
+        Parameters:
+            name (str): The name of the product.
+            category (str): The category to which the product belongs.
+            co2Emission (float): The CO2 emissions associated with the product.
+            nft_token_id (int): The ID of the associated NFT token, unique among the products.
+
+        Returns:
+            int: 0 if the product was written, -1 if a database integrity error occurs.
+        """
+        try:
+            self.cur.execute(self._UPSERT_PRODUCT, (name, category, co2Emission, nft_token_id))
+            self._commit()
+            return 0
+        except sqlite3.IntegrityError:
+            return self._failed()
+
+    def upsert_products_many(self, products, chunk_size=None):
+        """
+        Batch version of upsert_product, in a single transaction.
+
+        Parameters:
+            products (iterable): Tuples of (name, category, co2Emission, nft_token_id).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of written rows, list of (row index, error message) for the rejected rows).
+        """
+        return self._insert_many(self._UPSERT_PRODUCT, products, chunk_size)
 
     def update_product(self, product_id, co2Emission=None):
         """
         Updates the CO2 emission data of an existing product in the Products table.
 
         Parameters:
-            product_id (int): The ID (nftID) of the product to update.
+            product_id (int): The NFT token id (nftID) of the product to update.
             co2Emission (float, optional): The new CO2 emission value to set. If None, no update is performed.
 
         Returns:
@@ -803,7 +1247,7 @@ class DatabaseOperations:
             params.append(product_id)
 
             self.cur.execute(query, params)
-            self.conn.commit()
+            self._commit()
 
             if self.cur.rowcount > 0:
                 print(Fore.GREEN + "Product emissions updated successfully!\n" + Style.RESET_ALL)
@@ -814,7 +1258,7 @@ class DatabaseOperations:
 
         except sqlite3.Error as e:
             print(Fore.RED + f"Error updating product: {e}" + Style.RESET_ALL)
-            return -1
+            return self._failed()
 
 # ---------- END PRODUCTS ----------
 
@@ -837,35 +1281,245 @@ class DatabaseOperations:
                 INSERT INTO Transactions (username_from, username_to, amount, type, tx_hash)
                 VALUES (?, ?, ?, ?, ?)
                 """, (username_from, username_to, amount, type, tx_hash))
-            self.conn.commit()
+            self._commit()
             return 0
         except sqlite3.IntegrityError:
-            return -1
+            return self._failed()
 
-    def get_user_transactions(self, user_username):
+    def insert_transactions_many(self, transactions, chunk_size=None):
+        """
+        Inserts many transaction records into the Transactions table in a single transaction,
+        e.g. when backfilling the MINT/BURN/TRANSFER rows of a certifier batch.
+
+        Args:
+            transactions (iterable): Tuples of (username_from, username_to, amount, type, tx_hash).
+            chunk_size (int, optional): Rows per executemany call.
+
+        Returns:
+            tuple: (number of inserted rows, list of (row index, error message) for the rejected rows).
+        """
+        return self._insert_many("""
+                INSERT INTO Transactions (username_from, username_to, amount, type, tx_hash)
+                VALUES (?, ?, ?, ?, ?)""", transactions, chunk_size)
+
+    def get_user_transactions(self, user_username, date_from=None, date_to=None):
         """
         Retrieves all transactions involving a specific user, either as sender or receiver.
 
+        Without a date range only the main table is read, old transactions being moved to the
+        archive files (see db.archive); a date range reaching archived periods also reads them.
+
         Args:
             user_username (str): The username of the user whose transactions are to be retrieved.
+            date_from (str, optional): Only transactions dated on or after this date ('YYYY-MM-DD[ HH:MM:SS]').
+            date_to (str, optional): Only transactions dated before this date.
 
         Returns:
             list of Transaction: A list of Transaction objects ordered by timestamp descending.
         """
-        self.cur.execute("""
-                            SELECT * FROM Transactions
-                            WHERE username_from = ? OR username_to = ?
-                            ORDER BY timestamp DESC
-                            """, (user_username, user_username))
-        transactions = [Transaction(id, username_from, username_to, amount, type, tx_hash, timestamp)
-                        for id, username_from, username_to, amount, type, tx_hash, timestamp in self.cur.fetchall()]
-
+        query = "SELECT * FROM Transactions WHERE (username_from = ? OR username_to = ?)"
+        params = [user_username, user_username]
+        if date_from is not None:
+            query += " AND timestamp >= ?"
+            params.append(date_from)
+        if date_to is not None:
+            query += " AND timestamp < ?"
+            params.append(date_to)
+        query += " ORDER BY timestamp DESC, id DESC"
+
+        transactions = self._model_cursor(Transaction).execute(query, params).fetchall()
+        if date_from is not None or date_to is not None:
+            archives = archive.archives_for_range(self.conn, date_from, date_to)
+            if archives:
+                # archives are returned most recent first, and hold older rows than the main table
+                transactions += archive.query_archives(archives, query, params, Transaction.from_row)
         return transactions
 
+    def iter_user_transactions(self, user_username, after_id=None, limit=None, page_size=None, stream=False):
+        """
+        Lazily iterates over the transactions involving a user, newest first (timestamp descending,
+        then id descending), like get_user_transactions.
+
+        The sender and receiver sides are read through their (username, timestamp) index and
+        merged, so a page costs the same whatever the length of the user's history.
+
+        Args:
+            user_username (str): The username of the user whose transactions are to be retrieved.
+            after_id (int, optional): Keyset cursor, the id of the last transaction seen: only the
+                transactions listed after it are returned.
+            limit (int, optional): Maximum number of transactions to return.
+            page_size (int, optional): Rows fetched per round trip.
+            stream (bool): Use one streaming cursor instead of one query per page.
+
+        Yields:
+            Transaction: One instance per transaction.
+
+        Raises:
+            ValueError: If after_id is not the id of a transaction of the main table.
+        """
+        after = None
+        if after_id is not None:
+            row = self.cur.execute("SELECT timestamp FROM Transactions WHERE id = ?", (after_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"No transaction with id {after_id}.")
+            after = (row[0], after_id)
+
+        def build_query(after, count):
+            if after is None:
+                return """SELECT * FROM Transactions WHERE username_from = ?
+                          UNION ALL
+                          SELECT * FROM Transactions WHERE username_to = ? AND username_from IS NOT ?
+                          ORDER BY timestamp DESC, id DESC""", (user_username, user_username, user_username)
+            return """SELECT * FROM Transactions WHERE username_from = ? AND (timestamp, id) < (?, ?)
+                      UNION ALL
+                      SELECT * FROM Transactions WHERE username_to = ? AND username_from IS NOT ? AND (timestamp, id) < (?, ?)
+                      ORDER BY timestamp DESC, id DESC""", (user_username, *after, user_username, user_username, *after)
+
+        return self._iter_keyset(build_query, Transaction, after, limit, page_size, stream,
+                                 key=lambda transaction: (transaction.get_timestamp(), transaction.get_id()))
+
 # ---------- TRANSACTIONS ----------
 
 # ---------- END TRANSACTIONS ----------
 
+# ---------- USER_STATS ----------
+
+    def get_user_stats(self, username):
+        """
+        Retrieves the credit and activity totals of a user, kept up to date by triggers
+        (see db.user_stats), without scanning Transactions or Cron_Activities.
+
+        Args:
+            username (str): The username of the user.
+
+        Returns:
+            UserStats: The totals of the user, all zeros if nothing was recorded for them.
+        """
+        stats = self._model_cursor(UserStats).execute(
+            "SELECT * FROM user_stats WHERE username = ?", (username,)).fetchone()
+        return stats if stats is not None else UserStats(username)
+
+# ---------- END USER_STATS ----------
+
+# ---------- ARCHIVE ----------
+
+    def archive_history(self, hot_days=None):
+        """
+        Moves the Transactions and processed Cron_Activities rows older than the hot window
+        to the per-period archive files (see db.archive).
+
+        Args:
+            hot_days (int, optional): Days of history kept in the main tables, archive: hot_days if None.
+
+        Returns:
+            dict: Period -> (archived transactions, archived activities), empty if nothing was old enough.
+
+        Raises:
+            ValueError: If called inside a transaction.
+        """
+        if self.conn.tx_depth:
+            raise ValueError("archive_history cannot run inside a transaction.")
+        self._commit()
+        return archive.archive_old_rows(self.conn, hot_days)
+
+# ---------- END ARCHIVE ----------
+
+# ---------- SEARCH ----------
+
+    @staticmethod
+    def _fts_query(text):
+        """
+        Turns free text into an FTS5 query requiring every word, so that user input cannot be read
+        as FTS5 syntax. Words are matched on their stem (porter tokenizer), a trailing * makes a
+        word match as a prefix: 'solar pan*' -> '"solar" "pan"*'.
+
+        Returns:
+            str or None: The query, None if the text holds no word.
+        """
+        terms = []
+        for word in text.split():
+            prefix = word.endswith("*")
+            word = word.replace('"', '').strip("*")
+            if word:
+                terms.append(f'"{word}"*' if prefix else f'"{word}"')
+        return " ".join(terms) or None
+
+    def search_activities(self, query, state=None, limit=20):
+        """
+        Full-text search of the activity records, on their own description and on the description
+        of the activity they are an instance of (Activities), best matches first.
+
+        bm25 has to score every candidate, so only the search_window most recent records matching
+        each side are ranked: a very common word stays as fast as a rare one.
+
+        Args:
+            query (str): Words to look for, see _fts_query.
+            state (int, optional): Only records in this state (0 pending, 1 processed, 2 removed).
+            limit (int): Maximum number of records.
+
+        Returns:
+            list of Cron_Activities: The matching records, ranked by bm25.
+        """
+        match = self._fts_query(query)
+        if match is None:
+            return []
+        params = {"match": match, "window": config.config.get("search_window", 1000), "limit": limit,
+                  "state": state}
+        # the state filter applies inside the windows: the most recent matches may all be in another state.
+        # CROSS JOIN keeps the full-text index as the outer loop instead of every record in the state
+        text_source = "Cron_Activities_fts" if state is None else \
+            "Cron_Activities_fts CROSS JOIN Cron_Activities c ON c.id = Cron_Activities_fts.rowid AND c.state = :state"
+        kind_filter, window_filter = ("", "") if state is None else ("AND c.state = :state", "AND state = :state")
+        return self._model_cursor(Cron_Activities).execute(f"""
+            WITH text (id, score) AS (
+                SELECT Cron_Activities_fts.rowid, bm25(Cron_Activities_fts) FROM {text_source}
+                WHERE Cron_Activities_fts MATCH :match AND Cron_Activities_fts.rowid >= COALESCE(
+                    (SELECT Cron_Activities_fts.rowid FROM {text_source} WHERE Cron_Activities_fts MATCH :match
+                     ORDER BY Cron_Activities_fts.rowid DESC LIMIT 1 OFFSET :window - 1), 0)
+            ),
+            kinds (id, score) AS (
+                SELECT c.id, k.score
+                FROM (SELECT rowid AS activity_id, bm25(Activities_fts) AS score FROM Activities_fts
+                      WHERE Activities_fts MATCH :match) k
+                CROSS JOIN Cron_Activities c ON c.activity_id = k.activity_id {kind_filter}
+                    AND c.id >= COALESCE(
+                    (SELECT id FROM Cron_Activities WHERE activity_id = k.activity_id {window_filter}
+                     ORDER BY id DESC LIMIT 1 OFFSET :window - 1), 0)
+            )
+            SELECT c.* FROM (SELECT id, MIN(score) AS score
+                             FROM (SELECT * FROM text UNION ALL SELECT * FROM kinds) GROUP BY id) m
+            JOIN Cron_Activities c ON c.id = m.id
+            ORDER BY m.score, c.id
+            LIMIT :limit""", params).fetchall()
+
+    def search_products(self, query, category=None, limit=20):
+        """
+        Full-text search of the product names, best matches first.
+
+        Args:
+            query (str): Words to look for, see _fts_query.
+            category (str, optional): Only products of this category (FRUIT, MEAT, DAIRY).
+            limit (int): Maximum number of products.
+
+        Returns:
+            list of sqlite3.Row: The matching Products rows, ranked by bm25.
+        """
+        match = self._fts_query(query)
+        if match is None:
+            return []
+        category_filter = "" if category is None else "AND p.category = ?"
+        params = [match] + ([] if category is None else [category]) + [limit]
+        cur = self.conn.cursor()
+        cur.row_factory = sqlite3.Row
+        return cur.execute(f"""
+            SELECT p.* FROM Products_fts
+            JOIN Products p ON p.id = Products_fts.rowid
+            WHERE Products_fts MATCH ? {category_filter}
+            ORDER BY Products_fts.rank, p.id
+            LIMIT ?""", params).fetchall()
+
+# ---------- END SEARCH ----------
+
     def encrypt_private_k(self, private_key, passwd):
         passwd_hash = hashlib.sha256(passwd.encode('utf-8')).digest()
         key = base64.urlsafe_b64encode(passwd_hash)
@@ -879,9 +1533,16 @@ class DatabaseOperations:
         return cipher_suite.decrypt(encrypted_private_k).decode('utf-8')
 
     def hash_function(self, password):
-        salt = os.urandom(16)
-        digest = hashlib.scrypt(password.encode(), salt=salt, n=2, r=8, p=1, dklen=64)
-        return f"{digest.hex()}${salt.hex()}"
+        """
+        Hashes a password with the configured scrypt parameters, in the KDF process pool.
+
+        Args:
+            password (str): The plain-text password.
+
+        Returns:
+            str: The hash to store, see db.password_kdf for the format.
+        """
+        return password_kdf.hash_password(password)
 
 
 
@@ -0,0 +1,272 @@
+"""
+Streaming export of the Transactions, Products and Cron_Activities tables.
+
+Rows are read from one cursor, chunk_size rows at a time, and written out before the next
+chunk is fetched, so memory use does not depend on the number of rows exported. Formats:
+
+    csv      one file, header row first
+    jsonl    one file, a JSON object per row
+    npy      a directory with one NumPy .npy array per column
+    npz      one NumPy .npz archive with an array per column (the .npy files, zipped)
+
+The NumPy formats need numpy, which is not a requirement of the application. Integer columns
+become int64 arrays, decimal ones float64 (NULL as NaN) and the others fixed-width unicode
+(NULL as ''); dates are kept as 'YYYY-MM-DD HH:MM:SS' strings.
+
+Transactions and activities moved to the archive files (see db.archive) are exported too,
+unless archives=False. Everything is read on a read-only reporting connection (db.reporting)
+in a single read transaction, so the export is a consistent snapshot even while the
+application keeps writing.
+
+    python -m db.export transactions csv transactions.csv [--user farmer] [--from 2024-01-01] [--to 2025-01-01]
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import namedtuple
+from config import config
+from db import archive, reporting
+
+# columns: (name, kind) with kind 'i' integer, 'f' decimal, 's' text.
+Dataset = namedtuple("Dataset", ["table", "columns", "date_column", "user_columns", "archived"])
+
+DATASETS = {
+    "transactions": Dataset("Transactions",
+                            (("id", "i"), ("username_from", "s"), ("username_to", "s"), ("amount", "i"),
+                             ("type", "s"), ("tx_hash", "s"), ("timestamp", "s")),
+                            "timestamp", ("username_from", "username_to"), True),
+    "products": Dataset("Products",
+                        (("id", "i"), ("name", "s"), ("category", "s"), ("co2Emission", "f"), ("nftID", "i"),
+                         ("harvestDate", "s"), ("update_datetime", "s")),
+                        "harvestDate", (), False),
+    "activities": Dataset("Cron_Activities",
+                          (("id", "i"), ("description", "s"), ("username", "s"), ("update_datetime", "s"),
+                           ("creation_datetime", "s"), ("state", "i"), ("activity_id", "i"), ("co2_reduction", "f")),
+                          "creation_datetime", ("username",), True),
+}
+
+FORMATS = ("csv", "jsonl", "npy", "npz")
+
+
+def _dataset(name):
+    if name not in DATASETS:
+        raise ValueError(f"Unknown dataset '{name}', expected one of {', '.join(DATASETS)}.")
+    return DATASETS[name]
+
+
+def build_query(dataset, projection, username=None, date_from=None, date_to=None, schemas=("main",)):
+    """
+    Builds the export query of a dataset: the filtered rows of the table in every schema, merged by id.
+
+    Args:
+        dataset (Dataset): The dataset.
+        projection (str): Select list of each branch.
+        username (str, optional): Only rows involving this user.
+        date_from (str, optional): Only rows whose date column is >= this date.
+        date_to (str, optional): Only rows whose date column is < this date.
+        schemas (sequence of str): Main database and attached archives to read.
+
+    Returns:
+        tuple: (query, params)
+
+    Raises:
+        ValueError: If a user filter is given for a dataset without user columns.
+    """
+    conditions, params = [], []
+    if username is not None:
+        if not dataset.user_columns:
+            raise ValueError(f"{dataset.table} has no user column to filter on.")
+        conditions.append("(" + " OR ".join(f"{column} = ?" for column in dataset.user_columns) + ")")
+        params.extend([username] * len(dataset.user_columns))
+    if date_from is not None:
+        conditions.append(f"{dataset.date_column} >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append(f"{dataset.date_column} < ?")
+        params.append(date_to)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    branches = [f"SELECT {projection} FROM {schema}.{dataset.table}{where}" for schema in schemas]
+    # the branches are merged in id order; a branch read through the user indexes comes out of
+    # id order and is sorted first (temp B-tree), only its matching rows
+    return " UNION ALL ".join(branches) + " ORDER BY 1", params * len(schemas)
+
+
+def iter_chunks(conn, dataset, username=None, date_from=None, date_to=None, chunk_size=None, schemas=("main",)):
+    """
+    Streams the rows of a dataset in chunks.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        dataset (str): 'transactions', 'products' or 'activities'.
+        username, date_from, date_to: Optional filters, see build_query.
+        chunk_size (int, optional): Rows per chunk, export_chunk_size from the configuration if None.
+        schemas (sequence of str): Main database and attached archives to read.
+
+    Yields:
+        list of tuple: Up to chunk_size rows, columns in the order of DATASETS.
+    """
+    dataset = _dataset(dataset)
+    chunk_size = chunk_size or config.config.get("export_chunk_size", 10000)
+    projection = ", ".join(name for name, _ in dataset.columns)
+    query, params = build_query(dataset, projection, username, date_from, date_to, schemas)
+    cur = conn.execute(query, params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def _write_csv(out, names, chunks):
+    count = 0
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def _write_jsonl(out, names, chunks):
+    count = 0
+    with open(out, "w", encoding="utf-8") as f:
+        for rows in chunks:
+            f.write("".join(json.dumps(dict(zip(names, row)), separators=(",", ":")) + "\n" for row in rows))
+            count += len(rows)
+    return count
+
+
+def _import_numpy():
+    try:
+        import numpy
+        from numpy.lib import format as npy_format
+    except ImportError as e:
+        raise ImportError("The npy and npz export formats need NumPy: pip install numpy") from e
+    return numpy, npy_format
+
+
+def _write_npy(directory, conn, dataset, filters, chunks):
+    """
+    Writes one .npy file per column. The array headers need the row count and the width of the
+    text columns, which a first aggregate query over the same rows provides.
+    """
+    numpy, npy_format = _import_numpy()
+    stats = ["COUNT(*)"] + [f"MAX(LENGTH({name}))" for name, kind in dataset.columns if kind == "s"]
+    query, params = build_query(dataset, "*", **filters)
+    row = conn.execute(f"SELECT {', '.join(stats)} FROM ({query})", params).fetchone()
+    total, widths = row[0], iter(row[1:])
+
+    dtypes = []
+    for name, kind in dataset.columns:
+        if kind == "s":
+            dtypes.append(numpy.dtype(f"<U{max(next(widths) or 0, 1)}"))
+        else:
+            dtypes.append(numpy.dtype("<i8" if kind == "i" else "<f8"))
+
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    try:
+        for (name, _), dtype in zip(dataset.columns, dtypes):
+            f = open(os.path.join(directory, f"{name}.npy"), "wb")
+            files.append(f)
+            npy_format.write_array_header_1_0(f, {"descr": npy_format.dtype_to_descr(dtype),
+                                                  "fortran_order": False, "shape": (total,)})
+        count = 0
+        for rows in chunks:
+            for index, ((_, kind), dtype, f) in enumerate(zip(dataset.columns, dtypes, files)):
+                if kind == "s":
+                    values = ["" if row[index] is None else row[index] for row in rows]
+                elif kind == "f":
+                    values = [float("nan") if row[index] is None else row[index] for row in rows]
+                else:
+                    values = [row[index] for row in rows]
+                numpy.asarray(values, dtype=dtype).tofile(f)
+            count += len(rows)
+    finally:
+        for f in files:
+            f.close()
+    return count
+
+
+def export(dataset, fmt, out, db_path=None, username=None, date_from=None, date_to=None, chunk_size=None,
+           archives=True):
+    """
+    Exports a dataset to a file (a directory for npy).
+
+    Args:
+        dataset (str): 'transactions', 'products' or 'activities'.
+        fmt (str): 'csv', 'jsonl', 'npy' or 'npz'.
+        out (str): Output path.
+        db_path (str, optional): Database file, the configured db_path if None.
+        username (str, optional): Only rows involving this user (not available for products).
+        date_from (str, optional): Only rows dated on or after this date ('YYYY-MM-DD[ HH:MM:SS]').
+        date_to (str, optional): Only rows dated before this date.
+        chunk_size (int, optional): Rows per chunk, export_chunk_size from the configuration if None.
+        archives (bool): Also export the archived rows whose period overlaps the date range.
+
+    Returns:
+        int: Number of exported rows.
+
+    Raises:
+        ValueError: For an unknown dataset or format, or a user filter on products.
+        ImportError: For the npy and npz formats when NumPy is not installed.
+    """
+    spec = _dataset(dataset)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {', '.join(FORMATS)}.")
+    if fmt in ("npy", "npz"):
+        _import_numpy()
+
+    conn = reporting.connect(db_path or config.config["db_path"])
+    schemas = ["main"]
+    try:
+        if archives and spec.archived:
+            schemas += archive.attach_archives(conn, date_from, date_to)
+        filters = {"username": username, "date_from": date_from, "date_to": date_to, "schemas": schemas}
+        names = [name for name, _ in spec.columns]
+        # one read transaction: the row count of the npy headers and the rows come from the same snapshot
+        conn.execute("BEGIN")
+        chunks = iter_chunks(conn, dataset, chunk_size=chunk_size, **filters)
+        if fmt == "csv":
+            return _write_csv(out, names, chunks)
+        if fmt == "jsonl":
+            return _write_jsonl(out, names, chunks)
+        if fmt == "npy":
+            return _write_npy(out, conn, spec, filters, chunks)
+
+        directory = tempfile.mkdtemp(prefix="supplychain_export_")
+        try:
+            count = _write_npy(directory, conn, spec, filters, chunks)
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for name in names:
+                    zf.write(os.path.join(directory, f"{name}.npy"), f"{name}.npy")
+            return count
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a table to CSV, JSONL or NumPy arrays, streaming it in chunks.")
+    parser.add_argument("dataset", choices=list(DATASETS))
+    parser.add_argument("format", choices=FORMATS)
+    parser.add_argument("out", help="output file (a directory for npy)")
+    parser.add_argument("--db", default=config.config["db_path"], help="database file (default: configured db_path)")
+    parser.add_argument("--user", help="only rows involving this username")
+    parser.add_argument("--from", dest="date_from", help="only rows dated on or after this date")
+    parser.add_argument("--to", dest="date_to", help="only rows dated before this date")
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument("--no-archives", action="store_true", help="leave out the archived rows")
+    args = parser.parse_args()
+
+    exported = export(args.dataset, args.format, args.out, args.db, args.user, args.date_from, args.date_to,
+                      args.chunk_size, not args.no_archives)
+    print(f"{exported} row(s) exported to {args.out}")
@@ -0,0 +1,112 @@
+"""
+In-process identity directory.
+
+The CLI flows look up the same few users over and over (public key of the sender, of the
+recipient, role of the logged user, username of every helper). The cache keeps, for the most
+recently used usernames, the identity row joined from Credentials and Accounts, reachable both
+by username and by public key, with least recently used eviction.
+
+Entries are dropped by the DatabaseOperations methods that write credentials or accounts,
+so a lookup never returns data older than the last write made through this process.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+Identity = namedtuple("Identity", ["username", "public_key", "role", "credentials_id"])
+
+
+class IdentityCache:
+    """
+    Bounded, thread-safe LRU map username -> Identity with a public key -> username index.
+
+    Attributes:
+        maxsize (int): Maximum number of identities kept.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to go to the database.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._by_username = OrderedDict()
+        self._by_public_key = {}
+        self._lock = threading.Lock()
+
+    def get(self, username=None, public_key=None):
+        """
+        Looks up an identity by username or by public key and counts the hit or miss.
+
+        Args:
+            username (str, optional): The username to look up.
+            public_key (str, optional): The public key to look up, used if username is None.
+
+        Returns:
+            Identity or None: The cached identity, None on a miss.
+        """
+        with self._lock:
+            if username is None:
+                username = self._by_public_key.get(public_key)
+            identity = self._by_username.get(username) if username is not None else None
+            if identity is None:
+                self.misses += 1
+                return None
+            self._by_username.move_to_end(username)
+            self.hits += 1
+            return identity
+
+    def put(self, identity):
+        """
+        Stores an identity, evicting the least recently used one when the cache is full.
+
+        Args:
+            identity (Identity): The identity read from the database.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._remove(identity.username)
+            self._by_username[identity.username] = identity
+            if identity.public_key is not None:
+                self._by_public_key[identity.public_key] = identity.username
+            while len(self._by_username) > self.maxsize:
+                self._remove(next(iter(self._by_username)))
+
+    def invalidate(self, username=None, public_key=None, credentials_id=None):
+        """
+        Drops every cached identity matching any of the given keys.
+
+        Args:
+            username (str, optional): Username of the identity to drop.
+            public_key (str, optional): Public key of the identity to drop.
+            credentials_id (int, optional): Credentials id of the identity to drop.
+        """
+        with self._lock:
+            if username is not None:
+                self._remove(username)
+            if public_key is not None and public_key in self._by_public_key:
+                self._remove(self._by_public_key[public_key])
+            if credentials_id is not None:
+                for identity in [i for i in self._by_username.values() if i.credentials_id == credentials_id]:
+                    self._remove(identity.username)
+
+    def clear(self):
+        """Drops every cached identity, the counters are kept."""
+        with self._lock:
+            self._by_username.clear()
+            self._by_public_key.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses, current size and maxsize of the cache.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._by_username), "maxsize": self.maxsize}
+
+    def _remove(self, username):
+        identity = self._by_username.pop(username, None)
+        if identity is not None and self._by_public_key.get(identity.public_key) == username:
+            del self._by_public_key[identity.public_key]
@@ -0,0 +1,256 @@
+"""
+Password hashing with scrypt.
+
+Hashes are stored with the parameters that produced them:
+
+    scrypt$<n>$<r>$<p>$<salt hex>$<digest hex>
+
+so the cost can be raised in configuration.yml without invalidating existing passwords: a hash
+made with other parameters still verifies, and check_credentials stores a new one after a
+successful login. The original format `<digest hex>$<salt hex>` (n=2, r=8, p=1) is still read.
+
+The KDF runs in a pool of worker processes, so that concurrent registrations and logins are
+hashed in parallel instead of queueing on the calling threads.
+
+Calibrate the cost for this host:
+    python -m db.password_kdf --target-ms 100
+"""
+
+import argparse
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from config import config
+
+KdfParams = namedtuple("KdfParams", ["n", "r", "p"])
+
+LEGACY_PARAMS = KdfParams(2, 8, 1)
+DEFAULT_PARAMS = KdfParams(16384, 8, 1)
+SALT_BYTES = 16
+DKLEN = 64
+PREFIX = "scrypt"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def current_params():
+    """
+    Returns:
+        KdfParams: The parameters new hashes are made with, from the `kdf:` configuration section.
+    """
+    settings = config.config.get("kdf") or {}
+    return KdfParams(int(settings.get("n", DEFAULT_PARAMS.n)), int(settings.get("r", DEFAULT_PARAMS.r)),
+                     int(settings.get("p", DEFAULT_PARAMS.p)))
+
+
+def _scrypt(password, salt, params):
+    # maxmem must cover the 128 * n * r bytes scrypt works in, plus some slack
+    return hashlib.scrypt(password.encode(), salt=salt, n=params.n, r=params.r, p=params.p, dklen=DKLEN,
+                          maxmem=256 * params.n * params.r * params.p + 2 ** 20)
+
+
+def parse_hash(stored):
+    """
+    Splits a stored hash in its parts.
+
+    Args:
+        stored (str): A hash in the current or in the original format.
+
+    Returns:
+        tuple: (KdfParams, salt bytes, digest bytes)
+
+    Raises:
+        ValueError: If the string is not a recognized hash.
+    """
+    parts = stored.split("$")
+    if len(parts) == 6 and parts[0] == PREFIX:
+        return KdfParams(int(parts[1]), int(parts[2]), int(parts[3])), bytes.fromhex(parts[4]), bytes.fromhex(parts[5])
+    if len(parts) == 2:
+        return LEGACY_PARAMS, bytes.fromhex(parts[1]), bytes.fromhex(parts[0])
+    raise ValueError("Unrecognized password hash format.")
+
+
+def _hash(password, params):
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, params)
+    return f"{PREFIX}${params.n}${params.r}${params.p}${salt.hex()}${digest.hex()}"
+
+
+def _verify(password, stored):
+    try:
+        params, salt, digest = parse_hash(stored)
+    except ValueError:
+        return False
+    return hmac.compare_digest(_scrypt(password, salt, params), digest)
+
+
+def needs_rehash(stored, params=None):
+    """
+    Args:
+        stored (str): A stored hash.
+        params (KdfParams, optional): The wanted parameters, current_params() if None.
+
+    Returns:
+        bool: True if the hash was not made with the wanted parameters and format.
+    """
+    try:
+        return not stored.startswith(PREFIX + "$") or parse_hash(stored)[0] != (params or current_params())
+    except ValueError:
+        return True
+
+
+def get_pool():
+    """
+    Returns the process pool running the KDF, creating it on first use.
+    `kdf: workers` sets its size (the number of CPUs if unset), 0 disables it.
+
+    Returns:
+        ProcessPoolExecutor or None: The pool, None if the KDF runs on the calling thread.
+    """
+    global _pool
+    workers = (config.config.get("kdf") or {}).get("workers")
+    if workers == 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawned, not forked: a fork copies the locks held by the other threads (async
+            # controller readers and writer, connection pool) and can deadlock the workers
+            _pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    """Stops the worker processes, a new pool is started by the next hash or verification."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def hash_password(password, params=None):
+    """
+    Hashes a password in the pool.
+
+    Args:
+        password (str): The plain-text password.
+        params (KdfParams, optional): Cost parameters, current_params() if None.
+
+    Returns:
+        str: The hash to store, parameters included.
+    """
+    params = params or current_params()
+    pool = get_pool()
+    return _hash(password, params) if pool is None else pool.submit(_hash, password, params).result()
+
+
+def verify_password(password, stored):
+    """
+    Checks a password against a stored hash in the pool, with the parameters of that hash.
+
+    Args:
+        password (str): The plain-text password.
+        stored (str): The stored hash.
+
+    Returns:
+        bool: True if the password matches.
+    """
+    pool = get_pool()
+    return _verify(password, stored) if pool is None else pool.submit(_verify, password, stored).result()
+
+
+def hash_many(passwords, params=None):
+    """
+    Hashes many passwords in parallel, e.g. for bulk onboarding.
+
+    Args:
+        passwords (iterable of str): The plain-text passwords.
+        params (KdfParams, optional): Cost parameters, current_params() if None.
+
+    Returns:
+        list of str: The hashes, in input order.
+    """
+    params = params or current_params()
+    passwords = list(passwords)
+    pool = get_pool()
+    if pool is None:
+        return [_hash(password, params) for password in passwords]
+    return list(pool.map(_hash, passwords, [params] * len(passwords)))
+
+
+def verify_many(pairs):
+    """
+    Verifies many (password, stored hash) pairs in parallel.
+
+    Args:
+        pairs (iterable of tuple): (plain-text password, stored hash) pairs.
+
+    Returns:
+        list of bool: One result per pair, in input order.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    passwords, hashes = zip(*pairs)
+    pool = get_pool()
+    if pool is None:
+        return [_verify(password, stored) for password, stored in zip(passwords, hashes)]
+    return list(pool.map(_verify, passwords, hashes))
+
+
+def calibrate(target_ms, r=8, p=1, max_memory_mb=64):
+    """
+    Finds the largest power of two n whose hashing time stays within the target on this host.
+
+    Args:
+        target_ms (float): Wanted time of one hash, in milliseconds.
+        r (int): scrypt block size.
+        p (int): scrypt parallelization.
+        max_memory_mb (int): Upper bound of the memory used by one hash (128 * n * r bytes).
+
+    Returns:
+        tuple: (KdfParams, measured milliseconds of one hash with those parameters)
+    """
+    best = KdfParams(2 ** 10, r, p)
+    best_ms = None
+    n = 2 ** 10
+    while 128 * n * r <= max_memory_mb * 2 ** 20:
+        params = KdfParams(n, r, p)
+        runs = []
+        for _ in range(3):
+            start = time.perf_counter()
+            _scrypt("calibration", os.urandom(SALT_BYTES), params)
+            runs.append((time.perf_counter() - start) * 1000)
+        elapsed = sorted(runs)[1]
+        if elapsed > target_ms and best_ms is not None:
+            break
+        best, best_ms = params, elapsed
+        if elapsed > target_ms:
+            break
+        n *= 2
+    return best, best_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick scrypt parameters for a target hashing time on this host.")
+    parser.add_argument("--target-ms", type=float, default=100)
+    parser.add_argument("-r", type=int, default=8)
+    parser.add_argument("-p", type=int, default=1)
+    parser.add_argument("--max-memory-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    params, elapsed = calibrate(args.target_ms, args.r, args.p, args.max_memory_mb)
+    print(f"n={params.n} r={params.r} p={params.p}: {elapsed:.1f} ms per hash, "
+          f"{128 * params.n * params.r / 2 ** 20:.0f} MB per hash, {os.cpu_count()} CPU(s)\n")
+    print("configuration.yml:")
+    print("kdf:")
+    print(f"  n: {params.n}")
+    print(f"  r: {params.r}")
+    print(f"  p: {params.p}")
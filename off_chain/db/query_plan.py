@@ -0,0 +1,199 @@
+"""
+Query plan guarantees for DatabaseOperations.
+
+Every public DatabaseOperations method is called with sample arguments while the SQL it issues
+is captured with a trace callback. Each captured statement is then run through
+EXPLAIN QUERY PLAN, and any step that scans a whole table is reported, unless the method is
+a listing that is expected to read the whole table.
+
+Run as a script to check a fresh, fully migrated database:
+    python -m db.query_plan
+"""
+
+import os
+import sys
+import tempfile
+import types
+
+# Sample arguments for every method that issues SQL.
+METHOD_CALLS = {
+    "insert_actor": ("FARMER", "qp_user", "Name", "Lastname", "Residence", "Place", "1990-01-01", "qp@mail.com", "3000000000"),
+    "insert_actors_many": ([("SELLER", "qp_seller", "Name", "Lastname", "Residence", "Place", "1990-01-01", "qps@mail.com", "3000000001")],),
+    "update_account": ("qp_user", "Name", "Lastname", "1990-01-01", "Place", "Residence", "3000000000", "qp@mail.com", 1),
+    "get_users": (),
+    "iter_users": (),
+    "get_user_by_username": ("qp_user",),
+    "check_unique_email": ("qp@mail.com",),
+    "check_unique_phone_number": ("3000000000",),
+    "register_account_activities": ("qp_user", 1),
+    "register_account_activities_many": ([("qp_user", 2)],),
+    "register_activities": ("performing an action", "Query plan activity"),
+    "register_activities_many": ([("performing an action", "Query plan activity")],),
+    "register_creds": ("qp_user", "Password123!", "0xpublic", "0xprivate"),
+    "register_creds_many": ([("qp_seller", "Password123!", "0xpublic2", "0xprivate2")],),
+    "change_password": ("qp_user", "Password123!"),
+    "get_credentials_id_by_username": ("qp_user",),
+    "get_creds_by_username": ("qp_user",),
+    "get_public_key_by_username": ("qp_user",),
+    "get_helpers": (),
+    "get_username_by_public_key": ("0xpublic",),
+    "get_identity": ("qp_user",),
+    "check_username": ("qp_user",),
+    "check_credentials": ("qp_user", "Password123!"),
+    "key_exists": ("0xpublic", "0xprivate"),
+    "register_cron_activity": ("Query plan activity", "qp_user", 0, 1, 10.0),
+    "register_cron_activities_many": ([("Query plan activity", "qp_user", 0, 2, 10.0)],),
+    "update_activity_state": (1, 1),
+    "query_activities": ("qp_user", (0, 1), None, "2000-01-01", "2100-01-01", "creation_datetime", "id", True, 10,
+                         ("state", "co2_reduction"), True),
+    "get_activities_to_be_processed": (),
+    "iter_activities_to_be_processed": (None, 10, 5),
+    "get_activities_by_username": ("qp_user",),
+    "iter_activities_by_username": ("qp_user", None, 10, 5),
+    "get_activities_to_be_processed_by_username": ("qp_user",),
+    "get_activities_processed_by_username": ("qp_user",),
+    "get_co2Amount_by_activity": (1,),
+    "get_state_by_activity": (1,),
+    "insert_product": ("Apple", "FRUIT", 10, 1),
+    "insert_products_many": ([("Beef", "MEAT", 50, 2)],),
+    "upsert_product": ("Apple", "FRUIT", 12, 1),
+    "upsert_products_many": ([("Beef", "MEAT", 55, 2), ("Cheese", "DAIRY", 20, 3)],),
+    "update_product": (1, 20),
+    "insert_transaction": ("qp_certifier", "qp_user", 10, "MINT", "0x01"),
+    "insert_transactions_many": ([("qp_certifier", "qp_user", 10, "BURN", "0x02")],),
+    "get_user_transactions": ("qp_user", "2000-01-01", "2100-01-01"),
+    "archive_history": (36500,),
+    "iter_user_transactions": ("qp_user", 2, 10, 5),
+    "get_user_stats": ("qp_user",),
+    "search_activities": ("query plan", 0, 5),
+    "search_products": ("beef", "MEAT", 5),
+    "delete_creds": (1,),
+}
+
+# Catalog tables holding a handful of rows (one per archived period), read in full by design.
+SMALL_TABLES = {"archive_periods"}
+
+# Listings that read every row of a table by design.
+EXPECTED_SCANS = {"get_users", "iter_users", "get_helpers"}
+
+# Public methods that issue no SQL of their own.
+NOT_QUERIES = {"close", "transaction", "identity_cache_stats", "insert_test_records", "encrypt_private_k", "decrypt_private_k", "hash_function"}
+
+
+def public_methods(ops_class):
+    """
+    Returns:
+        set of str: Names of the public methods of the given class.
+    """
+    return {name for name in dir(ops_class) if not name.startswith("_") and callable(getattr(ops_class, name))}
+
+
+def unregistered_methods(ops_class):
+    """
+    Lists the public methods that are neither in METHOD_CALLS nor in NOT_QUERIES,
+    so that a new method cannot silently escape the check.
+
+    Returns:
+        list of str: Names of the unregistered methods.
+    """
+    return sorted(public_methods(ops_class) - set(METHOD_CALLS) - NOT_QUERIES)
+
+
+def capture_statements(ops):
+    """
+    Calls every method of METHOD_CALLS on the given DatabaseOperations and records its SQL.
+
+    Args:
+        ops (DatabaseOperations): Instance connected to a scratch database.
+
+    Returns:
+        dict: Method name -> list of SQL statements, with the parameters already bound.
+    """
+    captured = {}
+    current = []
+
+    def trace(statement):
+        # statements run by triggers are reported with a leading comment
+        if not statement.lstrip().startswith("--"):
+            current.append(statement)
+
+    ops.conn.set_trace_callback(trace)
+    try:
+        for name, args in METHOD_CALLS.items():
+            current.clear()
+            # cached lookups must reach the database to have their SQL checked
+            ops._identities.clear()
+            result = getattr(ops, name)(*args)
+            if isinstance(result, types.GeneratorType):
+                list(result)
+            captured[name] = list(dict.fromkeys(current))
+    finally:
+        ops.conn.set_trace_callback(None)
+    return captured
+
+
+def full_table_scans(conn, captured):
+    """
+    Runs EXPLAIN QUERY PLAN on the captured statements and collects the full table scans.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the same database.
+        captured (dict): Output of capture_statements().
+
+    Returns:
+        list of tuple: (method name, SQL statement, plan step) for every unexpected scan.
+    """
+    violations = []
+    for name, statements in captured.items():
+        if name in EXPECTED_SCANS:
+            continue
+        for statement in statements:
+            keyword = statement.lstrip().split(None, 1)[0].upper()
+            if keyword not in ("SELECT", "UPDATE", "DELETE", "WITH", "INSERT"):
+                continue
+            plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + statement)]
+            # subqueries and CTEs scanned once built from indexed lookups
+            intermediate = {detail.split()[1] for detail in plan if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+            for detail in plan:
+                if not detail.startswith("SCAN ") or "CONSTANT ROW" in detail:
+                    continue
+                table = detail.split()[1]
+                # a full-text MATCH is answered by the FTS5 index, not by reading every row
+                if table in SMALL_TABLES or table in intermediate or ("VIRTUAL TABLE INDEX" in detail and ":M" in detail):
+                    continue
+                violations.append((name, " ".join(statement.split()), detail))
+    return violations
+
+
+def check_query_plans(ops):
+    """
+    Runs the whole check against the database of the given DatabaseOperations.
+    The database is modified by the sample calls, use a scratch one.
+
+    Args:
+        ops (DatabaseOperations): Instance connected to a scratch database.
+
+    Returns:
+        list of str: Human readable problems, empty if every query is index-backed.
+    """
+    problems = [f"{name}: method not registered in db.query_plan" for name in unregistered_methods(type(ops))]
+    for name, statement, detail in full_table_scans(ops.conn, capture_statements(ops)):
+        problems.append(f"{name}: {detail} in `{statement}`")
+    return problems
+
+
+if __name__ == "__main__":
+    from db import connection_manager
+    from db.db_operations import DatabaseOperations
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection_manager.init_manager(os.path.join(directory, "query_plan.sqlite"))
+        ops = DatabaseOperations()
+        problems = check_query_plans(ops)
+        ops.close()
+        connection_manager.close_manager()
+
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problem(s) found." if problems else "Every query uses an index.")
+    sys.exit(1 if problems else 0)
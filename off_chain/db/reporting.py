@@ -0,0 +1,111 @@
+"""
+Read-only reporting connections.
+
+Long listings and exports run on a connection of their own instead of the pooled one the
+CLI flows write through. The connection is opened with mode=ro and PRAGMA query_only, so a
+report can never write, and with memory-mapped I/O, so large scans read the file pages
+without copying them through the page cache.
+
+    reports = ReportingOperations()
+    with reports.snapshot():
+        users = list(reports.iter_users())
+        stats = [reports.get_user_stats(user.get_username()) for user in users]
+
+Every query of a snapshot block reads the database as it was when the block started: pages
+of a keyset iteration never mix rows committed in between. In WAL mode a reader does not
+block the writer; an open snapshot only keeps the WAL from being checkpointed past it, so
+blocks should cover one report, not the lifetime of the application.
+"""
+
+import datetime
+import sqlite3
+from contextlib import contextmanager
+from config import config
+from db.connection_manager import connection_class, get_manager
+from db.db_operations import DatabaseOperations
+from db.identity_cache import IdentityCache
+
+
+def connect(db_path=None):
+    """
+    Opens a read-only reporting connection.
+
+    Args:
+        db_path (str, optional): Database file, the one of the connection manager if None.
+
+    Returns:
+        PooledConnection: The connection, not managed by the pool: close it when done.
+
+    Raises:
+        sqlite3.OperationalError: If the database file does not exist.
+    """
+    settings = config.config.get("reporting") or {}
+    conn = sqlite3.connect(f"file:{db_path or get_manager().db_path}?mode=ro", uri=True, factory=connection_class())
+    try:
+        conn.execute(f"PRAGMA busy_timeout = {int(settings.get('busy_timeout', 5000))}")
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(settings.get('mmap_size', 268435456))}")
+        conn.execute(f"PRAGMA cache_size = {int(settings.get('cache_size', -16000))}")
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+class ReportingOperations(DatabaseOperations):
+    """
+    The read methods of DatabaseOperations on a read-only reporting connection.
+    Write methods fail (sqlite3 "attempt to write a readonly database", or their -1 result).
+    """
+
+    def __init__(self, db_path=None):
+        """
+        Opens the reporting connection. The schema is not migrated: the database must have been
+        opened once by the application.
+
+        Args:
+            db_path (str, optional): Database file, the one of the connection manager if None.
+        """
+        self.conn = connect(db_path)
+        self.cur = self.conn.cursor()
+        # lookups of a report are not worth caching, and the writers' invalidations would not reach them
+        self._identities = IdentityCache(0)
+        self.today_date = datetime.date.today().strftime('%Y-%m-%d')
+
+    def close(self):
+        """
+        Closes the reporting connection. The instance must not be used after calling this method.
+        """
+        if self.conn is not None:
+            self.cur.close()
+            self.conn.close()
+            self.conn = None
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Runs the enclosed reads in one read transaction, on a single snapshot of the database.
+        Nested blocks share the snapshot of the outermost one.
+
+        Yields:
+            ReportingOperations: This instance.
+        """
+        conn = self.conn
+        if conn.tx_depth:
+            conn.tx_depth += 1
+            try:
+                yield self
+            finally:
+                conn.tx_depth -= 1
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("BEGIN")
+        # BEGIN is deferred: the snapshot is taken by the first read
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        conn.tx_depth += 1
+        try:
+            yield self
+        finally:
+            conn.tx_depth -= 1
+            conn.rollback()
@@ -0,0 +1,109 @@
+"""
+SQLite performance profiles.
+
+A profile is the set of PRAGMAs applied to every connection as it is opened by the connection
+manager. The `sqlite:` section of configuration.yml selects a named preset and may override
+any single setting of it:
+
+    sqlite:
+      profile: balanced
+      synchronous: FULL
+"""
+
+from config import config
+
+# temp_store and journal_mode stay on disk in every preset: _insert_many runs each chunk under a
+# savepoint, and an in-memory statement/rollback journal makes every chunk slower as the
+# database grows.
+PRESETS = {
+    # every commit is fsynced, WAL only so that readers and the writer do not block each other
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    # WAL with synchronous=NORMAL: no fsync per commit, a power loss may lose the last
+    # transactions but never corrupts the database
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -16000,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    # for imports and generated datasets only: a crash in the middle of a load may corrupt
+    # the database, rebuild it from scratch in that case
+    "bulk-load": {
+        "journal_mode": "TRUNCATE",
+        "synchronous": "OFF",
+        "mmap_size": 1073741824,
+        "cache_size": -262144,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 30000,
+    },
+}
+
+DEFAULT_PRESET = "balanced"
+
+_ALLOWED_VALUES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+_INTEGER_SETTINGS = {"mmap_size", "cache_size", "busy_timeout"}
+
+
+def resolve_profile(settings=None):
+    """
+    Builds the profile described by a `sqlite:` configuration section.
+
+    Args:
+        settings (dict, optional): The configuration section, the one of configuration.yml if None.
+
+    Returns:
+        dict: PRAGMA name -> value, validated.
+
+    Raises:
+        ValueError: If the preset is unknown or a setting has an invalid name or value.
+    """
+    if settings is None:
+        settings = config.config.get("sqlite") or {}
+    settings = dict(settings)
+    preset = settings.pop("profile", DEFAULT_PRESET)
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown SQLite profile '{preset}', expected one of {sorted(PRESETS)}.")
+
+    profile = dict(PRESETS[preset])
+    for name, value in settings.items():
+        if name in _INTEGER_SETTINGS:
+            profile[name] = int(value)
+        elif name in _ALLOWED_VALUES:
+            value = str(value).upper()
+            if value not in _ALLOWED_VALUES[name]:
+                raise ValueError(f"Invalid value '{value}' for SQLite setting '{name}'.")
+            profile[name] = value
+        else:
+            raise ValueError(f"Unknown SQLite setting '{name}'.")
+    return profile
+
+
+def apply_profile(conn, profile):
+    """
+    Applies a profile to an open connection.
+    journal_mode is persistent in the database file, the other settings only last for the connection.
+
+    Args:
+        conn (sqlite3.Connection): The connection to configure.
+        profile (dict): Output of resolve_profile().
+    """
+    # busy_timeout first, switching journal mode may have to wait for other connections
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+    conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+    conn.execute(f"PRAGMA temp_store = {profile['temp_store']}")
@@ -0,0 +1,398 @@
+"""
+Opt-in SQL statement tracing and slow-query log.
+
+While tracing is enabled, the connections opened by the connection manager (and the reporting
+connections) time every statement they run:
+- per statement: calls, total and maximum time, rows returned and SQLite statements run;
+- statements slower than slow_ms are also written, with their EXPLAIN QUERY PLAN, to the
+  slow-query log and kept in memory for the diagnostics menu.
+
+The time of a statement covers its execute call and the fetches of its rows, which is when
+SQLite does the work of a SELECT. A statement is recorded once its cursor is exhausted,
+executes the next statement or is closed. Statements are grouped by their text with the
+whitespace collapsed; runs of placeholders (IN lists) count as one. The parameters are never
+logged, they can hold passwords and keys. The SQLite statements count comes from the trace
+callback of the connection: the implicit BEGIN of the sqlite3 module and the triggers fired by
+a write add to it.
+
+Tracing is chosen when a connection opens: enable it before the first database access, from
+the configuration (tracing: enabled) or with enable(). Disabled, connections are plain
+sqlite3 connections with no overhead.
+
+    tracing.enable(slow_ms=50)
+    ...
+    for stats in tracing.get_tracer().statistics(order_by="total_ms", limit=10):
+        print(stats.total_ms, stats.calls, stats.sql)
+"""
+
+import collections
+import datetime
+import logging
+import re
+import sqlite3
+import threading
+import time
+from config import config
+from session.logging import setup_logging
+
+DEFAULTS = {"enabled": False, "slow_ms": 100, "keep": 200, "slow_log": "../../slow_queries.log"}
+
+StatementStats = collections.namedtuple("StatementStats",
+                                        "sql calls total_ms mean_ms max_ms rows statements")
+SlowQuery = collections.namedtuple("SlowQuery", "time sql elapsed_ms rows plan")
+
+ORDER_BY = ("total_ms", "mean_ms", "max_ms", "calls", "rows", "statements")
+
+_PLACEHOLDERS = re.compile(r"\?(\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+def settings():
+    """
+    Returns:
+        dict: The `tracing:` configuration section completed with the defaults.
+    """
+    values = dict(DEFAULTS)
+    values.update(config.config.get("tracing") or {})
+    return values
+
+
+def normalize(sql):
+    """
+    Returns:
+        str: The statement with the whitespace collapsed and runs of placeholders written as "?, ...".
+    """
+    return _PLACEHOLDERS.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())
+
+
+def explain(conn, sql, parameters=()):
+    """
+    Returns:
+        list of str: The EXPLAIN QUERY PLAN lines of a statement, empty for statements without a plan.
+    """
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    # a plain cursor: the plan query itself is not traced
+    cur = sqlite3.Cursor(conn)
+    try:
+        return [row[3] for row in cur.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+    finally:
+        cur.close()
+
+
+class Tracer:
+    """
+    Statement statistics and recent slow queries, shared by every traced connection.
+
+    Attributes:
+        slow_ms (float): Statements taking at least this many milliseconds are slow queries.
+        keep (int): Number of recent slow queries kept in memory.
+    """
+
+    def __init__(self, slow_ms=100, keep=200, slow_log=None):
+        """
+        Args:
+            slow_ms (float): Slow query threshold in milliseconds.
+            keep (int): Number of recent slow queries kept in memory.
+            slow_log (str, optional): Slow-query log file, relative to the session package like the
+                other application logs. Slow queries are only kept in memory if None.
+        """
+        self.slow_ms = slow_ms
+        self.keep = keep
+        self._logger = None if slow_log is None else setup_logging(
+            slow_log, logging.WARNING, '%(asctime)s - %(message)s')
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._slow = collections.deque(maxlen=keep)
+
+    def record(self, conn, sql, parameters, elapsed, rows, statements):
+        """
+        Adds one run of a statement to the statistics.
+
+        Args:
+            conn (sqlite3.Connection): Connection the statement ran on, used to explain a slow query.
+            sql (str): The statement.
+            parameters: Parameters of the run, only used to explain a slow query.
+            elapsed (float): Seconds spent executing the statement and fetching its rows.
+            rows (int): Rows fetched.
+            statements (int): SQLite statements run, as reported by the trace callback.
+        """
+        key = normalize(sql)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = [0, 0.0, 0.0, 0, 0]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+            entry[3] += rows
+            entry[4] += statements
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < self.slow_ms:
+            return
+        plan = explain(conn, sql, parameters)
+        slow = SlowQuery(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), key, elapsed_ms, rows, plan)
+        with self._lock:
+            self._slow.append(slow)
+        if self._logger is not None:
+            self._logger.warning(f"{elapsed_ms:.1f} ms, {rows} rows: {key} | plan: {'; '.join(plan) or '-'}")
+
+    def statistics(self, order_by="total_ms", contains=None, limit=None):
+        """
+        Args:
+            order_by (str): One of ORDER_BY, largest first.
+            contains (str, optional): Only statements containing this text, case insensitive.
+            limit (int, optional): Maximum number of statements.
+
+        Returns:
+            list of StatementStats: One entry per statement.
+
+        Raises:
+            ValueError: If order_by is not one of ORDER_BY.
+        """
+        if order_by not in ORDER_BY:
+            raise ValueError(f"order_by must be one of {', '.join(ORDER_BY)}")
+        with self._lock:
+            items = [(sql, list(entry)) for sql, entry in self._stats.items()]
+        if contains:
+            items = [(sql, entry) for sql, entry in items if contains.lower() in sql.lower()]
+        stats = [StatementStats(sql, calls, total * 1000, total * 1000 / calls, largest * 1000, rows, statements)
+                 for sql, (calls, total, largest, rows, statements) in items]
+        stats.sort(key=lambda s: getattr(s, order_by), reverse=True)
+        return stats[:limit] if limit is not None else stats
+
+    def slow_queries(self, limit=None):
+        """
+        Args:
+            limit (int, optional): Maximum number of slow queries.
+
+        Returns:
+            list of SlowQuery: The most recent slow queries, newest first.
+        """
+        with self._lock:
+            slow = list(reversed(self._slow))
+        return slow[:limit] if limit is not None else slow
+
+    def reset(self):
+        """
+        Clears the statistics and the slow queries kept in memory. The slow-query log is kept.
+        """
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+class _Run:
+    """One execution of a statement, from its execute call to its last fetch."""
+
+    __slots__ = ("sql", "parameters", "elapsed", "rows", "statements")
+
+    def __init__(self, sql, parameters):
+        self.sql = sql
+        self.parameters = parameters
+        self.elapsed = 0.0
+        self.rows = 0
+        self.statements = 0
+
+
+class TracedCursor(sqlite3.Cursor):
+    """
+    Cursor timing its statements and counting the rows it returns, see TracedConnection.
+    """
+
+    _run = None
+
+    def _timed(self, run, call, *args):
+        conn = self.connection
+        conn._tracing_run = run
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            run.elapsed += time.perf_counter() - start
+            conn._tracing_run = None
+
+    def _finish(self):
+        run, self._run = self._run, None
+        if run is not None:
+            tracer = _tracer
+            if tracer is not None:
+                tracer.record(self.connection, run.sql, run.parameters, run.elapsed, run.rows, run.statements)
+
+    def _start(self, sql, parameters, call, *args):
+        self._finish()
+        self._run = _Run(sql, parameters)
+        try:
+            self._timed(self._run, call, *args)
+        except BaseException:
+            self._finish()
+            raise
+        if self.description is None:
+            # no rows to fetch: the statement is done
+            self._finish()
+        return self
+
+    def execute(self, sql, parameters=(), /):
+        return self._start(sql, parameters, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        rows = iter(seq_of_parameters)
+        first = next(rows, None)
+        if first is None:
+            return self._start(sql, (), super().executemany, sql, ())
+        # the first parameter set explains the statement if it is slow
+        return self._start(sql, first, super().executemany, sql, _chain(first, rows))
+
+    def executescript(self, sql_script, /):
+        return self._start(sql_script, (), super().executescript, sql_script)
+
+    def fetchone(self):
+        run = self._run
+        if run is None:
+            return super().fetchone()
+        row = self._timed(run, super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            run.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        run = self._run
+        size = self.arraysize if size is None else size
+        if run is None:
+            return super().fetchmany(size)
+        rows = self._timed(run, super().fetchmany, size)
+        run.rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        run = self._run
+        if run is None:
+            return super().fetchall()
+        rows = self._timed(run, super().fetchall)
+        run.rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        run = self._run
+        if run is None:
+            return super().__next__()
+        try:
+            row = self._timed(run, super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        run.rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+def _chain(first, rows):
+    yield first
+    yield from rows
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    sqlite3.Connection subclass timing the statements of its cursors and of its execute,
+    executemany, executescript, commit and rollback shortcuts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tracing_run = None
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        run = self._tracing_run
+        if run is not None:
+            run.statements += 1
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # the sqlite3 shortcuts open their cursor in C, without going through cursor()
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script, /):
+        return self.cursor().executescript(sql_script)
+
+    def _end(self, sql, call):
+        run = _Run(sql, ())
+        self._tracing_run = run
+        start = time.perf_counter()
+        try:
+            call()
+        finally:
+            run.elapsed = time.perf_counter() - start
+            self._tracing_run = None
+            tracer = _tracer
+            if tracer is not None and run.statements:
+                tracer.record(self, sql, (), run.elapsed, 0, run.statements)
+
+    def commit(self):
+        self._end("COMMIT", super().commit)
+
+    def rollback(self):
+        self._end("ROLLBACK", super().rollback)
+
+
+_tracer = None
+
+
+def enable(slow_ms=None, keep=None, slow_log=None):
+    """
+    Enables tracing for the connections opened from now on, with fresh statistics.
+
+    Args:
+        slow_ms (float, optional): Slow query threshold in milliseconds, tracing: slow_ms if None.
+        keep (int, optional): Recent slow queries kept in memory, tracing: keep if None.
+        slow_log (str, optional): Slow-query log file, tracing: slow_log if None.
+
+    Returns:
+        Tracer: The tracer collecting the statistics.
+    """
+    global _tracer
+    values = settings()
+    _tracer = Tracer(values["slow_ms"] if slow_ms is None else slow_ms,
+                     values["keep"] if keep is None else keep,
+                     slow_log or values["slow_log"])
+    return _tracer
+
+
+def disable():
+    """
+    Disables tracing. Connections opened while it was enabled stop recording, new ones are not traced.
+    """
+    global _tracer
+    _tracer = None
+
+
+def enabled():
+    """
+    Returns:
+        bool: True if tracing is enabled.
+    """
+    return _tracer is not None
+
+
+def get_tracer():
+    """
+    Returns:
+        Tracer: The active tracer, None if tracing is disabled.
+    """
+    return _tracer
@@ -0,0 +1,126 @@
+"""
+Per-user credit and activity totals.
+
+The user_stats table (schema migration 3) holds, for every username, the totals that would
+otherwise need a scan of Transactions and Cron_Activities:
+
+    minted, burned            credits minted to / burned from the user
+    transferred_in/out        credits received from / given to other users (TRANSFER)
+    pending_activities        activities with state 0
+    processed_activities      activities with state 1
+    pending_co2               CO2 reduction of the pending activities
+
+It is kept up to date by triggers on the inserts and updates of those two tables. Rows are
+never deleted from Transactions and Cron_Activities by the application, and there are no
+DELETE triggers: totals survive the archiving of old rows (db.archive), which is why the
+command below also reads the archive files.
+
+Recompute the table from scratch and check it:
+    python -m db.user_stats [--rebuild] [--db PATH]
+"""
+
+import argparse
+import sqlite3
+from config import config
+from db import archive
+
+COLUMNS = ("minted", "burned", "transferred_in", "transferred_out",
+           "pending_activities", "processed_activities", "pending_co2")
+
+def aggregate_query(schemas=("main",)):
+    """
+    Args:
+        schemas (sequence of str): Databases holding Transactions and Cron_Activities rows, e.g. the
+            main database and its attached archives (see db.archive.attach_archives).
+
+    Returns:
+        str: Query computing the totals from the base tables, one row per username.
+    """
+    rows = []
+    for schema in schemas:
+        rows.append(f"""
+        SELECT username_to AS username,
+               CASE WHEN type = 'MINT' THEN amount ELSE 0 END AS minted,
+               CASE WHEN type = 'BURN' THEN amount ELSE 0 END AS burned,
+               CASE WHEN type = 'TRANSFER' THEN amount ELSE 0 END AS transferred_in,
+               0 AS transferred_out, 0 AS pending_activities, 0 AS processed_activities, 0 AS pending_co2
+        FROM {schema}.Transactions WHERE username_to IS NOT NULL
+        UNION ALL
+        SELECT username_from, 0, 0, 0, CASE WHEN type = 'TRANSFER' THEN amount ELSE 0 END, 0, 0, 0
+        FROM {schema}.Transactions WHERE username_from IS NOT NULL
+        UNION ALL
+        SELECT username, 0, 0, 0, 0, state = 0, state = 1, CASE WHEN state = 0 THEN co2_reduction ELSE 0 END
+        FROM {schema}.Cron_Activities""")
+    return f"""
+    SELECT username, SUM(minted), SUM(burned), SUM(transferred_in), SUM(transferred_out),
+           SUM(pending_activities), SUM(processed_activities), SUM(pending_co2)
+    FROM ({"        UNION ALL".join(rows)}
+    )
+    GROUP BY username"""
+
+
+# Totals computed from the tables of the main database only.
+AGGREGATE_QUERY = aggregate_query()
+
+
+def rebuild(conn, schemas=("main",)):
+    """
+    Recomputes user_stats from Transactions and Cron_Activities.
+    Nothing is committed, the caller owns the transaction.
+
+    Args:
+        conn (sqlite3.Connection): Connection to a database at schema version 3 or later.
+        schemas (sequence of str): Databases to aggregate, add the attached archives for the full history.
+
+    Returns:
+        int: Number of users in the rebuilt table.
+    """
+    conn.execute("DELETE FROM user_stats")
+    conn.execute(f"INSERT INTO user_stats (username, {', '.join(COLUMNS)}) {aggregate_query(schemas)}")
+    return conn.execute("SELECT COUNT(*) FROM user_stats").fetchone()[0]
+
+
+def verify(conn, tolerance=1e-6, schemas=("main",)):
+    """
+    Compares user_stats with the totals recomputed from the base tables.
+    A user missing on one side counts as all zeros.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        tolerance (float): Allowed difference on pending_co2, summed in a different order.
+        schemas (sequence of str): Databases to aggregate, add the attached archives for the full history.
+
+    Returns:
+        list of tuple: (username, column, expected, stored) for every difference, empty if consistent.
+    """
+    zeros = (0,) * len(COLUMNS)
+    expected = {row[0]: row[1:] for row in conn.execute(aggregate_query(schemas))}
+    stored = {row[0]: row[1:] for row in conn.execute(f"SELECT username, {', '.join(COLUMNS)} FROM user_stats")}
+
+    differences = []
+    for username in sorted(expected.keys() | stored.keys()):
+        for column, want, have in zip(COLUMNS, expected.get(username, zeros), stored.get(username, zeros)):
+            if abs((want or 0) - (have or 0)) > tolerance:
+                differences.append((username, column, want, have))
+    return differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check, and optionally rebuild, the user_stats aggregates.")
+    parser.add_argument("--db", default=config.config["db_path"], help="database file (default: configured db_path)")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the table from scratch before checking it")
+    args = parser.parse_args()
+
+    con = sqlite3.connect(args.db)
+    # archived rows still count in the totals
+    sources = ["main", *archive.attach_archives(con)]
+    if args.rebuild:
+        with con:
+            print(f"user_stats rebuilt for {rebuild(con, sources)} user(s).")
+    problems = verify(con, schemas=sources)
+    con.close()
+
+    for username, column, want, have in problems:
+        print(f"{username}: {column} is {have}, expected {want}")
+    print(f"{len(problems)} difference(s) found." if problems else "user_stats is consistent.")
+    raise SystemExit(1 if problems else 0)
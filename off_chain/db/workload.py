@@ -0,0 +1,266 @@
+"""
+Synthetic workload: a realistic dataset of any size, reproducible from a seed.
+
+The tables of an empty database are filled through the bulk paths of DatabaseOperations, so
+triggers (user_stats, full-text indexes) and constraints run as for the application's writes.
+Sizes follow --rows, the number of Transactions:
+
+    Credentials, Accounts   rows / 1000 (at least 25), across the five roles
+    Activities              rows / 2, of the kinds of the ACTIVITIES catalog
+    Accounts_Activities     one per activity, linking it to its account
+    Cron_Activities         one per activity; burned (2) or minted (1) when old, mostly pending (0) when recent
+    Products                rows / 10, one per NFT id
+    Transactions            rows; MINT and BURN by certifiers, TRANSFER between accounts
+
+As in the CLI, every activity record has its own Activities row and Accounts_Activities link,
+certifiers aside. Records are spread over accounts with a Zipf skew, a few accounts owning most of them, and
+their dates over the last --days days in insertion order, so archiving and date ranges have
+a history to work on. The same seed and end date give the same rows, password salts and
+encrypted private keys aside. Passwords are hashed with the low KDF_PARAMS cost: the hash
+format is the real one and check_credentials upgrades it on the first login.
+
+    python -m db.workload --db bench.sqlite --rows 1000000 [--seed 42] [--days 730] [--profile bulk-load]
+"""
+
+import argparse
+import bisect
+import datetime
+import itertools
+import random
+import time
+from collections import namedtuple
+from faker import Faker
+from db import connection_manager, password_kdf, sqlite_profile
+
+Sizes = namedtuple("Sizes", ["accounts", "activities", "products", "transactions"])
+
+ROLES = {"FARMER": 0.40, "PRODUCER": 0.20, "SELLER": 0.20, "CARRIER": 0.15, "CERTIFIER": 0.05}
+
+ACTIVITIES = (
+    ("investment in a project for reduction", "Solar panels on farm buildings"),
+    ("investment in a project for reduction", "Biogas plant fed with manure and crop residues"),
+    ("investment in a project for reduction", "Electric tractor replacing a diesel one"),
+    ("investment in a project for reduction", "Drip irrigation with rainwater storage"),
+    ("investment in a project for reduction", "Heat pump for the dairy cold chain"),
+    ("investment in a project for reduction", "Insulation of warehouses and cold rooms"),
+    ("investment in a project for reduction", "Wind turbine for the processing plant"),
+    ("investment in a project for reduction", "Reforestation of marginal land"),
+    ("investment in a project for reduction", "Wetland restoration along the farm streams"),
+    ("investment in a project for reduction", "Electric delivery vans for the last mile"),
+    ("performing an action", "Cover crops between the main seasons"),
+    ("performing an action", "Crop rotation with nitrogen fixing legumes"),
+    ("performing an action", "Composting of organic waste"),
+    ("performing an action", "Rotational grazing on permanent pasture"),
+    ("performing an action", "Reduced tillage of arable fields"),
+    ("performing an action", "Hedgerow planting around the fields"),
+    ("performing an action", "Route optimization of the delivery fleet"),
+    ("performing an action", "Returnable crates instead of single use packaging"),
+    ("performing an action", "Unsold food donated instead of discarded"),
+    ("performing an action", "Organic fertilizer instead of synthetic nitrogen"),
+)
+
+# words of the free-text notes appended to the activity descriptions, searched by search_activities
+VOCABULARY = ("solar", "panel", "wind", "turbine", "compost", "irrigation", "drip", "biogas", "cover", "crop",
+              "hedgerow", "electric", "tractor", "rainwater", "storage", "insulation", "heat", "pump", "organic",
+              "fertilizer", "rotation", "grazing", "pasture", "reforestation", "wetland", "restoration", "field",
+              "season", "harvest", "orchard", "vineyard", "olive", "greenhouse", "barn", "herd", "milk", "soil",
+              "carbon", "emission", "energy", "water", "waste", "transport", "delivery", "packaging", "report")
+
+PRODUCTS = {
+    "FRUIT": ("Apples", "Pears", "Oranges", "Lemons", "Peaches", "Apricots", "Cherries", "Grapes", "Figs", "Kiwis"),
+    "MEAT": ("Beef", "Pork", "Chicken", "Lamb", "Turkey", "Veal", "Sausages", "Prosciutto"),
+    "DAIRY": ("Milk", "Butter", "Yogurt", "Mozzarella", "Ricotta", "Parmigiano", "Pecorino", "Gorgonzola"),
+}
+# category weight and log-normal CO2 emission (mu, sigma), meat weighing far more than fruit
+CATEGORIES = {"FRUIT": (0.5, 0.5, 0.5), "MEAT": (0.2, 3.3, 0.6), "DAIRY": (0.3, 2.3, 0.6)}
+QUALIFIERS = ("Organic", "Local", "Seasonal", "Fresh", "Free range", "Mountain", "Aged", "Heritage")
+
+TRANSACTION_TYPES = {"MINT": 0.55, "TRANSFER": 0.30, "BURN": 0.15}
+
+KDF_PARAMS = password_kdf.KdfParams(1024, 8, 1)
+ZIPF_EXPONENT = 1.1
+
+
+def sizes(rows):
+    """
+    Returns:
+        Sizes: Number of rows generated per table for the given number of Transactions.
+    """
+    return Sizes(max(25, rows // 1000), rows // 2, rows // 10, rows)
+
+
+class _Zipf:
+    """Draws items with a Zipf skew, the first items being the most frequent."""
+
+    def __init__(self, rng, items, exponent=ZIPF_EXPONENT):
+        self.rng = rng
+        self.items = list(items)
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(len(self.items))))
+
+    def __call__(self):
+        return self.items[bisect.bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+
+
+def _accounts(fake, rng, count):
+    roles = list(ROLES)
+    # every role at least once, the rest by weight
+    drawn = roles + rng.choices(roles, weights=list(ROLES.values()), k=count - len(roles))
+    accounts = []
+    for i, role in enumerate(drawn):
+        username = f"{fake.user_name()}_{i}"
+        accounts.append((role, username, fake.first_name(), fake.last_name(), fake.city(), fake.city(),
+                         fake.date_of_birth(minimum_age=18, maximum_age=80).isoformat(),
+                         f"{username}@{fake.free_email_domain()}", f"3{i:09d}"))
+    return accounts
+
+
+def _spread_dates(ops, table, column, first_id, start, end):
+    """Dates the rows of table with id >= first_id from start to end, in id order."""
+    last_id = ops.conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+    if last_id is None or last_id < first_id:
+        return
+    span = int((end - start).total_seconds())
+    with ops.transaction():
+        ops.conn.execute(f"""UPDATE {table}
+                             SET {column} = datetime(?, printf('+%d seconds', (id - ?) * ? / ?))
+                             WHERE id >= ?""",
+                         (start.strftime("%Y-%m-%d %H:%M:%S"), first_id, span, max(last_id - first_id, 1), first_id))
+
+
+def _next_id(ops, table):
+    """Id AUTOINCREMENT gives to the next row of table."""
+    return ops.conn.execute(f"""SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                                           COALESCE((SELECT MAX(id) FROM {table}), 0)) + 1""", (table,)).fetchone()[0]
+
+
+def generate(ops, rows, seed=42, days=730, end=None, kdf_params=KDF_PARAMS, chunk_size=None, progress=None):
+    """
+    Fills an empty database with a synthetic dataset, see the module documentation.
+
+    Args:
+        ops (DatabaseOperations): Operations on the database to fill.
+        rows (int): Number of Transactions, the other tables are sized from it.
+        seed (int): Seed of every random draw.
+        days (int): Length of the generated history, ending at `end`.
+        end (datetime.datetime, optional): Date of the newest records, now (UTC, to the second) if None.
+        kdf_params (password_kdf.KdfParams): scrypt cost of the generated password hashes.
+        chunk_size (int, optional): Rows per executemany call of the bulk paths.
+        progress (callable, optional): Called as progress(table, rows, seconds) after every table.
+
+    Returns:
+        dict: Table name -> number of inserted rows.
+
+    Raises:
+        ValueError: If the database already has credentials.
+    """
+    if ops.conn.execute("SELECT 1 FROM Credentials LIMIT 1").fetchone():
+        raise ValueError("The database already has credentials, generate into an empty database.")
+    size = sizes(rows)
+    end = end or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+    start = end - datetime.timedelta(days=days)
+    rng = random.Random(seed)
+    fake = Faker("it_IT")
+    fake.seed_instance(seed)
+    inserted = {}
+
+    def step(table, write):
+        began = time.perf_counter()
+        inserted[table] = write()
+        if progress is not None:
+            progress(table, inserted[table], time.perf_counter() - began)
+
+    # ---------- accounts ----------
+    accounts = _accounts(fake, rng, size.accounts)
+    step("Credentials", lambda: ops.register_creds_many(
+        ((account[1], fake.password(length=12), f"0x{rng.getrandbits(160):040x}", f"0x{rng.getrandbits(256):064x}")
+         for account in accounts), chunk_size, kdf_params)[0])
+    step("Accounts", lambda: ops.insert_actors_many(accounts, chunk_size)[0])
+
+    certifiers = [account[1] for account in accounts if account[0] == "CERTIFIER"]
+    members = [account[1] for account in accounts if account[0] != "CERTIFIER"]
+    # the same ranking of the accounts, from the most active, for every kind of record
+    rng.shuffle(members)
+    pick_member = _Zipf(rng, members)
+
+    # ---------- activities ----------
+    notes = [fake.sentence(nb_words=8, ext_word_list=VOCABULARY) for _ in range(2000)]
+
+    def activities():
+        # replayed for each of the three tables, from a generator of its own
+        activity_rng = random.Random(f"{seed}:activities")
+        pick_owner = _Zipf(activity_rng, members)
+        pick_kind = _Zipf(activity_rng, ACTIVITIES)
+        recent = size.activities * 9 // 10
+        for i in range(size.activities):
+            type, kind = pick_kind()
+            state = activity_rng.choices((0, 1, 2), weights=(70, 25, 5) if i >= recent else (2, 28, 70))[0]
+            yield (type, f"{kind}: {activity_rng.choice(notes)}", pick_owner(), state,
+                   round(activity_rng.lognormvariate(3, 1), 2))
+
+    first_activity = _next_id(ops, "Activities")
+    step("Activities", lambda: ops.register_activities_many(
+        ((type, description) for type, description, _, _, _ in activities()), chunk_size)[0])
+    step("Accounts_Activities", lambda: ops.register_account_activities_many(
+        ((username, first_activity + i) for i, (_, _, username, _, _) in enumerate(activities())), chunk_size)[0])
+    first = _next_id(ops, "Cron_Activities")
+    step("Cron_Activities", lambda: ops.register_cron_activities_many(
+        ((description, username, state, first_activity + i, co2_reduction)
+         for i, (_, description, username, state, co2_reduction) in enumerate(activities())), chunk_size)[0])
+    _spread_dates(ops, "Cron_Activities", "creation_datetime", first, start, end)
+
+    # ---------- products ----------
+    categories = list(CATEGORIES)
+    category_weights = [weight for weight, _, _ in CATEGORIES.values()]
+
+    def products():
+        for nft_id in range(1, size.products + 1):
+            category = rng.choices(categories, weights=category_weights)[0]
+            _, mu, sigma = CATEGORIES[category]
+            yield (f"{rng.choice(QUALIFIERS)} {rng.choice(PRODUCTS[category]).lower()}", category,
+                   int(rng.lognormvariate(mu, sigma)) + 1, nft_id)
+
+    first = _next_id(ops, "Products")
+    step("Products", lambda: ops.insert_products_many(products(), chunk_size)[0])
+    _spread_dates(ops, "Products", "harvestDate", first, start, end)
+
+    # ---------- transactions ----------
+    types = list(TRANSACTION_TYPES)
+    type_weights = list(TRANSACTION_TYPES.values())
+
+    def transactions():
+        for _ in range(size.transactions):
+            type = rng.choices(types, weights=type_weights)[0]
+            sender = pick_member() if type == "TRANSFER" else rng.choice(certifiers)
+            yield sender, pick_member(), int(rng.lognormvariate(3, 1)) + 1, type, f"0x{rng.getrandbits(256):064x}"
+
+    first = _next_id(ops, "Transactions")
+    step("Transactions", lambda: ops.insert_transactions_many(transactions(), chunk_size)[0])
+    _spread_dates(ops, "Transactions", "timestamp", first, start, end)
+
+    return inserted
+
+
+if __name__ == "__main__":
+    from db.db_operations import DatabaseOperations
+
+    parser = argparse.ArgumentParser(description="Fill an empty database with a reproducible synthetic dataset.")
+    parser.add_argument("--db", required=True, help="database file, created if missing")
+    parser.add_argument("--rows", type=int, default=10_000, help="number of Transactions (default: 10000)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=730, help="length of the history (default: 730)")
+    parser.add_argument("--profile", default="bulk-load", choices=sorted(sqlite_profile.PRESETS),
+                        help="SQLite profile of the load (default: bulk-load)")
+    parser.add_argument("--chunk-size", type=int, help="rows per executemany call (default: bulk_chunk_size)")
+    args = parser.parse_args()
+
+    connection_manager.init_manager(args.db, profile=sqlite_profile.resolve_profile({"profile": args.profile}))
+    ops = DatabaseOperations()
+    began = time.perf_counter()
+    try:
+        generate(ops, args.rows, args.seed, args.days, chunk_size=args.chunk_size,
+                 progress=lambda table, count, seconds: print(f"{table:<20} {count:>12,} rows {seconds:>9.1f} s"))
+    finally:
+        ops.close()
+        connection_manager.close_manager()
+        password_kdf.shutdown_pool()
+    print(f"{args.db} generated in {time.perf_counter() - began:.1f} s (seed {args.seed}).")
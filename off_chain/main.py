@@ -6,9 +6,22 @@ and displays the menu to the user.
 
 from cli.cli import CommandLineInterface
 from session.session import Session
+from db import archive, tracing
+from db.connection_manager import close_manager
+from db.password_kdf import shutdown_pool
 
 if __name__ == "__main__":
+    if tracing.settings()["enabled"]:
+        # before the first connection opens: only connections opened while enabled are traced
+        tracing.enable()
     new_session = Session()
     cli = CommandLineInterface(new_session)
-    while True:
-        cli.print_menu()
+    if archive.settings()["auto"]:
+        # keep the hot tables small: move the history older than archive: hot_days at startup
+        cli.controller.archive_history()
+    try:
+        while True:
+            cli.print_menu()
+    finally:
+        close_manager()
+        shutdown_pool()
@@ -6,6 +6,8 @@ class Accounts(Model):
     extending the functionality provided by the Model class.
     """
 
+    __slots__ = ('id', 'username', 'type', 'name', 'lastname', 'birthday', 'birth_place', 'residence', 'phone', 'mail', 'credential_id')
+
     def __init__(self, id, username, type, name,  lastname, birthday, birth_place, residence, phone, mail):
         """
         Initializes a new instance of Account class with the provided account  details.
@@ -22,7 +24,6 @@ class Accounts(Model):
         - phone: The phone number of the account holder (optional)
         - mail: The email address of the account holder (optional)
         """
-        super().__init__()
         self.id = id
         self.username = username
         self.type = type
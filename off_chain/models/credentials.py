@@ -7,6 +7,8 @@ class Credentials(Model):
     extending the functionality provided by the Model class.
     """
 
+    __slots__ = ('id', 'username', 'password', 'public_key', 'private_key', 'temp_code', 'temp_code_validity', 'update_datetime', 'creation_datetime')
+
     def __init__(self, id, username, password, public_key, private_key, temp_code, temp_code_validity, update_datetime, creation_datetime):       
         """
         Initializes a new instance of Credentials class with the provided user credentials details.
@@ -30,7 +32,6 @@ class Credentials(Model):
         l'altro  public: "The public key used for the users authentication on the platform (separate from the blockchain key)" ?? separato o no poi?
         private : "The private key used for the users authentication on the platform (separate from the blockchain key)" 
         """
-        super().__init__()
         self.id = id
         self.username = username
         self.password = password
@@ -6,6 +6,9 @@ class Cron_Activities(Model):
     This class defines the Cron_Activities model, which tracks detailed records of activities,  
     extending the functionality provided by the Model class.
     """
+
+    __slots__ = ('id', 'description', 'username', 'update_datetime', 'creation_datetime', 'state', 'activity_id', 'co2_reduction')
+
     def __init__(self, id, description, username, update_datetime, creation_datetime, state, activity_id, co2_reduction):
         """
         Initializes a new instance of the Cron_Activities class, representing a specific record of an activity  
@@ -21,7 +24,6 @@ class Cron_Activities(Model):
         - activity_id: The ID of the activity associated with the record  
         - co2_reduction: The amount of CO2 reduced by the activity  
         """
-        super().__init__()
         self.id = id
         self.description = description
         self.username = username
@@ -1,16 +1,24 @@
-import sqlite3
-from config import config
-
 class Model:
-    """Base model to be extended for implementing other models."""
-    
-    def __init__(self):
-        """Constructor that initializes the database connection."""
-        self.conn = sqlite3.connect(config.config["db_path"])
-        self.cur = self.conn.cursor()
-    
-    def __del__(self):
-        """Destructor that closes the database connection."""
-        self.conn.close()
+    """
+    Base model to be extended for implementing other models.
+
+    Models are plain records: they hold no database connection and declare their fields
+    in __slots__, so an instance carries no per-instance __dict__.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """
+        Row factory building an instance straight from a cursor row, use it as
+        `cursor.row_factory = Model.from_row` on a query whose columns follow the constructor order.
 
+        Args:
+            cursor (sqlite3.Cursor): The cursor that produced the row.
+            row (tuple): The row values.
 
+        Returns:
+            Model: An instance of the calling class.
+        """
+        return cls(*row)
@@ -7,6 +7,8 @@ class Transaction(Model):
     extending the functionality provided by the Model class.
     """
 
+    __slots__ = ('id', 'username_from', 'username_to', 'amount', 'type', 'tx_hash', 'timestamp')
+
     def __init__(self, id, username_from, username_to, amount, type, tx_hash, timestamp):
         """
         Initializes a new instance of the Transaction class, representing a specific action or investment.
@@ -21,7 +23,6 @@ class Transaction(Model):
         - timestamp: Timestamp of the transaction
 
         """
-        super().__init__()
         self.id = id
         self.username_from = username_from
         self.username_to = username_to
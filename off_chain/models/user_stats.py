@@ -0,0 +1,63 @@
+from models.model_base import Model
+
+class UserStats(Model):
+    """
+    This class defines the UserStats model, which holds the credit and activity totals of a user
+    kept up to date by the database, extending the functionality provided by the Model class.
+    """
+
+    __slots__ = ('username', 'minted', 'burned', 'transferred_in', 'transferred_out',
+                 'pending_activities', 'processed_activities', 'pending_co2')
+
+    def __init__(self, username, minted=0, burned=0, transferred_in=0, transferred_out=0,
+                 pending_activities=0, processed_activities=0, pending_co2=0.0):
+        """
+        Initializes a new instance of the UserStats class.
+
+        Parameters:
+        - username: The user the totals refer to
+        - minted: Carbon credits minted to the user
+        - burned: Carbon credits burned from the user
+        - transferred_in: Carbon credits received from other users
+        - transferred_out: Carbon credits given to other users
+        - pending_activities: Number of activities waiting to be processed
+        - processed_activities: Number of processed activities
+        - pending_co2: CO2 reduction of the activities waiting to be processed
+        """
+        self.username = username
+        self.minted = minted
+        self.burned = burned
+        self.transferred_in = transferred_in
+        self.transferred_out = transferred_out
+        self.pending_activities = pending_activities
+        self.processed_activities = processed_activities
+        self.pending_co2 = pending_co2
+
+    # Getter methods for each attribute
+    def get_username(self):
+        return self.username
+
+    def get_minted(self):
+        return self.minted
+
+    def get_burned(self):
+        return self.burned
+
+    def get_transferred_in(self):
+        return self.transferred_in
+
+    def get_transferred_out(self):
+        return self.transferred_out
+
+    def get_pending_activities(self):
+        return self.pending_activities
+
+    def get_processed_activities(self):
+        return self.processed_activities
+
+    def get_pending_co2(self):
+        return self.pending_co2
+
+    def get_credit_balance(self):
+        """Credits held according to the recorded transactions: minted + received - burned - given."""
+        return self.minted + self.transferred_in - self.burned - self.transferred_out
@@ -0,0 +1,120 @@
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+from web3.exceptions import TransactionNotFound
+from controllers.action_controller import ActionController
+from controllers.nonce_manager import NonceManager
+from controllers.pending_transaction import TransactionError
+
+def test_nonce_manager_syncs_once_and_allocates_unique_nonces_across_threads():
+    w3 = MagicMock()
+    w3.eth.get_transaction_count.return_value = 7
+    nonces = NonceManager(w3)
+    allocated = []
+
+    def send():
+        for _ in range(50):
+            allocated.append(nonces.allocate('0xA'))
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(allocated) == list(range(7, 207))
+    w3.eth.get_transaction_count.assert_called_once_with('0xA', 'pending')
+
+def test_nonce_manager_fills_gaps_and_resyncs_after_nonce_errors():
+    w3 = MagicMock()
+    w3.eth.get_transaction_count.return_value = 0
+    w3.eth.gas_price = 10
+    nonces = NonceManager(w3, gas_price_ttl=60)
+    assert [nonces.allocate('0xA') for _ in range(4)] == [0, 1, 2, 3]
+
+    assert nonces.release('0xA', 1, ValueError('execution reverted')) is False
+    assert nonces.release('0xA', 3) is False
+    assert [nonces.allocate('0xA') for _ in range(3)] == [1, 3, 4]
+
+    w3.eth.get_transaction_count.return_value = 9
+    assert nonces.release('0xA', 4, ValueError("{'message': 'nonce too low'}")) is True
+    assert nonces.allocate('0xA') == 9
+    assert nonces.stats()["syncs"] == 2
+
+    assert nonces.gas_price() == 10
+    w3.eth.gas_price = 20
+    assert nonces.gas_price() == 10
+
+def test_transact_resyncs_and_retries_once_after_a_nonce_error():
+    with patch('controllers.action_controller.Web3'):
+        act = ActionController()
+    act.w3.eth.get_transaction_count.side_effect = [0, 5]
+    act.w3.eth.gas_price = 1
+    sent = []
+    errors = [ValueError("{'message': 'nonce too low'}")]
+
+    def transact(tx):
+        sent.append(tx['nonce'])
+        if errors:
+            raise errors.pop()
+        return b'\x01' * 32
+
+    mint = MagicMock()
+    mint.return_value.transact.side_effect = transact
+    act.contracts['CarbonCreditToken'] = MagicMock()
+    act.contracts['CarbonCreditToken'].functions.mint = mint
+
+    with patch('controllers.action_controller.log_msg') as log_msg, \
+            patch('controllers.action_controller.log_error') as log_error:
+        act.write_data('mint', 'CarbonCreditToken', '0xA', '0xB', 1)
+        assert sent == [0, 5]
+        log_msg.assert_called_once()
+        log_error.assert_not_called()
+
+        errors.extend([ValueError("{'message': 'nonce too low'}")] * 2)
+        act.w3.eth.get_transaction_count.side_effect = [9]
+        with pytest.raises(ValueError):
+            act.write_data('mint', 'CarbonCreditToken', '0xA', '0xB', 1)
+        # one retry only, then the error is logged and raised
+        assert sent == [0, 5, 6, 9]
+        log_error.assert_called_once()
+        assert 'nonce too low' in log_error.call_args.args[0]
+
+def test_submitted_transactions_are_gathered_with_per_transaction_results():
+    with patch('controllers.action_controller.Web3'):
+        act = ActionController()
+    act.w3.eth.get_transaction_count.return_value = 0
+    act.w3.eth.gas_price = 1
+    mint = MagicMock()
+    mint.return_value.transact.side_effect = lambda tx: b'\x01' * 31 + bytes([tx['nonce']])
+    act.contracts['CarbonCreditToken'] = MagicMock()
+    act.contracts['CarbonCreditToken'].functions.mint = mint
+    receipts = {0: {'status': 1, 'blockNumber': 1}, 1: {'status': 0, 'blockNumber': 1}}
+
+    def get_receipt(tx_hash):
+        if tx_hash[-1] not in receipts:
+            raise TransactionNotFound("pending")
+        return receipts[tx_hash[-1]]
+
+    act.w3.eth.get_transaction_receipt.side_effect = get_receipt
+    with patch('controllers.action_controller.log_msg') as log_msg, \
+            patch('controllers.action_controller.log_error') as log_error:
+        pending = [act.submit('mint', 'CarbonCreditToken', '0xA', '0xB', amount) for amount in (1, 2, 3)]
+        mint.return_value.transact.side_effect = ValueError('insufficient funds')
+        pending.append(act.submit('mint', 'CarbonCreditToken', '0xA', '0xB', 4))
+        assert log_msg.call_count == 3
+        log_error.assert_called_once()
+        assert 'insufficient funds' in log_error.call_args.args[0]
+
+        mined, reverted, late, unsent = act.gather(pending, timeout=0)
+        # the unsent transaction was already logged by submit()
+        assert log_error.call_count == 3
+    assert mined == receipts[0]
+    assert isinstance(reverted, TransactionError) and reverted.pending is pending[1] and 'reverted' in str(reverted)
+    assert isinstance(late, TransactionError) and not pending[2].done()
+    assert isinstance(unsent, TransactionError) and 'not sent' in str(unsent) and pending[3].tx_hash is None
+
+    receipts[2] = {'status': 1, 'blockNumber': 2}
+    assert pending[2].result(timeout=0) == receipts[2]
+    # the nonce of the transaction that was not sent is handed out again
+    assert act.nonces.allocate('0xA') == 3
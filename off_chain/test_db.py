@@ -0,0 +1,677 @@
+import datetime
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import threading
+import sqlite3
+import pytest
+from config import config
+from controllers.async_controller import READ_METHODS, AsyncController
+from controllers.controller import Controller
+from db import archive, backup, connection_manager, db_migrations, export, identity_cache, password_kdf, query_plan, sqlite_profile, tracing, user_stats, workload
+from db.db_operations import DatabaseOperations
+from db.reporting import ReportingOperations
+from models.accounts import Accounts
+from session.session import Session
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = connection_manager.init_manager(str(tmp_path / "test.sqlite"), max_connections=2, timeout=0.5)
+    yield manager
+    connection_manager.close_manager()
+
+@pytest.fixture
+def db(manager):
+    ops = DatabaseOperations()
+    yield ops
+    ops.close()
+
+def test_same_thread_shares_one_connection(manager):
+    first = DatabaseOperations()
+    second = DatabaseOperations()
+
+    assert first.conn is second.conn
+    assert manager.open_connections() == 1
+
+    first.close()
+    second.close()
+
+def test_pool_is_bounded(manager):
+    holders = [threading.Event() for _ in range(2)]
+    release = threading.Event()
+
+    def hold(event):
+        with manager.connection():
+            event.set()
+            release.wait()
+
+    threads = [threading.Thread(target=hold, args=(event,)) for event in holders]
+    for thread in threads:
+        thread.start()
+    for event in holders:
+        event.wait()
+
+    with pytest.raises(connection_manager.PoolExhaustedError):
+        manager.acquire()
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert manager.open_connections() == 2
+
+def test_connection_released_from_another_thread_returns_to_the_pool(manager):
+    borrowed = []
+    thread = threading.Thread(target=lambda: borrowed.append(DatabaseOperations()))
+    thread.start()
+    thread.join()
+
+    # e.g. the garbage collector finalizing the instance on this thread
+    borrowed[0].close()
+    assert manager._idle.qsize() == 1
+
+    holders = [DatabaseOperations()]
+    thread = threading.Thread(target=lambda: holders.append(DatabaseOperations()))
+    thread.start()
+    thread.join()
+    assert manager.open_connections() == 2 and holders[0].conn is not holders[1].conn
+    for ops in holders:
+        ops.close()
+    assert manager._idle.qsize() == 2
+
+def test_listing_rows_does_not_open_connections(db, manager):
+    for i in range(50):
+        db.insert_actor('FARMER', f'user_{i}', 'Name', 'Lastname', 'Residence', 'Place', '1990-01-01', f'user_{i}@mail.com', f'3{i:09d}')
+
+    users = db.get_users()
+
+    assert len(users) == 50
+    assert manager.open_connections() == 1
+
+def test_models_are_slotted_records_built_by_the_row_factory(db):
+    db.insert_transaction('certifier', 'farmer', 10, 'MINT', '0x01')
+
+    account = Accounts(1, 'user', 'FARMER', 'Name', 'Lastname', '1990-01-01', None, None, None, None)
+    transaction, = db.get_user_transactions('farmer')
+
+    assert not hasattr(account, '__dict__') and not hasattr(account, 'conn')
+    assert not hasattr(transaction, '__dict__')
+    assert (transaction.get_username_to(), transaction.get_amount(), transaction.get_tx_hash()) == ('farmer', 10, '0x01')
+
+def test_startup_keeps_data_and_skips_applied_migrations(db, tmp_path):
+    db.insert_transaction('certifier', 'farmer', 10, 'MINT', '0x01')
+    db.close()
+
+    connection_manager.init_manager(str(tmp_path / "test.sqlite"))
+    reopened = DatabaseOperations()
+
+    assert db_migrations.migrate(reopened.conn) == []
+    assert db_migrations.current_version(reopened.conn) == db_migrations.latest_version()
+    assert len(reopened.get_user_transactions('farmer')) == 1
+    reopened.close()
+
+def test_test_records_load_only_when_requested(db):
+    assert db.get_activities_to_be_processed() == []
+
+    with_records = DatabaseOperations(load_test_records=True)
+
+    assert len(with_records.get_activities_to_be_processed()) == 2
+    assert with_records.insert_test_records() is False
+    with_records.close()
+
+def test_queries_do_not_scan_whole_tables(db):
+    assert db_migrations.missing_indexes(db.conn) == []
+    assert query_plan.check_query_plans(db) == []
+
+def test_connections_apply_the_sqlite_profile(tmp_path):
+    profile = sqlite_profile.resolve_profile({'profile': 'durable', 'busy_timeout': 1234})
+    manager = connection_manager.init_manager(str(tmp_path / "profile.sqlite"), profile=profile)
+
+    with manager.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    connection_manager.close_manager()
+
+    with pytest.raises(ValueError):
+        sqlite_profile.resolve_profile({'profile': 'fastest'})
+    with pytest.raises(ValueError):
+        sqlite_profile.resolve_profile({'synchronous': 'SOMETIMES'})
+
+def test_bulk_insert_reports_rejected_rows_and_keeps_the_rest(db):
+    rows = [('certifier', f'user_{i}', i, 'MINT', f'0x{i:02x}') for i in range(10)]
+    rows[3] = ('certifier', 'user_3', 3, 'REFUND', '0x03')
+    rows[7] = ('certifier', 'user_7', None, 'BURN', '0x07')
+
+    inserted, failures = db.insert_transactions_many(iter(rows), chunk_size=4)
+
+    assert inserted == 8
+    assert [index for index, _ in failures] == [3, 7]
+    assert db.cur.execute("SELECT COUNT(*) FROM Transactions").fetchone()[0] == 8
+    assert not db.conn.in_transaction
+
+def test_unit_of_work_commits_once(db):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+
+    with db.transaction():
+        activity_id = db.register_activities('performing an action', 'Electric vehicles')
+        db.register_account_activities('farmer', activity_id)
+        db.register_cron_activity('Electric vehicles', 'farmer', 0, activity_id, 12.5)
+
+    db.conn.set_trace_callback(None)
+    assert statements.count('COMMIT') == 1
+    assert len(db.get_activities_by_username('farmer')) == 1
+
+def test_unit_of_work_rolls_back_and_nests(db):
+    other = DatabaseOperations()
+
+    with db.transaction():
+        db.insert_transaction('certifier', 'farmer', 10, 'MINT', '0x01')
+        with pytest.raises(RuntimeError):
+            with other.transaction():
+                other.insert_transaction('certifier', 'farmer', 5, 'BURN', '0x02')
+                raise RuntimeError()
+
+    assert [t.get_type() for t in db.get_user_transactions('farmer')] == ['MINT']
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert_transaction('certifier', 'farmer', 20, 'MINT', '0x03')
+            raise RuntimeError()
+
+    assert len(db.get_user_transactions('farmer')) == 1
+    other.close()
+
+def test_failed_write_aborts_the_unit_of_work(db):
+    assert db.register_cron_activity('Compost', 'farmer', 9, 1, 1.0) == -1
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction():
+            activity_id = db.register_activities('performing an action', 'Compost')
+            db.register_account_activities('farmer', activity_id)
+            db.register_cron_activity('Compost', 'farmer', 9, activity_id, 1.0)
+
+    assert db.cur.execute("SELECT COUNT(*) FROM Activities WHERE description = 'Compost'").fetchone() == (0,)
+    assert db.get_activities_by_username('farmer') == []
+
+    # writes left uncommitted outside a unit of work are not committed by the next one
+    db.cur.execute("INSERT INTO Transactions (username_from, username_to, amount, type) VALUES ('a', 'b', 1, 'MINT')")
+    with db.transaction():
+        db.insert_transaction('certifier', 'farmer', 10, 'MINT', '0x01')
+    assert db.cur.execute("SELECT COUNT(*) FROM Transactions").fetchone() == (1,)
+
+def test_keyset_iterators_match_the_full_listings(db):
+    db.insert_transactions_many([('certifier', 'farmer', i, 'MINT', f'0x{i:02x}') for i in range(7)])
+    db.insert_transactions_many([('farmer', 'seller', i, 'BURN', f'0x{i:02x}') for i in range(5)])
+    # imported rows can be back-dated: the listings follow the timestamps, not the ids
+    db.cur.execute("UPDATE Transactions SET timestamp = '2020-01-01 00:00:00' WHERE id IN (2, 9)")
+    db.cur.execute("UPDATE Transactions SET timestamp = '2021-01-01 00:00:00' WHERE id = 11")
+    db.conn.commit()
+    expected = [t.get_id() for t in db.get_user_transactions('farmer')]
+    assert expected[-3:] == [11, 9, 2]
+
+    for stream in (False, True):
+        assert [t.get_id() for t in db.iter_user_transactions('farmer', page_size=3, stream=stream)] == expected
+        assert [t.get_id() for t in db.iter_user_transactions('farmer', after_id=expected[4], limit=4,
+                                                              page_size=3, stream=stream)] == expected[5:9]
+        assert [u.get_username() for u in db.iter_users(page_size=2, stream=stream)] == \
+               [u.get_username() for u in db.get_users()]
+
+def test_identity_cache_hits_and_is_invalidated_by_writes(db):
+    db.register_creds('farmer', 'Password123!', '0xfarmer', '0xfarmer_private')
+    db.insert_actor('FARMER', 'farmer', 'Name', 'Lastname', 'Residence', 'Place', '1990-01-01', 'farmer@mail.com', '3000000000')
+
+    assert db.get_public_key_by_username('farmer') == '0xfarmer'
+    assert db.get_username_by_public_key('0xfarmer') == 'farmer'
+    assert db.get_identity('farmer').role == 'FARMER'
+    assert db.identity_cache_stats()['hits'] == 2
+    assert db.identity_cache_stats()['misses'] == 1
+
+    # renaming the account moves the role from one cached identity to the other
+    db.register_creds('grower', 'Password123!', '0xgrower', '0xgrower_private')
+    assert db.get_identity('grower').role is None
+    account_id = db.cur.execute("SELECT id FROM Accounts WHERE username = 'farmer'").fetchone()[0]
+    assert db.update_account('grower', 'Name', 'Lastname', '1990-01-01', 'Place', 'Residence', '3000000000',
+                             'farmer@mail.com', account_id) == 0
+    assert db.get_identity('grower').role == 'FARMER' and db.get_identity('farmer').role is None
+    assert db.check_username('grower') == -1
+
+    db.delete_creds(db.get_credentials_id_by_username('farmer'))
+    assert db.get_public_key_by_username('farmer') is None
+    assert db.get_username_by_public_key('0xfarmer') is None
+
+def test_identity_cache_evicts_least_recently_used():
+    cache = identity_cache.IdentityCache(maxsize=2)
+    for i in range(3):
+        cache.put(identity_cache.Identity(f'user_{i}', f'0x{i}', 'FARMER', i))
+
+    assert cache.get(username='user_0') is None
+    assert cache.get(public_key='0x2').username == 'user_2'
+    assert cache.stats()['size'] == 2
+
+def test_query_activities_filters_projects_and_keys_by_id(db):
+    db.register_cron_activities_many([('Solar panels', 'farmer', i % 3, i, 10.0 + i) for i in range(9)])
+    db.register_cron_activity('Electric vehicles', 'carrier', 0, 1, 5.0)
+
+    assert [a.get_id() for a in db.query_activities(username='farmer', states={0})] == \
+           [a.get_id() for a in db.get_activities_to_be_processed_by_username('farmer')]
+
+    pending = db.query_activities(username='farmer', states=(0, 1), key_by_id=True)
+    assert sorted(a.get_state() for a in pending.values()) == [0, 0, 0, 1, 1, 1]
+    assert db.query_activities(activity_id=1, username='carrier', key_by_id=True).keys() == {10}
+
+    rows = db.query_activities(order_by='co2_reduction', descending=True, limit=2, columns=('co2_reduction',))
+    assert [row['co2_reduction'] for row in rows] == [18.0, 17.0]
+    assert db.query_activities(date_from='2000-01-01', date_to='2000-01-02') == []
+
+    with pytest.raises(ValueError):
+        db.query_activities(order_by='id; DROP TABLE Cron_Activities')
+
+def test_async_controller_reads_in_parallel_and_serializes_writes(tmp_path):
+    manager = connection_manager.init_manager(str(tmp_path / "async.sqlite"), max_connections=3)
+    with pytest.raises(ValueError):
+        AsyncController(readers=3)
+    controller = AsyncController(readers=2)
+
+    async def scenario():
+        await asyncio.gather(*(controller.insert_transaction('certifier', 'farmer', i, 'MINT', f'0x{i:02x}')
+                               for i in range(20)))
+        transactions, identity = await asyncio.gather(controller.get_user_transactions('farmer'),
+                                                      controller.get_identity('farmer'))
+        paged = [t async for t in controller.iter_user_transactions('farmer', limit=15, page_size=4)]
+        # a write routed to a reader thread is refused by its query_only connection
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            await controller._submit(controller._reader, controller._read, 'insert_transaction',
+                                     'certifier', 'farmer', 1, 'MINT', '0xff')
+        await controller.aclose()
+        return transactions, identity, paged
+
+    transactions, identity, paged = asyncio.run(scenario())
+
+    assert len(transactions) == 20 and identity is None
+    assert [t.get_id() for t in paged] == list(range(20, 5, -1))
+    assert manager.open_connections() == 3
+    assert manager._idle.qsize() == 3
+    # back in the pool, the reader connections accept writes again
+    assert [conn.execute("PRAGMA query_only").fetchone() for conn in list(manager._idle.queue)] == [(0,)] * 3
+    connection_manager.close_manager()
+
+READ_CALLS = {
+    "get_user_by_username": ("farmer",), "check_unique_email": ("farmer@mail.com",),
+    "check_unique_phone_number": ("3000000000",), "get_credentials_id_by_username": ("farmer",),
+    "get_public_key_by_username": ("farmer",), "get_username_by_public_key": ("0xfarmer",),
+    "get_identity": ("farmer",), "check_username": ("farmer",), "check_keys": ("0xfarmer", "0xfarmer_private"),
+    "get_activities_by_username": ("farmer",), "get_activities_to_be_processed_by_username": ("farmer",),
+    "get_activities_processed_by_username": ("farmer",), "get_co2Amount_by_activity": (1,),
+    "get_user_transactions": ("farmer",),
+    "get_user_stats": ("farmer",), "search_activities": ("solar",), "search_products": ("apple",),
+}
+
+def test_async_read_methods_never_write(db):
+    legacy_salt = bytes(16)
+    legacy_digest = hashlib.scrypt(b'Password123!', salt=legacy_salt, n=2, r=8, p=1, dklen=64)
+    db.register_creds('farmer', 'Password123!', '0xfarmer', '0xfarmer_private')
+    db.cur.execute("UPDATE Credentials SET password = ? WHERE username = 'farmer'",
+                   (f"{legacy_digest.hex()}${legacy_salt.hex()}",))
+    db.register_cron_activity('Solar panels', 'farmer', 0, 1, 1.0)
+    db.insert_transaction('certifier', 'farmer', 10, 'MINT', '0x01')
+    db.conn.commit()
+    controller = Controller(Session())
+    writes = []
+
+    def authorizer(action, table, *_):
+        if action in (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE):
+            writes.append((name, table))
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    db.conn.execute("PRAGMA query_only = ON")
+    db.conn.set_authorizer(authorizer)
+    try:
+        for name in READ_METHODS:
+            getattr(controller, name)(*READ_CALLS.get(name, ()))
+        assert writes == []
+        # the guard catches a method that writes: a login with an outdated hash stores it again
+        name = "check_credentials"
+        with pytest.raises(sqlite3.DatabaseError):
+            controller.check_credentials('farmer', 'Password123!')
+        assert writes == [("check_credentials", "Credentials")]
+    finally:
+        db.conn.set_authorizer(None)
+        db.conn.execute("PRAGMA query_only = OFF")
+        controller.db_ops.close()
+
+def test_password_hashes_keep_their_kdf_parameters_and_upgrade_on_login(db):
+    legacy_salt = bytes(16)
+    legacy_digest = hashlib.scrypt(b'Password123!', salt=legacy_salt, n=2, r=8, p=1, dklen=64)
+    db.register_creds('farmer', 'Password123!', '0xfarmer', '0xfarmer_private')
+    db.cur.execute("UPDATE Credentials SET password = ? WHERE username = 'farmer'",
+                   (f"{legacy_digest.hex()}${legacy_salt.hex()}",))
+    db.conn.commit()
+
+    assert not db.check_credentials('farmer', 'wrong')
+    assert db.check_credentials('farmer', 'Password123!')
+    stored = db.cur.execute("SELECT password FROM Credentials WHERE username = 'farmer'").fetchone()[0]
+    assert password_kdf.parse_hash(stored)[0] == password_kdf.current_params()
+    assert db.check_credentials('farmer', 'Password123!')
+
+    small = password_kdf.KdfParams(1024, 8, 1)
+    hashes = password_kdf.hash_many(['a', 'b'], small)
+    assert password_kdf.verify_many([('a', hashes[0]), ('a', hashes[1])]) == [True, False]
+    assert password_kdf.needs_rehash(hashes[0]) and not password_kdf.needs_rehash(hashes[0], small)
+
+def test_user_stats_follow_writes_and_rebuild_from_scratch(db):
+    db.insert_transactions_many([('certifier', 'farmer', 30, 'MINT', '0x01'),
+                                 ('certifier', 'farmer', '5', 'BURN', '0x02'),
+                                 ('seller', 'farmer', 7, 'TRANSFER', '0x03')])
+    db.register_cron_activities_many([('Solar panels', 'farmer', 0, 1, 10.5), ('Wind', 'farmer', 0, 2, 4.0)])
+    db.update_activity_state(1, 1)
+    db.cur.execute("UPDATE Transactions SET amount = 10 WHERE tx_hash = '0x03'")
+    db.conn.commit()
+
+    farmer = db.get_user_stats('farmer')
+    assert (farmer.get_minted(), farmer.get_burned(), farmer.get_transferred_in()) == (30, 5, 10)
+    assert (farmer.get_pending_activities(), farmer.get_processed_activities(), farmer.get_pending_co2()) == (1, 1, 4.0)
+    assert farmer.get_credit_balance() == 35
+    assert db.get_user_stats('seller').get_transferred_out() == 10
+    assert db.get_user_stats('nobody').get_minted() == 0
+    assert user_stats.verify(db.conn) == []
+
+    db.cur.execute("UPDATE user_stats SET minted = 0 WHERE username = 'farmer'")
+    assert user_stats.verify(db.conn) == [('farmer', 'minted', 30, 0)]
+    user_stats.rebuild(db.conn)
+    assert user_stats.verify(db.conn) == []
+
+def test_user_stats_migration_backfills_existing_rows(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "v2.sqlite"))
+    db_migrations.migrate(conn, target=2)
+    conn.execute("INSERT INTO Transactions (username_from, username_to, amount, type) VALUES ('certifier', 'farmer', 12, 'MINT')")
+    conn.commit()
+
+    assert db_migrations.migrate(conn, target=3) == [3]
+    assert conn.execute("SELECT minted FROM user_stats WHERE username = 'farmer'").fetchone() == (12,)
+    conn.close()
+
+def test_products_are_unique_and_upserted_by_nft_id(db):
+    assert db.upsert_product('Apple', 'FRUIT', 10, 7) == 0
+    assert db.upsert_product('Apple', 'FRUIT', 14, 7) == 0
+    assert db.insert_product('Pear', 'FRUIT', 3, 7) == -1
+    inserted, failures = db.upsert_products_many([('Beef', 'MEAT', 50, 8), ('Apple', 'FRUIT', 16, 7), ('Fish', 'FISH', 1, 9)])
+
+    assert (inserted, [index for index, _ in failures]) == (2, [2])
+    assert db.cur.execute("SELECT nftID, co2Emission FROM Products ORDER BY nftID").fetchall() == [(7, 16), (8, 50)]
+
+    controller = Controller(Session())
+    # creating a product is a plain insert, only upsert_product overwrites
+    assert controller.create_product('Pear', 'FRUIT', 3, 8) == -1
+    assert controller.upsert_product('Pear', 'FRUIT', 3, 8) == 0
+    assert db.cur.execute("SELECT name FROM Products WHERE nftID = 8").fetchone() == ('Pear',)
+
+def test_unique_nft_migration_refuses_duplicates_until_they_are_resolved(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "v3.sqlite"))
+    db_migrations.migrate(conn, target=3)
+    conn.executemany("INSERT INTO Products (name, category, co2Emission, nftID) VALUES (?, ?, ?, ?)",
+                     [('Apple', 'FRUIT', 10, 1), ('Apple', 'FRUIT', 12, 1), ('Beef', 'MEAT', 50, 2)])
+    conn.commit()
+
+    with pytest.raises(db_migrations.MigrationError, match="nftID 1: Products ids 1, 2"):
+        db_migrations.migrate(conn, target=4)
+    assert db_migrations.current_version(conn) == 3
+    assert conn.execute("SELECT COUNT(*) FROM Products").fetchone() == (3,)
+
+    assert db_migrations.remove_duplicate_products(conn) == [(1, 'Apple', 'FRUIT', 10, 1)]
+    db_migrations.migrate(conn, target=4)
+    assert conn.execute("SELECT nftID, co2Emission FROM Products ORDER BY nftID").fetchall() == [(1, 12), (2, 50)]
+    assert "idx_Products_nftID_unique" not in db_migrations.missing_indexes(conn)
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_Products_nftID'").fetchone() is None
+    conn.close()
+
+def test_archive_moves_old_rows_and_history_reads_them_by_date_range(db, tmp_path):
+    db.insert_transactions_many([('certifier', 'farmer', 10, 'MINT', '0x01'), ('certifier', 'farmer', 20, 'MINT', '0x02'),
+                                 ('certifier', 'farmer', 30, 'MINT', '0x03')])
+    db.register_cron_activities_many([('Solar panels', 'farmer', 0, 1, 1.0), ('Wind', 'farmer', 0, 2, 2.0)])
+    db.update_activity_state(1, 1)
+    db.cur.execute("UPDATE Transactions SET timestamp = '2023-05-01 10:00:00' WHERE tx_hash = '0x01'")
+    db.cur.execute("UPDATE Transactions SET timestamp = '2024-05-01 10:00:00' WHERE tx_hash = '0x02'")
+    db.cur.execute("UPDATE Cron_Activities SET creation_datetime = '2023-06-01 10:00:00'")
+    db.conn.commit()
+
+    moved = archive.archive_rows(db.conn, "2025-01-01", directory=str(tmp_path / "archive"))
+    # the pending activity stays in the hot table whatever its age
+    assert moved == {"2023": (1, 1), "2024": (1, 0)}
+    assert archive.archive_rows(db.conn, "2025-01-01", directory=str(tmp_path / "archive")) == {}
+    assert db.cur.execute("SELECT COUNT(*) FROM Transactions").fetchone() == (1,)
+
+    assert [t.get_tx_hash() for t in db.get_user_transactions('farmer')] == ['0x03']
+    assert [t.get_tx_hash() for t in db.get_user_transactions('farmer', date_from='2024-01-01')] == ['0x03', '0x02']
+    assert [t.get_tx_hash() for t in db.get_user_transactions('farmer', '2000-01-01')] == ['0x03', '0x02', '0x01']
+    assert [t.get_tx_hash() for t in db.get_user_transactions('farmer', '2023-01-01', '2024-01-01')] == ['0x01']
+    assert [a.get_id() for a in db.query_activities(username='farmer')] == [2]
+    assert list(db.query_activities(username='farmer', date_from='2000-01-01', columns=['state'], key_by_id=True)) == [1, 2]
+    assert db.query_activities(username='farmer', states=(0,), date_from='2000-01-01', columns=['id']) \
+        == db.query_activities(username='farmer', states=(0,), columns=['id'])
+
+    # totals are kept, and still match the base rows once the archives are attached
+    assert db.get_user_stats('farmer').get_minted() == 60
+    schemas = archive.attach_archives(db.conn)
+    assert user_stats.verify(db.conn, schemas=["main", *schemas]) == []
+    archive.detach_archives(db.conn, schemas)
+
+def test_archives_are_found_from_any_directory_and_missing_ones_are_reported(db, tmp_path, monkeypatch):
+    db.register_cron_activities_many([('Solar panels', 'farmer', 0, 1, 1.5), ('Wind', 'farmer', 0, 2, 2.0)])
+    db.update_activity_state(1, 1)
+    db.cur.execute("UPDATE Cron_Activities SET creation_datetime = '2023-06-01 10:00:00'")
+    db.conn.commit()
+    # the archive directory and the stored paths are relative to the database, not to the working directory
+    monkeypatch.chdir(tmp_path.parent)
+    assert archive.archive_rows(db.conn, "2025-01-01", directory="archive") == {"2023": (0, 1)}
+    assert db.cur.execute("SELECT path FROM archive_periods").fetchall() == [(os.path.join("archive", "SupplyChain-2023.sqlite"),)]
+    monkeypatch.chdir(tmp_path / "archive")
+    assert list(db.query_activities(username='farmer', date_from='2000-01-01', key_by_id=True)) == [1, 2]
+    # an archived activity is read from its archive, and is not updated
+    assert db.get_co2Amount_by_activity(1) == 1.5
+    assert db.get_state_by_activity(1) == 1
+    assert db.update_activity_state(1, 2) == -1
+    assert db.update_activity_state(2, 1) == 0
+    assert db.get_co2Amount_by_activity(3) is None
+
+    os.remove(tmp_path / "archive" / "SupplyChain-2023.sqlite")
+    with pytest.raises(archive.MissingArchiveError, match="2023"):
+        db.query_activities(username='farmer', date_from='2000-01-01')
+    # reads of the main table only are not affected
+    assert [a.get_id() for a in db.query_activities(username='farmer')] == [2]
+
+def test_export_streams_filtered_rows_including_archives(db, manager, tmp_path):
+    db.insert_transactions_many([('certifier', 'farmer', 10, 'MINT', '0x01'), ('certifier', 'seller', 20, 'MINT', '0x02'),
+                                 ('farmer', 'seller', 5, 'TRANSFER', '0x03')])
+    db.cur.execute("UPDATE Transactions SET timestamp = '2023-05-01 10:00:00' WHERE tx_hash = '0x01'")
+    db.conn.commit()
+    archive.archive_rows(db.conn, "2024-01-01", directory=str(tmp_path / "archive"))
+
+    out = str(tmp_path / "farmer.csv")
+    assert export.export("transactions", "csv", out, manager.db_path, username='farmer', chunk_size=1) == 2
+    with open(out, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['id', 'username_from', 'username_to', 'amount', 'type', 'tx_hash', 'timestamp']
+    assert [row[5] for row in rows[1:]] == ['0x01', '0x03']
+
+    out = str(tmp_path / "recent.jsonl")
+    assert export.export("transactions", "jsonl", out, manager.db_path, date_from='2024-01-01') == 2
+    with open(out) as f:
+        assert [json.loads(line)["tx_hash"] for line in f] == ['0x02', '0x03']
+    with pytest.raises(ValueError):
+        export.export("products", "csv", out, manager.db_path, username='farmer')
+
+def test_export_npz_has_one_array_per_column(db, manager, tmp_path):
+    numpy = pytest.importorskip("numpy")
+    db.register_cron_activities_many([('Solar panels', 'farmer', 0, 1, 1.5), ('Wind', 'farmer', 0, 2, 2.0)])
+
+    out = str(tmp_path / "activities.npz")
+    assert export.export("activities", "npz", out, manager.db_path, chunk_size=1) == 2
+    arrays = numpy.load(out)
+    assert list(arrays["description"]) == ['Solar panels', 'Wind']
+    assert arrays["co2_reduction"].tolist() == [1.5, 2.0]
+
+def test_export_npz_keeps_fractional_emissions(db, manager, tmp_path):
+    numpy = pytest.importorskip("numpy")
+    assert db.insert_product('Apple', 'FRUIT', 0.25, 1) == 0
+
+    out = str(tmp_path / "products.npz")
+    assert export.export("products", "npz", out, manager.db_path) == 1
+    assert numpy.load(out)["co2Emission"].tolist() == [0.25]
+
+def test_full_text_search_follows_writes_and_ranks_matches(db):
+    db.cur.execute("INSERT INTO Activities (id, type, description) VALUES (7, 'performing an action', 'Reforestation of hills')")
+    db.conn.commit()
+    db.register_cron_activities_many([('Solar panels on the barn roof', 'farmer', 0, 1, 1.0),
+                                      ('Planted oak trees', 'farmer', 0, 7, 2.0),
+                                      ('Solar water heater', 'seller', 0, 1, 3.0)])
+    db.cur.execute("UPDATE Cron_Activities SET state = 1 WHERE id = 3")
+
+    # bm25: the same word in a shorter description ranks first
+    assert [a.get_id() for a in db.search_activities('sola*')] == [3, 1]
+    assert [a.get_id() for a in db.search_activities('panel')] == [1]
+    assert [a.get_id() for a in db.search_activities('solar', state=1)] == [3]
+    assert [a.get_id() for a in db.search_activities('reforest')] == [2]
+    assert db.search_activities('"') == []
+
+    db.cur.execute("UPDATE Cron_Activities SET description = 'Wind turbine' WHERE id = 1")
+    db.conn.commit()
+    assert [a.get_id() for a in db.search_activities('solar')] == [3]
+
+    db.upsert_products_many([('Organic apple', 'FRUIT', 10, 1), ('Apple juice', 'FRUIT', 12, 2), ('Beef', 'MEAT', 50, 3)])
+    db.upsert_product('Green apple', 'FRUIT', 11, 1)
+    assert sorted(row['nftID'] for row in db.search_products('apple')) == [1, 2]
+    assert [row['name'] for row in db.search_products('organic')] == []
+    assert db.search_products('beef', category='FRUIT') == []
+
+def test_search_state_filter_applies_before_the_search_window(db, monkeypatch):
+    monkeypatch.setitem(config.config, "search_window", 5)
+    db.cur.execute("INSERT INTO Activities (id, type, description) VALUES (7, 'performing an action', 'Solar farm')")
+    db.conn.commit()
+    db.register_cron_activities_many([(f'Solar roof {i}', 'farmer', 0, 1, 1.0) for i in range(2)]
+                                      + [(f'Solar farm shift {i}', 'farmer', 0, 7, 1.0) for i in range(2)]
+                                      + [(f'Solar roof {i}', 'farmer', 1, 1, 1.0) for i in range(10)]
+                                      + [(f'Solar farm shift {i}', 'farmer', 1, 7, 1.0) for i in range(10)])
+
+    # the 5 most recent matches of both windows are processed, the pending ones are older
+    assert sorted(a.get_id() for a in db.search_activities('solar', state=0, limit=50)) == [1, 2, 3, 4]
+    assert sorted(a.get_id() for a in db.search_activities('solar', state=1, limit=50)) == [20, 21, 22, 23, 24]
+
+def test_reporting_snapshot_is_read_only_and_isolated_from_writes(db):
+    db.insert_transactions_many([('certifier', 'farmer', 10, 'MINT', '0x01')])
+    reports = ReportingOperations()
+
+    with reports.snapshot():
+        assert len(reports.get_user_transactions('farmer')) == 1
+        db.insert_transaction('certifier', 'farmer', 20, 'MINT', '0x02')
+        # the writer is not blocked, and the report keeps reading its snapshot
+        assert len(reports.get_user_transactions('farmer')) == 1
+        with reports.snapshot():
+            assert reports.get_user_stats('farmer').get_minted() == 10
+    assert len(reports.get_user_transactions('farmer')) == 2
+
+    assert reports.conn.execute("PRAGMA query_only").fetchone() == (1,)
+    with pytest.raises(sqlite3.OperationalError):
+        reports.insert_transaction('certifier', 'farmer', 5, 'MINT', '0x03')
+    reports.close()
+
+def test_online_backup_is_a_snapshot_and_restore_validates_it(db, manager, tmp_path):
+    db.insert_transactions_many([('certifier', f'user_{i}', i, 'MINT', f'0x{i}') for i in range(2000)])
+    steps = []
+
+    def write_between_steps(copied, total):
+        # another connection commits while the backup is running, the backup neither restarts nor sees it
+        steps.append(copied)
+        db.insert_transaction('certifier', 'farmer', 1, 'MINT', f'0xlate{len(steps)}')
+
+    out = backup.backup(str(tmp_path / "b.sqlite.gz"), manager.db_path, pages=5, sleep=0, progress=write_between_steps)
+    assert len(steps) > 1 and steps[-1] > steps[0]
+
+    restored = str(tmp_path / "restored.sqlite")
+    assert backup.restore(out, restored) == db_migrations.latest_version()
+    conn = sqlite3.connect(restored)
+    assert conn.execute("SELECT COUNT(*) FROM Transactions").fetchone() == (2000,)
+    conn.close()
+
+    broken = tmp_path / "broken.sqlite"
+    broken.write_bytes(b"not a database" * 100)
+    with pytest.raises(backup.BackupError):
+        backup.restore(str(broken), restored)
+    conn = sqlite3.connect(restored)
+    assert conn.execute("SELECT COUNT(*) FROM Transactions").fetchone() == (2000,)
+    conn.close()
+
+def test_tracing_times_statements_and_logs_slow_queries_with_their_plan(tmp_path):
+    tracer = tracing.enable(slow_ms=0, keep=5, slow_log=str(tmp_path / "slow.log"))
+    connection_manager.init_manager(str(tmp_path / "traced.sqlite"))
+    try:
+        ops = DatabaseOperations()
+        assert isinstance(ops.conn, connection_manager.TracedPooledConnection)
+        tracer.reset()
+        ops.insert_transactions_many([('certifier', f'user_{i % 3}', i, 'MINT', f'0x{i}') for i in range(30)])
+        for _ in range(2):
+            assert len(ops.get_user_transactions('user_1')) == 10
+        ops.close()
+
+        select, = tracer.statistics(contains="FROM Transactions WHERE (username_from")
+        assert (select.calls, select.rows) == (2, 20) and select.max_ms <= select.total_ms
+        insert, = tracer.statistics(contains="INSERT INTO Transactions")
+        # the implicit BEGIN and the user_stats triggers run with the insert
+        assert insert.statements > 1
+        assert tracer.statistics(order_by="calls")[0].calls >= 2
+
+        slow = tracer.slow_queries()
+        assert len(slow) == 5 and any("SEARCH Transactions" in line for query in slow for line in query.plan)
+        logged = (tmp_path / "slow.log").read_text()
+        assert "plan:" in logged and "0x1" not in logged
+
+        tracer.reset()
+        assert tracer.statistics() == [] and tracer.slow_queries() == []
+    finally:
+        tracing.disable()
+        connection_manager.close_manager()
+    connection_manager.init_manager(str(tmp_path / "plain.sqlite"))
+    assert type(DatabaseOperations().conn) is connection_manager.PooledConnection
+    connection_manager.close_manager()
+
+def test_benchmark_harness_covers_every_public_method():
+    from benchmarks import bench_operations
+    assert bench_operations.unregistered_methods() == []
+
+def test_workload_is_reproducible_and_covers_every_role(tmp_path):
+    end = datetime.datetime(2025, 6, 30, 12, 0, 0)
+    dumps = []
+    for name in ("first.sqlite", "second.sqlite"):
+        connection_manager.init_manager(str(tmp_path / name))
+        ops = DatabaseOperations()
+        try:
+            counts = workload.generate(ops, 2000, seed=7, days=365, end=end)
+            # update_datetime is set by the triggers to the time of the run
+            dumps.append([ops.conn.execute(f"SELECT {columns} FROM {table} ORDER BY id").fetchall() for table, columns in (
+                ("Accounts", "*"),
+                ("Cron_Activities", "id, description, username, creation_datetime, state, activity_id, co2_reduction"),
+                ("Products", "id, name, category, co2Emission, nftID, harvestDate"),
+                ("Transactions", "*"))])
+            roles = {row[0] for row in ops.conn.execute("SELECT DISTINCT type FROM Accounts")}
+            # every record has its own activity, as when registered from the CLI
+            unlinked = ops.conn.execute("""SELECT COUNT(*) FROM Cron_Activities c
+                                           JOIN Activities a ON a.id = c.activity_id
+                                           LEFT JOIN Accounts_Activities l ON l.activity_id = c.activity_id
+                                                                          AND l.username = c.username
+                                           WHERE l.username IS NULL OR c.description != a.description""").fetchone()[0]
+            dates = ops.conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM Transactions").fetchone()
+            with pytest.raises(ValueError):
+                workload.generate(ops, 10)
+        finally:
+            ops.close()
+            connection_manager.close_manager()
+
+    size = workload.sizes(2000)
+    assert counts["Transactions"] == size.transactions and counts["Cron_Activities"] == counts["Activities"] == size.activities
+    assert counts["Products"] == size.products and counts["Accounts"] == counts["Credentials"] == size.accounts
+    assert roles == set(workload.ROLES) and unlinked == 0
+    assert dates == ("2024-06-30 12:00:00", "2025-06-30 12:00:00")
+    assert dumps[0] == dumps[1]